@@ -0,0 +1,107 @@
+import asyncio
+import struct
+import uuid
+from protocols.protocols import Formats, Words
+from .message_format import MessageFormat
+from .message_format_passer import (PasserBase, Reassembly, PREFIX_SIZE, FLAG_COMPRESSED, FLAG_MORE,
+                                    DEFAULT_COMPRESSION_THRESHOLD, DEFAULT_COMPRESSION_LEVEL,
+                                    DEFAULT_MAX_MESSAGE_SIZE)
+
+
+class AsyncMessageFormatPasser(PasserBase):
+    """asyncio counterpart of MessageFormatPasser on a StreamReader/StreamWriter pair.
+
+    Same wire format and handshake negotiation (see PasserBase), so either side
+    of a connection may be sync or async. Writes go straight into the
+    transport buffer; send_args only awaits drain(), which is where a slow
+    peer pushes back. Receives are serialized by an asyncio.Lock.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 trusted: bool = False,
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE) -> None:
+        super().__init__(trusted, compression_threshold, compression_level, max_message_size)
+        self.reader = reader
+        self.writer = writer
+        self.receive_lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 21354, **kwargs) -> "AsyncMessageFormatPasser":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, **kwargs)
+
+    async def send_args(self, msgfmt: MessageFormat, *args) -> None:
+        await self.send_raw(self.encode_args(msgfmt, *args))
+
+    async def send_raw(self, data: bytes) -> None:
+        # writelines does not yield, so the fragments of one message stay together
+        self.writer.writelines(self._frame_buffers(data))
+        await self.writer.drain()
+
+    async def send_many(self, frames) -> None:
+        buffers = []
+        for data in frames:
+            buffers.extend(self._frame_buffers(data))
+        if buffers:
+            self.writer.writelines(buffers)
+            await self.writer.drain()
+
+    async def receive_args(self, msgfmt: MessageFormat, timeout: float | None = None) -> list:
+        """timeout raises TimeoutError; if it fires mid-frame the stream is out of
+        sync afterwards, so treat it as fatal (it is meant for handshakes)."""
+        async with self.receive_lock:
+            return self.decode_args(msgfmt, await self._receive_frame_within(timeout))
+
+    async def receive_raw(self, timeout: float | None = None) -> bytes:
+        async with self.receive_lock:
+            return bytes(await self._receive_frame_within(timeout))
+
+    async def _receive_frame_within(self, timeout: float | None) -> bytes:
+        if timeout is None:
+            return await self._receive_frame()
+        return await asyncio.wait_for(self._receive_frame(), timeout)
+
+    async def handshake(self, role: str, timeout: float | None = None) -> dict:
+        """Client side of HANDSHAKE, the async version of ClientBase.handshake.
+        Returns the response data; raises if the peer did not answer SUCCESS."""
+        data = {Words.DataKeys.Handshake.ROLE: role}
+        data.update(self.handshake_offer())
+        await self.send_args(Formats.MESSAGE, str(uuid.uuid4()), Words.MessageType.HANDSHAKE, data)
+        _, message_type, response = await self.receive_args(Formats.MESSAGE, timeout)
+        if message_type != Words.MessageType.RESPONSE:
+            raise Exception(f"received message_type {message_type}, expected {Words.MessageType.RESPONSE}")
+        if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+            raise Exception(f"handshake failed: {response.get(Words.DataKeys.PARAMS)}")
+        self.apply_negotiated(response.get(Words.DataKeys.PARAMS))
+        return response
+
+    async def _receive_frame(self) -> bytes:
+        header, body = await self._receive_physical_frame()
+        if header & FLAG_MORE:
+            reassembly = Reassembly(self, header)
+            try:
+                while not reassembly.feed(header, body):
+                    header, body = await self._receive_physical_frame()
+                return reassembly.finish()
+            finally:
+                self.stats.set_reassembly_bytes(0)
+        if header & FLAG_COMPRESSED:
+            return self._decompress(body)
+        return body
+
+    async def _receive_physical_frame(self) -> tuple[int, bytes]:
+        try:
+            prefix = await self.reader.readexactly(PREFIX_SIZE)
+            header = struct.unpack('!I', prefix)[0]
+            body = await self.reader.readexactly(self._check_length(header))
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Connection closed") from None
+        return header, body
+
+    async def close(self) -> None:
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except Exception:
+            pass
@@ -0,0 +1,208 @@
+from __future__ import annotations
+import asyncio
+import inspect
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+from base.async_message_format_passer import AsyncMessageFormatPasser
+from base.peer_worker import WindowFullError, DEFAULT_MAX_IN_FLIGHT
+from protocols.protocols import Formats, Words
+
+
+class AsyncPeerWorker:
+    """
+    asyncio counterpart of PeerWorker:
+    - owns an AsyncMessageFormatPasser
+    - keeps requests awaiting a response in pending_messages {id: Future}
+    - runs a recv task and an optional heartbeat task, no threads
+    - at most max_in_flight requests outstanding, plus a reserved heartbeat slot, like PeerWorker
+    - on_recv_message / on_connection_lost may be plain functions or coroutines
+
+    Requests are written directly by pend_request; the transport buffers them
+    and drain() applies backpressure, so no separate send task is needed.
+    """
+    def __init__(
+        self,
+        passer: AsyncMessageFormatPasser,
+        heartbeat_interval: float,
+        heartbeat_patience: int,
+        on_recv_message: Optional[Callable[[Tuple[str, str, dict]], Any]] = None,
+        on_connection_lost: Optional[Callable[[], Any]] = None,
+        make_heartbeat: Optional[Callable[[], Tuple[str, dict]]] = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    ) -> None:
+        self.passer = passer
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_patience = heartbeat_patience
+        self.on_recv_message = on_recv_message
+        self.on_connection_lost = on_connection_lost
+        self.make_heartbeat = make_heartbeat
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be positive")
+        self.max_in_flight = max_in_flight
+
+        self.stopped = False
+        self.conn_loss_event = asyncio.Event()
+
+        self.pending_messages: Dict[str, asyncio.Future] = {}
+        # notified whenever a window slot frees up or the connection goes away
+        self.window_cond = asyncio.Condition()
+
+        self.recv_task: Optional[asyncio.Task] = None
+        self.hb_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.stopped = False
+        self.conn_loss_event.clear()
+        self.recv_task = asyncio.create_task(self._recv_loop())
+        if self.make_heartbeat:
+            self.hb_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self) -> None:
+        self.stopped = True
+        await self._set_connection_lost(notify=False)
+        await self.passer.close()
+        for task in (self.recv_task, self.hb_task):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending_messages)
+
+    async def pend_request(self, message_type: str, data: dict, window_timeout: Optional[float] = None,
+                           reserved: bool = False) -> str:
+        """Send a request once the in-flight window has room. window_timeout=None
+        waits as long as it takes, 0 fails fast; WindowFullError when it runs out.
+        reserved (heartbeats only, one at a time) may take the slot beyond max_in_flight."""
+        limit = self.max_in_flight + 1 if reserved else self.max_in_flight
+        window_open = lambda: len(self.pending_messages) < limit or self.conn_loss_event.is_set()
+        async with self.window_cond:
+            if window_timeout == 0:
+                has_room = window_open()
+            else:
+                try:
+                    has_room = await asyncio.wait_for(self.window_cond.wait_for(window_open), window_timeout)
+                except TimeoutError:
+                    has_room = False
+            self._raise_if_lost()
+            if not has_room:
+                raise WindowFullError(f"{self.max_in_flight} requests already in flight")
+            message_id = str(uuid.uuid4())
+            self.pending_messages[message_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.passer.send_args(Formats.MESSAGE, message_id, message_type, data)
+        except Exception:
+            await self._release(message_id)
+            await self._set_connection_lost()
+            raise ConnectionResetError("connection lost") from None
+        return message_id
+
+    async def wait_response(self, message_id: str, timeout: Optional[float] = None) -> dict:
+        future = self.pending_messages.get(message_id)
+        if future is None:
+            raise KeyError(f"unknown message_id {message_id}")
+        try:
+            # shield: a timeout must not cancel the future the recv task resolves
+            _, data = await asyncio.wait_for(asyncio.shield(future), timeout)
+            return data # {responding_id: ..., result: ..., params: ...}
+        except asyncio.TimeoutError:
+            raise TimeoutError("timeout expired") from None
+        finally:
+            await self._release(message_id)
+
+    async def pend_and_wait(self, message_type: str, data: dict, timeout: Optional[float] = None,
+                            reserved: bool = False) -> dict:
+        """timeout covers both waiting for a window slot and waiting for the response."""
+        if timeout is None:
+            return await self.wait_response(await self.pend_request(message_type, data, None, reserved), None)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        message_id = await self.pend_request(message_type, data, timeout, reserved)
+        return await self.wait_response(message_id, max(0.0, deadline - loop.time()))
+
+    def _raise_if_lost(self) -> None:
+        if self.conn_loss_event.is_set():
+            if self.stopped:
+                raise Exception("worker stopped")
+            raise ConnectionResetError("connection lost")
+
+    async def _release(self, message_id: str) -> None:
+        async with self.window_cond:
+            if self.pending_messages.pop(message_id, None) is not None:
+                self.window_cond.notify()
+
+    async def _set_connection_lost(self, notify: bool = True) -> None:
+        if self.conn_loss_event.is_set():
+            return
+        self.conn_loss_event.set()
+        error = Exception("worker stopped") if self.stopped else ConnectionResetError("connection lost")
+        for future in self.pending_messages.values():
+            if not future.done():
+                future.set_exception(error)
+                future.exception()  # mark retrieved, nobody may be waiting on it
+        async with self.window_cond:
+            self.window_cond.notify_all()
+        if notify and self.on_connection_lost:
+            await _call(self.on_connection_lost)
+
+    async def _recv_loop(self) -> None:
+        while not self.conn_loss_event.is_set():
+            try:
+                msg_id, msg_type, data = await self.passer.receive_args(Formats.MESSAGE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not isinstance(e, ConnectionError):
+                    print(f"[AsyncPeerWorker] recv loop exception: {e}")
+                await self._set_connection_lost()
+                break
+            # Route responses to pending; others to callback
+            if msg_type == Words.MessageType.RESPONSE:
+                future = self.pending_messages.get(data.get(Words.DataKeys.Response.RESPONDING_ID))
+                if future is not None and not future.done():
+                    future.set_result((msg_type, data))
+                elif future is None:
+                    print(f"[AsyncPeerWorker] received response with unknown responding_id: {data}")
+            elif self.on_recv_message:
+                try:
+                    await _call(self.on_recv_message, (msg_id, msg_type, data))
+                except Exception as e:
+                    print(f"[AsyncPeerWorker] on_recv_message error: {e}")
+            else:
+                print(f"[AsyncPeerWorker] Received non-response message: {(msg_id, msg_type, data)}")
+
+    async def _heartbeat_loop(self) -> None:
+        assert self.make_heartbeat is not None
+        fail_count = 0
+        while not self.conn_loss_event.is_set():
+            try:
+                await asyncio.wait_for(self.conn_loss_event.wait(), self.heartbeat_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            try:
+                hb_type, hb_data = self.make_heartbeat()
+                hb_resp = await self.pend_and_wait(hb_type, hb_data, self.heartbeat_interval / 2, reserved=True)
+                if hb_resp.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                    fail_count += 1
+                else:
+                    fail_count = 0
+            except WindowFullError:
+                # a full window is backpressure, not a sign the peer is gone
+                continue
+            except Exception as e:
+                print(f"[AsyncPeerWorker] heartbeat failed: {e}")
+                fail_count += 1
+            if fail_count >= self.heartbeat_patience:
+                await self._set_connection_lost()
+
+
+async def _call(callback: Callable[..., Any], *args) -> None:
+    """Run a callback that may be a plain function or a coroutine function."""
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        await result
@@ -1,11 +1,21 @@
 from pathlib import Path
+from typing import Optional
 from protocols.protocols import Words
 import hashlib
 
 class FileChecker:
-    def __init__(self, file_path: Path, metadata_dict: dict):
+    """Checks a received file against the size and sha256 in its metadata.
+
+    received_sha256 / received_size are what FileReceiver(compute_sha256=True)
+    measured while the file arrived; when given and the file on disk still
+    has that size, the digest is compared without reading the file again.
+    """
+    def __init__(self, file_path: Path, metadata_dict: dict,
+                 received_sha256: Optional[str] = None, received_size: Optional[int] = None):
         self.file_path = file_path
         self.metadata_dict = metadata_dict
+        self.received_sha256 = received_sha256
+        self.received_size = received_size
 
     def check(self) -> tuple[bool, dict]:
         # game_id = str(self.metadata_dict.get(Words.ParamKeys.Metadata.GAME_ID))
@@ -34,6 +44,10 @@ class FileChecker:
             # })
             # continue
         # verify sha256
+        if self.received_sha256 is not None and self.received_size == actual_size:
+            if self.received_sha256 != sha256:
+                return (False, {Words.ParamKeys.Failure.REASON: "Checksum mismatch"})
+            return (True, {})
         try:
             h = hashlib.sha256()
             with open(self.file_path, "rb") as rf:
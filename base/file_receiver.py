@@ -1,14 +1,62 @@
 import socket
+import glob
 from pathlib import Path
 import struct
 import json
 import os
-import time
+import zlib
+import hashlib
+import threading
+import uuid
+from typing import TYPE_CHECKING, Optional
+from base.transfer_framing import FRAMING_V2, FRAMING_V3, MAGIC, CHUNK, CHUNK_CRC, RESUME, OFFSET, FLAG_CRC
+
+if TYPE_CHECKING:
+    from base.file_relay import FileRelay
+
+RECV_BUFFER_SIZE = 1024 * 1024
+
+# .part files a receiver is writing right now; a second transfer of the same
+# file (two downloads into one cache path) must not resume into one of them
+_active_parts: set[Path] = set()
+_active_parts_lock = threading.Lock()
 
 class FileReceiver:
-    def __init__(self, sock: socket.socket, path: Path):
+    """Receives one file into self.path (through a .part file).
+
+    With compute_sha256 the payload is hashed as it arrives; after a
+    successful receive(), sha256 holds its hex digest and received_size the
+    byte count, so callers can verify the file without reading it back.
+
+    A FRAMING_V3 transfer that breaks off keeps its .part file (named after
+    the file's sha256) up to the last complete chunk, the committed offset.
+    The next V3 transfer of the same file to self.path resumes from there,
+    resumed_from says how far, and the whole file's sha256 is checked
+    against the sender's before it replaces self.path. While one receiver
+    writes that .part, another transfer of the same file starts from zero
+    in a private one.
+
+    With a relay, every piece is reported to it once it is written, so
+    FileRelay.send can forward the file while it is still arriving.
+    """
+    def __init__(self, sock: socket.socket, path: Path, compute_sha256: bool = False,
+                 relay: Optional["FileRelay"] = None):
         self.sock = sock
         self.path = path
+        self.compute_sha256 = compute_sha256
+        self.relay = relay
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._check_crc = False
+        self._hasher = None
+        self.received_size = 0
+        self.resumed_from = 0
+        self.sha256: Optional[str] = None
+        self._part_path = self.path
+        self._claimed_part = False
+        self._keep_part = False  # on failure, keep the .part up to _committed for a resume
+        self._committed = 0
+        self._expected_sha256: Optional[str] = None
+        self._expected_size: Optional[int] = None
 
     def _recvn(self, n: int) -> bytes:
         buf = b""
@@ -18,55 +66,185 @@ class FileReceiver:
                 raise ConnectionError("socket closed during _recvn")
             buf += part
         return buf
+
+    def _recv_payload(self, outf, size: int) -> int:
+        """Copy `size` payload bytes from the socket to outf through a fixed
+        buffer, so a frame as big as the whole file (FileSender's zero-copy
+        mode) is never held in memory. Returns the crc32 of the payload."""
+        view = memoryview(self._buffer)
+        remaining = size
+        crc = 0
+        while remaining:
+            n = self.sock.recv_into(view, min(remaining, len(view)))
+            if not n:
+                raise ConnectionError("socket closed during payload")
+            outf.write(view[:n])
+            self.received_size += n
+            if self.relay is not None:
+                outf.flush()
+                self.relay.advanced(self.received_size)
+            if self._hasher is not None:
+                self._hasher.update(view[:n])
+            if self._check_crc:
+                crc = zlib.crc32(view[:n], crc)
+            remaining -= n
+        return crc
     
     def receive(self) -> bool:
-        """Receive length-prefixed header + optional chunk loop and write to self.path.
+        """Receive a file in any framing of base.transfer_framing and write it to self.path.
         Returns True on success, False on error.
-        Protocol: 4-byte big-endian header_len, header=json({"seq":..., "size":...}),
-                  then `size` bytes of payload. size==0 => terminator.
+        FRAMING_V1: 4-byte big-endian header_len, header=json({"seq":..., "size":...}),
+                    then `size` bytes of payload. size==0 => terminator.
+        FRAMING_V2 / FRAMING_V3: told apart by MAGIC in the first bytes, see transfer_framing.
         """
-        temp_path = self.path.with_suffix(self.path.suffix + ".part")
+        self._part_path = self.path.with_suffix(self.path.suffix + ".part")
+        self._keep_part = False
+        self._committed = 0
+        self._expected_sha256 = None
+        self._expected_size = None
+        self.received_size = 0
+        self.resumed_from = 0
+        self.sha256 = None
+        self._hasher = hashlib.sha256() if self.compute_sha256 else None
         try:
             # ensure parent exists
             os.makedirs(self.path.parent, exist_ok=True)
-            with temp_path.open("wb") as outf:
-                while True:
-                    # read 4-byte header length
-                    hdr_len_raw = self._recvn(4)
-                    hdr_len = struct.unpack("!I", hdr_len_raw)[0]
-                    # read header
-                    hdr_raw = self._recvn(hdr_len)
-                    hdr = json.loads(hdr_raw.decode("utf-8"))
-                    print(f"received hdr: {hdr}")
-                    size = int(hdr.get("size", 0))
-                    # if there's payload, read and write it
-                    if size > 0:
-                        chunk = self._recvn(size)
-                        outf.write(chunk)
-                    else:
-                        # terminator frame (size == 0)
-                        break
+            first = self._recvn(4)
+            framed = first[:len(MAGIC)] == MAGIC
+            outf = self._start_v2(first[len(MAGIC)]) if framed else self._part_path.open("wb")
+            if self.relay is not None:
+                self.relay.opened(self._part_path, self.received_size, self._expected_size, self._expected_sha256)
+            with outf:
+                if framed:
+                    self._receive_v2(outf)
+                else:
+                    self._receive_v1(outf, first)
                 # ensure data hit disk before renaming
                 try:
                     outf.flush()
                     os.fsync(outf.fileno())
                 except Exception:
                     pass
+            if self._hasher is not None:
+                self.sha256 = self._hasher.hexdigest()
+            if self._expected_sha256 is not None and self.sha256 != self._expected_sha256:
+                self._keep_part = False
+                raise ValueError("sha256 of the received file does not match the sender's")
+            if self.relay is not None:
+                self.relay.moving()
             # atomic move to final path
             try:
-                temp_path.replace(self.path)
+                self._part_path.replace(self.path)
             except Exception:
                 # fallback to rename
-                temp_path.rename(self.path)
+                self._part_path.rename(self.path)
+            if self.relay is not None:
+                self.relay.finished(True, self.path)
             return True
         except Exception as e:
             print(f"Exception in FileReceiver.receive: {e}")
             try:
-                if temp_path.exists():
-                    temp_path.unlink()
+                if self._keep_part:
+                    os.truncate(self._part_path, self._committed)
+                elif self._part_path.exists():
+                    self._part_path.unlink()
             except Exception:
                 pass
+            if self.relay is not None:
+                self.relay.finished(False)
             return False
+        finally:
+            if self._claimed_part:
+                with _active_parts_lock:
+                    _active_parts.discard(self._part_path)
+                self._claimed_part = False
+
+    def _receive_v1(self, outf, hdr_len_raw: bytes) -> None:
+        self._check_crc = False
+        while True:
+            # read 4-byte header length
+            hdr_len = struct.unpack("!I", hdr_len_raw)[0]
+            # read header
+            hdr_raw = self._recvn(hdr_len)
+            hdr = json.loads(hdr_raw.decode("utf-8"))
+            size = int(hdr.get("size", 0))
+            # if there's payload, read and write it
+            if size > 0:
+                self._recv_payload(outf, size)
+            else:
+                # terminator frame (size == 0)
+                break
+            hdr_len_raw = self._recvn(4)
+
+    def _start_v2(self, version: int):
+        """Read the rest of the preamble and open the file to write to."""
+        if version not in (FRAMING_V2, FRAMING_V3):
+            raise ValueError(f"unsupported transfer framing version {version}")
+        flags = self._recvn(1)[0]
+        if flags & ~FLAG_CRC:
+            raise ValueError(f"unknown transfer flags {flags:#x}")
+        self._check_crc = bool(flags & FLAG_CRC)
+        if version == FRAMING_V2:
+            return self._part_path.open("wb")
+        size, digest = RESUME.unpack(self._recvn(RESUME.size))
+        return self._resume(size, digest.hex())
+
+    def _resume(self, size: int, sha256: str):
+        """Open the .part file kept for this sha256 for appending, drop the
+        ones left by other files, and tell the sender where to start."""
+        part_path = self.path.with_name(f"{self.path.name}.{sha256[:16]}.part")
+        with _active_parts_lock:
+            resumable = part_path not in _active_parts
+            if not resumable:
+                part_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.part")
+            _active_parts.add(part_path)
+            self._part_path = part_path
+            self._claimed_part = True
+            stale_parts = [stale for stale in self.path.parent.glob(f"{glob.escape(self.path.name)}.*.part")
+                           if stale not in _active_parts]
+        for stale in stale_parts:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+        self._expected_sha256 = sha256
+        self._expected_size = size
+        self._hasher = hashlib.sha256()
+        offset = 0
+        if resumable:
+            try:
+                offset = self._part_path.stat().st_size
+            except FileNotFoundError:
+                pass
+        if offset > size:
+            offset = 0
+        outf = self._part_path.open("ab" if offset else "wb")
+        if offset:
+            # the kept bytes count towards the digest checked at the end
+            with self._part_path.open("rb") as kept:
+                for block in iter(lambda: kept.read(RECV_BUFFER_SIZE), b""):
+                    self._hasher.update(block)
+        self._keep_part = resumable
+        self.received_size = self.resumed_from = self._committed = offset
+        self.sock.sendall(OFFSET.pack(offset))
+        return outf
+
+    def _receive_v2(self, outf) -> None:
+        header = CHUNK_CRC if self._check_crc else CHUNK
+        expected_seq = 0
+        while True:
+            fields = header.unpack(self._recvn(header.size))
+            seq, size = fields[0], fields[1]
+            if seq != expected_seq:
+                raise ValueError(f"chunk {seq} out of order, expected {expected_seq}")
+            if size == 0:
+                break
+            crc = self._recv_payload(outf, size)
+            if self._check_crc and crc != fields[2]:
+                raise ValueError(f"chunk {seq} failed its CRC check")
+            outf.flush()
+            self._committed = self.received_size
+            expected_seq += 1
 
     # def receive(self) -> bool:
     #     """Receive length-prefixed header + optional chunk loop and write to self.path.
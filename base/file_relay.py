@@ -0,0 +1,148 @@
+import json
+import socket
+import struct
+import threading
+from pathlib import Path
+from typing import Optional
+from base.transfer_framing import (FRAMING_V1, FRAMING_V2, FRAMING_V3, MAGIC, PREAMBLE, CHUNK, RESUME, OFFSET,
+                                   DEFAULT_CHUNK_SIZE)
+
+DEFAULT_RELAY_IDLE_TIMEOUT = 30.0  # a follower gives up when the incoming file makes no progress this long
+
+
+class FileRelay:
+    """Tee between a FileReceiver writing a file and senders passing it on.
+
+    FileReceiver(relay=...) reports the file it writes and every piece it
+    appends; send() follows that file as it grows and forwards each piece as
+    soon as it is on disk, so the other end gets its first bytes while the
+    rest is still arriving. The cache copy the receiver writes is the only
+    copy, and any number of followers can read it.
+
+    size and sha256 of the incoming file (when known up front) let send()
+    speak FRAMING_V3, which needs both before the first byte; a V3 receiver
+    fills them in too.
+    """
+    def __init__(self, size: Optional[int] = None, sha256: Optional[str] = None,
+                 idle_timeout: float = DEFAULT_RELAY_IDLE_TIMEOUT) -> None:
+        self.cond = threading.Condition()
+        self.size = size
+        self.sha256 = sha256
+        self.idle_timeout = idle_timeout
+        self.written = 0  # bytes of the file on disk so far, counted from its start
+        self.done = False
+        self.success = False
+        self.closed = False  # no more followers; the writer goes on without a read handle
+        self._file = None  # read handle on the file being written
+
+    # writer side, called by FileReceiver
+
+    def opened(self, path: Path, written: int, size: Optional[int] = None, sha256: Optional[str] = None) -> None:
+        with self.cond:
+            if not self.closed:
+                self._file = path.open("rb")
+            self.written = written
+            if size is not None:
+                self.size = size
+            if sha256 is not None:
+                self.sha256 = sha256
+            self.cond.notify_all()
+
+    def advanced(self, written: int) -> None:
+        with self.cond:
+            self.written = written
+            self.cond.notify_all()
+
+    def moving(self) -> None:
+        """The file is about to be renamed into place; let go of it (Windows
+        cannot rename an open file). finished() reopens it."""
+        with self.cond:
+            self._close_file()
+
+    def finished(self, success: bool, path: Optional[Path] = None) -> None:
+        with self.cond:
+            self._close_file()
+            if success and path is not None and not self.closed:
+                try:
+                    self._file = path.open("rb")
+                except OSError as e:
+                    print(f"[FileRelay] cannot reopen {path}: {e}")
+            self.success = success and (self._file is not None or self.closed)
+            self.done = True
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        """Done following: drop the read handle. The writer keeps writing the file."""
+        with self.cond:
+            self.closed = True
+            self._close_file()
+            self.cond.notify_all()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # follower side
+
+    def send(self, sock: socket.socket, framing: int = FRAMING_V1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        """Forward the file to sock in `framing` while it arrives. Raises
+        ConnectionError if the incoming transfer fails, TimeoutError if it
+        stalls; the stream to sock is then cut short, and a V3 peer resumes
+        on its next attempt. FRAMING_V3 falls back to V2 without a known
+        size and sha256."""
+        if framing == FRAMING_V3 and (self.size is None or self.sha256 is None):
+            framing = FRAMING_V2
+        offset = 0
+        if framing == FRAMING_V3:
+            assert self.size is not None and self.sha256 is not None
+            sock.sendall(PREAMBLE.pack(MAGIC, FRAMING_V3, 0) + RESUME.pack(self.size, bytes.fromhex(self.sha256)))
+            offset = OFFSET.unpack(self._recvn(sock, OFFSET.size))[0]
+            if offset > self.size:
+                raise ValueError(f"receiver asked to resume at {offset}, past the end of {self.size} bytes")
+        elif framing == FRAMING_V2:
+            sock.sendall(PREAMBLE.pack(MAGIC, FRAMING_V2, 0))
+        seq = 0
+        while True:
+            chunk = self._read(offset, chunk_size)
+            if not chunk:
+                break
+            sock.sendall(self._chunk_header(framing, seq, len(chunk)))
+            sock.sendall(chunk)
+            offset += len(chunk)
+            seq += 1
+        sock.sendall(self._chunk_header(framing, seq, 0))
+
+    def _read(self, offset: int, n: int) -> bytes:
+        """Up to n bytes at offset once they are on disk; b"" at the end of a
+        complete file."""
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise ConnectionError("relay closed")
+                if self.written > offset and self._file is not None:
+                    self._file.seek(offset)
+                    return self._file.read(min(n, self.written - offset))
+                if self.done:
+                    if self.success:
+                        return b""
+                    raise ConnectionError("incoming transfer failed")
+                if not self.cond.wait(self.idle_timeout):
+                    raise TimeoutError(f"incoming transfer stalled for {self.idle_timeout} s")
+
+    @staticmethod
+    def _chunk_header(framing: int, seq: int, size: int) -> bytes:
+        if framing == FRAMING_V1:
+            header = json.dumps({"seq": seq, "size": size}).encode("utf-8")
+            return struct.pack("!I", len(header)) + header
+        return CHUNK.pack(seq, size)
+
+    @staticmethod
+    def _recvn(sock: socket.socket, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            part = sock.recv(n - len(buf))
+            if not part:
+                raise ConnectionError("socket closed before the receiver answered")
+            buf += part
+        return buf
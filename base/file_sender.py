@@ -1,16 +1,137 @@
+import os
 import socket
+import zlib
+import hashlib
 from pathlib import Path
+from typing import Optional
 import json
 import struct
+from base.transfer_framing import (FRAMING_V1, FRAMING_V2, FRAMING_V3, MAGIC, PREAMBLE, CHUNK, CHUNK_CRC,
+                                   RESUME, OFFSET, FLAG_CRC, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE)
 
 CHUNK_MAX = 60 * 1024
+DEFAULT_ZERO_COPY = True
+DEFAULT_CRC = False
+DEFAULT_V1_SINGLE_FRAME = False
 
 class FileSender:
-    def __init__(self, sock: socket.socket, path: Path):
+    """Sends a file in one of the framings of base.transfer_framing.
+
+    FRAMING_V1 (the default, every receiver reads it): the file is cut into
+    CHUNK_MAX frames, the original chunked mode. With v1_single_frame the
+    whole file is one frame whose payload goes out through socket.sendfile
+    (os.sendfile where available, so the bytes never pass through Python).
+    Only for receivers known to stream a frame to disk: older receivers
+    buffer a frame in memory and copy it on every read, so opt in explicitly.
+
+    FRAMING_V2, only when the receiver offered it (transfer_framing.choose_framing):
+    chunks of chunk_size behind fixed struct headers, sent with sendfile under
+    zero_copy. With crc every chunk carries its crc32; those chunks are read
+    into a buffer to checksum them, so crc turns zero_copy off.
+
+    FRAMING_V3 is FRAMING_V2 that resumes where an interrupted transfer of
+    the same file to the same receiver stopped; resumed_from tells how many
+    bytes were skipped. The receiver identifies the file by sha256 (hex),
+    computed from the file when the caller does not pass it.
+    """
+    def __init__(self, sock: socket.socket, path: Path, zero_copy: bool = DEFAULT_ZERO_COPY,
+                 framing: int = FRAMING_V1, chunk_size: int = DEFAULT_CHUNK_SIZE, crc: bool = DEFAULT_CRC,
+                 sha256: Optional[str] = None, v1_single_frame: bool = DEFAULT_V1_SINGLE_FRAME):
+        if framing not in (FRAMING_V1, FRAMING_V2, FRAMING_V3):
+            raise ValueError(f"Unknown transfer framing: {framing}")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("Chunk size out of range")
         self.sock = sock
         self.path = path
+        self.zero_copy = zero_copy
+        self.framing = framing
+        self.chunk_size = chunk_size
+        self.crc = crc
+        self.sha256 = sha256
+        self.v1_single_frame = v1_single_frame
+        self.resumed_from = 0
 
     def send(self):
+        if self.framing in (FRAMING_V2, FRAMING_V3):
+            self._send_v2()
+        elif self.v1_single_frame:
+            self._send_single_frame()
+        else:
+            self._send_chunked()
+
+    def _send_v2(self):
+        preamble = PREAMBLE.pack(MAGIC, self.framing, FLAG_CRC if self.crc else 0)
+        seq = 0
+        with self.path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = 0
+            if self.framing == FRAMING_V3:
+                digest = bytes.fromhex(self.sha256) if self.sha256 else self._file_sha256(f)
+                self.sock.sendall(preamble + RESUME.pack(size, digest))
+                offset = OFFSET.unpack(self._recvn(OFFSET.size))[0]
+                if offset > size:
+                    raise ValueError(f"receiver asked to resume at {offset}, past the end of {size} bytes")
+                self.resumed_from = offset
+                f.seek(offset)
+            else:
+                self.sock.sendall(preamble)
+            if self.zero_copy and not self.crc:
+                while offset < size:
+                    n = min(self.chunk_size, size - offset)
+                    self.sock.sendall(CHUNK.pack(seq, n))
+                    sent = self.sock.sendfile(f, offset, n)
+                    if sent != n:
+                        raise ConnectionError(f"sent {offset + sent} of {size} bytes, {self.path} shrank")
+                    offset += n
+                    seq += 1
+                self.sock.sendall(CHUNK.pack(seq, 0))
+                return
+            header = CHUNK_CRC if self.crc else CHUNK
+            # header and payload share one buffer, so each chunk is one sendall without a concatenation
+            buf = bytearray(header.size + self.chunk_size)
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(view[header.size:])
+                if not n:
+                    break
+                if self.crc:
+                    header.pack_into(buf, 0, seq, n, zlib.crc32(view[header.size:header.size + n]))
+                else:
+                    header.pack_into(buf, 0, seq, n)
+                self.sock.sendall(view[:header.size + n])
+                seq += 1
+            self.sock.sendall(CHUNK_CRC.pack(seq, 0, 0) if self.crc else CHUNK.pack(seq, 0))
+
+    @staticmethod
+    def _file_sha256(f) -> bytes:
+        h = hashlib.sha256()
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+        f.seek(0)
+        return h.digest()
+
+    def _recvn(self, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            part = self.sock.recv(n - len(buf))
+            if not part:
+                raise ConnectionError("socket closed before the receiver answered")
+            buf += part
+        return buf
+
+    def _send_single_frame(self):
+        with self.path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            seq = 0
+            if size:
+                self._send_header(seq, size)
+                sent = self.sock.sendfile(f, 0, size)
+                if sent != size:
+                    raise ConnectionError(f"sent {sent} of {size} bytes, {self.path} shrank")
+                seq += 1
+            self._send_header(seq, 0)
+
+    def _send_chunked(self):
         # passer = self.client.worker.passer
         seq = 0
         with self.path.open("rb") as f:
@@ -22,9 +143,12 @@ class FileSender:
                 seq += 1
             self._send_chunk(seq, None)
 
+    def _send_header(self, seq: int, size: int):
+        header = json.dumps({"seq": seq, "size": size}).encode("utf-8")
+        self.sock.sendall(struct.pack("!I", len(header)) + header)
+
     def _send_chunk(self, seq: int, chunk: bytes | None):
         d = {"seq": seq, "size": len(chunk) if chunk else 0}
-        print(f"sent dict: {d}")
         header = json.dumps(d).encode("utf-8")
         frame = struct.pack("!I", len(header)) + header + (chunk or b"")
         self.sock.sendall(frame)
@@ -33,4 +157,4 @@ class FileSender:
         try:
             self.sock.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
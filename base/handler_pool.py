@@ -0,0 +1,69 @@
+import queue
+import threading
+from typing import Callable, Optional
+
+DEFAULT_POOL_SIZE = 32
+
+
+class HandlerPool:
+    """Fixed number of daemon threads running submitted callables in FIFO order.
+
+    Unlike one thread per task, the thread count stays at `size` however many
+    tasks arrive; the backlog waits in the queue (bounded by max_queue if
+    given, 0 = unbounded) and its length is exposed as queue_depth.
+    """
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, name: str = "handler", max_queue: int = 0) -> None:
+        if size <= 0:
+            raise ValueError("Pool size must be positive")
+        self.size = size
+        self.name = name
+        self.tasks: queue.Queue[Optional[tuple]] = queue.Queue(max_queue)
+        self.busy = 0
+        self.busy_lock = threading.Lock()
+        self.threads: list[threading.Thread] = []
+        self.stopped = False
+
+    def start(self) -> None:
+        self.stopped = False
+        for i in range(self.size):
+            thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    @property
+    def queue_depth(self) -> int:
+        """Tasks submitted but not picked up by a thread yet."""
+        return self.tasks.qsize()
+
+    def submit(self, fn: Callable, *args, block: bool = True, timeout: Optional[float] = None) -> None:
+        """Queue fn(*args). Raises queue.Full when max_queue is reached and
+        block is False or timeout expires."""
+        if self.stopped:
+            raise RuntimeError(f"{self.name} pool is stopped")
+        self.tasks.put((fn, args), block, timeout)
+
+    def stop(self, wait: bool = True) -> None:
+        self.stopped = True
+        for _ in self.threads:
+            self.tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                if thread is not threading.current_thread():
+                    thread.join(timeout=3)
+        self.threads = []
+
+    def _worker_loop(self) -> None:
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            fn, args = task
+            with self.busy_lock:
+                self.busy += 1
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[HandlerPool] {self.name} task raised: {e}")
+            finally:
+                with self.busy_lock:
+                    self.busy -= 1
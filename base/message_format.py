@@ -1,33 +1,55 @@
 import json
+from operator import itemgetter
+
+def _compile_validator(types: tuple):
+    """Build `values -> bool` as one flat isinstance chain for a fixed field order."""
+    namespace = {f"t{i}": tp for i, tp in enumerate(types)}
+    checks = " and ".join(f"isinstance(v[{i}], t{i})" for i in range(len(types))) or "True"
+    exec(f"def is_valid(v):\n    return {checks}", namespace)
+    return namespace["is_valid"]
 
 class MessageFormat:
     def __init__(self, format_dict: dict = {}) -> None:
-        """format_dict: key is field name, value is type (str, int, float, bool)"""
+        """format_dict: key is field name, value is type (str, int, float, bool)
+
+        The field order is fixed here, so the encoder / decoder for it are
+        built once instead of walking the dict on every message."""
         self.format = format_dict
+        self._keys = tuple(format_dict.keys())
+        self._types = tuple(format_dict.values())
+        self._fields = tuple(zip(self._keys, self._types))
+        self._dumps = json.JSONEncoder().encode
+        self._loads = json.JSONDecoder().decode
+        self._is_valid = _compile_validator(self._types)
+        if len(self._keys) == 1:
+            key = self._keys[0]
+            self._getter = lambda d: (d[key],)
+        else:
+            self._getter = itemgetter(*self._keys)
 
-    def to_json(self, *args) -> str:
-        result_dict = {}
-        args_list = list(args)
-        if len(args_list) != len(self.format):
+    def to_json(self, *args, validate: bool = True) -> str:
+        """validate=False skips the type checks, for trusted internal links."""
+        if len(args) != len(self._keys):
             raise ValueError("Number of arguments does not match format")
-        for key, tp in self.format.items():
-            value = args_list.pop(0)
-            if not isinstance(value, tp):
-                raise TypeError(f"Expected {tp} for field '{key}', got {type(value)}")
-            result_dict[key] = value
-        #print(f"Formatted dict: {result_dict}")
-        return json.dumps(result_dict)
-    
-    def to_arg_list(self, json_str: str) -> list:
-        data_dict = json.loads(json_str)
-        # print(f"data_dict={data_dict}")
-        result_list = []
-        for key, tp in self.format.items():
-            if key not in data_dict:
-                raise KeyError(f"Missing field '{key}' in JSON data")
-            value = data_dict[key]
+        if validate:
+            self._check(args)
+        return self._dumps(dict(zip(self._keys, args)))
+
+    def to_arg_list(self, json_str: str, validate: bool = True) -> list:
+        data_dict = self._loads(json_str)
+        if not isinstance(data_dict, dict):
+            raise TypeError(f"Expected a JSON object, got {type(data_dict)}")
+        try:
+            result_list = list(self._getter(data_dict))
+        except KeyError as e:
+            raise KeyError(f"Missing field {e} in JSON data") from None
+        if validate:
+            self._check(result_list)
+        return result_list
+
+    def _check(self, values) -> None:
+        if self._is_valid(values):
+            return
+        for value, (key, tp) in zip(values, self._fields):
             if not isinstance(value, tp):
                 raise TypeError(f"Expected {tp} for field '{key}', got {type(value)}")
-            result_list.append(value)
-        #print(f"Extracted args: {result_list}")
-        return result_list
\ No newline at end of file
@@ -2,16 +2,256 @@ import socket
 import struct
 import json
 import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+from protocols.protocols import Words
 from .message_format import MessageFormat
+from .transfer_framing import FRAMING_V1, FRAMING_V2, CHUNK
 
 LENGTH_LIMIT = 65536
 RECEIVE_CHUNK_TIMEOUT = 15.0
 RECEIVE_ACTUAL_MESSAGE_TIMEOUT = 20.0
+PREFIX_SIZE = 4
+RECEIVE_BUFFER_SIZE = 2 * (LENGTH_LIMIT + PREFIX_SIZE)
+SENDMSG_MAX_BUFFERS = 512  # stay below IOV_MAX (1024 on Linux)
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")  # not available on Windows
 
+# high bits of the length prefix carry per-frame flags
+FLAG_COMPRESSED = 0x80000000  # body is zlib-compressed
+FLAG_MORE = 0x40000000  # fragment of a larger message, more fragments follow
+LENGTH_MASK = 0x3FFFFFFF
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFAULT_MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # largest reassembled message we accept
 
-class MessageFormatPasser:
-    """This class handles sending and receiving MessageFormat objects over a TCP socket."""
-    def __init__(self, sock: socket.socket | None = None, timeout: float | None = None) -> None:
+
+class PasserStats:
+    """Compression counters of one MessageFormatPasser. Only frames at or above
+    the compression threshold are counted on the send side."""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.compress_frames = 0
+        self.compress_bytes_in = 0
+        self.compress_bytes_out = 0
+        self.compress_seconds = 0.0
+        self.decompress_frames = 0
+        self.decompress_bytes_in = 0
+        self.decompress_bytes_out = 0
+        self.decompress_seconds = 0.0
+        self.fragmented_sent = 0
+        self.fragmented_received = 0
+        self.reassembly_bytes = 0  # held right now by a message being reassembled
+        self.reassembly_peak_bytes = 0
+
+    def record_compress(self, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        with self.lock:
+            self.compress_frames += 1
+            self.compress_bytes_in += bytes_in
+            self.compress_bytes_out += bytes_out
+            self.compress_seconds += seconds
+
+    def record_decompress(self, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        with self.lock:
+            self.decompress_frames += 1
+            self.decompress_bytes_in += bytes_in
+            self.decompress_bytes_out += bytes_out
+            self.decompress_seconds += seconds
+
+    def record_fragmented_sent(self) -> None:
+        with self.lock:
+            self.fragmented_sent += 1
+
+    def set_reassembly_bytes(self, held: int) -> None:
+        with self.lock:
+            if held == 0 and self.reassembly_bytes:
+                self.fragmented_received += 1
+            self.reassembly_bytes = held
+            self.reassembly_peak_bytes = max(self.reassembly_peak_bytes, held)
+
+    @property
+    def compression_ratio(self) -> float:
+        """Bytes on the wire / bytes before compression for sent frames (1.0 = no gain)."""
+        return self.compress_bytes_out / self.compress_bytes_in if self.compress_bytes_in else 1.0
+
+    def summary(self) -> str:
+        return (f"sent {self.compress_frames} large frames {self.compress_bytes_in} -> {self.compress_bytes_out} bytes "
+                f"(ratio {self.compression_ratio:.2f}, {self.compress_seconds * 1000:.1f} ms cpu), "
+                f"received {self.decompress_frames} compressed frames {self.decompress_bytes_in} -> {self.decompress_bytes_out} bytes "
+                f"({self.decompress_seconds * 1000:.1f} ms cpu), "
+                f"fragmented messages sent {self.fragmented_sent} received {self.fragmented_received} "
+                f"(reassembly peak {self.reassembly_peak_bytes} bytes)")
+
+
+class PasserBase:
+    """Wire format shared by MessageFormatPasser and AsyncMessageFormatPasser,
+    everything that does not touch the socket.
+
+    When the handshake also agrees on zlib, frames of at least
+    compression_threshold bytes are compressed and flagged with
+    FLAG_COMPRESSED in the length prefix; small control frames stay raw.
+    Ratio and CPU time are collected in `stats`.
+
+    Messages larger than LENGTH_LIMIT are split into fragments of at most
+    LENGTH_LIMIT bytes; every fragment but the last carries FLAG_MORE, and
+    the fragments of one message are written back to back. The receiver
+    appends fragments to one per-connection buffer as they arrive, up to
+    max_message_size. The handshake agrees on the smaller of both sides'
+    max_message_size; peers that do not announce one only get LENGTH_LIMIT.
+    """
+    def __init__(self, trusted: bool = False, 
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD, 
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL, 
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE) -> None:
+        # trusted internal links (lobby/developer <-> database) skip per-field type checks
+        self.trusted = trusted
+        self.compress = False
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+        self.stats = PasserStats()
+        self.max_message_size = max(max_message_size, LENGTH_LIMIT)
+        self.peer_max_message_size = LENGTH_LIMIT  # what the peer can take, raised by the handshake
+
+    def encode_args(self, msgfmt: MessageFormat, *args) -> bytes:
+        """Encode args into the frame body send_args would send."""
+        validate = not self.trusted
+        return msgfmt.to_json(*args, validate=validate).encode('utf-8')
+
+    def decode_args(self, msgfmt: MessageFormat, frame: bytes | memoryview) -> list:
+        validate = not self.trusted
+        return msgfmt.to_arg_list(str(frame, "utf-8"), validate)
+
+    def handshake_offer(self) -> dict:
+        """Fields to add to our HANDSHAKE data, announcing what this passer can speak."""
+        return {Words.DataKeys.Handshake.COMPRESSION: [Words.Compression.ZLIB], 
+                Words.DataKeys.Handshake.MAX_MESSAGE_SIZE: self.max_message_size}
+
+    def negotiate(self, handshake_data: dict) -> dict:
+        """Server side: choose wire options from the peer's HANDSHAKE data.
+        Returns the params for the handshake response; call apply_negotiated
+        with them once that response has been sent. Peers that offer nothing
+        (older clients) get an empty dict and keep the defaults."""
+        params = {}
+        compression = handshake_data.get(Words.DataKeys.Handshake.COMPRESSION)
+        if isinstance(compression, list) and Words.Compression.ZLIB in compression:
+            params[Words.ParamKeys.Handshake.COMPRESSION] = Words.Compression.ZLIB
+        max_size = handshake_data.get(Words.DataKeys.Handshake.MAX_MESSAGE_SIZE)
+        if isinstance(max_size, int) and max_size > LENGTH_LIMIT:
+            params[Words.ParamKeys.Handshake.MAX_MESSAGE_SIZE] = min(max_size, self.max_message_size)
+        return params
+
+    def apply_negotiated(self, params: dict | None) -> None:
+        """Switch to the options in a handshake response (both sides call this)."""
+        params = params or {}
+        self.compress = params.get(Words.ParamKeys.Handshake.COMPRESSION) == Words.Compression.ZLIB
+        max_size = params.get(Words.ParamKeys.Handshake.MAX_MESSAGE_SIZE)
+        self.peer_max_message_size = max_size if isinstance(max_size, int) and max_size > LENGTH_LIMIT else LENGTH_LIMIT
+
+    def _frame_buffers(self, data: bytes) -> list:
+        """Length prefixes and bodies for one message: compressed when negotiated
+        and worth it, then split into fragments if it exceeds LENGTH_LIMIT."""
+        if len(data) > self.peer_max_message_size:
+            raise ValueError(f"Message of {len(data)} bytes exceeds the peer's limit of {self.peer_max_message_size}")
+        flags = 0
+        if self.compress and len(data) >= self.compression_threshold:
+            start = time.process_time()
+            compressed = zlib.compress(data, self.compression_level)
+            self.stats.record_compress(len(data), min(len(compressed), len(data)), time.process_time() - start)
+            if len(compressed) < len(data):
+                data, flags = compressed, FLAG_COMPRESSED
+        if len(data) <= LENGTH_LIMIT:
+            return [struct.pack('!I', len(data) | flags), data]
+        view = memoryview(data)
+        buffers = []
+        for offset in range(0, len(data), LENGTH_LIMIT):
+            fragment = view[offset:offset + LENGTH_LIMIT]
+            more = FLAG_MORE if offset + LENGTH_LIMIT < len(data) else 0
+            buffers.append(struct.pack('!I', len(fragment) | flags | more))
+            buffers.append(fragment)
+        self.stats.record_fragmented_sent()
+        return buffers
+
+    def _check_length(self, header: int) -> int:
+        if header & ~(LENGTH_MASK | FLAG_COMPRESSED | FLAG_MORE):
+            raise ValueError("Received message with unknown frame flags")
+        message_length = header & LENGTH_MASK
+        if message_length <= 0:
+            raise ValueError("Received message with non-positive length")
+        elif message_length > LENGTH_LIMIT:
+            raise ValueError("Received message exceeds length limit")
+        return message_length
+
+    def _decompress(self, data: bytes | memoryview) -> bytes:
+        """Inflate a compressed frame body; the result is held to max_message_size like a fragmented one."""
+        start = time.process_time()
+        inflater = zlib.decompressobj()
+        try:
+            body = inflater.decompress(data, self.max_message_size)
+        except zlib.error as e:
+            raise ValueError(f"Received corrupt compressed message: {e}") from None
+        if inflater.unconsumed_tail or not inflater.eof:
+            raise ValueError("Received compressed message exceeds max_message_size or is truncated")
+        self.stats.record_decompress(len(data), len(body), time.process_time() - start)
+        return body
+
+
+class Reassembly:
+    """One fragmented message being collected, fed fragment by fragment.
+    Compressed fragments are inflated as they come in."""
+    def __init__(self, passer: PasserBase, header: int) -> None:
+        self.passer = passer
+        self.compressed = header & FLAG_COMPRESSED
+        self.inflater = zlib.decompressobj() if self.compressed else None
+        self.start = time.process_time()
+        self.wire_bytes = 0
+        self.message = bytearray()
+
+    def feed(self, header: int, body: bytes | memoryview) -> bool:
+        """Add one fragment; True once it was the last one."""
+        if header & FLAG_COMPRESSED != self.compressed:
+            raise ValueError("Received fragment with inconsistent compression flag")
+        max_size = self.passer.max_message_size
+        self.wire_bytes += len(body)
+        if self.inflater is not None:
+            try:
+                body = self.inflater.decompress(body, max_size - len(self.message) + 1)
+            except zlib.error as e:
+                raise ValueError(f"Received corrupt compressed message: {e}") from None
+        if len(self.message) + len(body) > max_size:
+            raise ValueError("Received message exceeds max_message_size")
+        self.message += body
+        self.passer.stats.set_reassembly_bytes(len(self.message))
+        return not header & FLAG_MORE
+
+    def finish(self) -> bytes:
+        if self.inflater is not None:
+            if not self.inflater.eof:
+                raise ValueError("Received truncated compressed message")
+            self.passer.stats.record_decompress(self.wire_bytes, len(self.message), time.process_time() - self.start)
+        return bytes(self.message)
+
+
+class MessageFormatPasser(PasserBase):
+    """This class handles sending and receiving MessageFormat objects over a TCP socket.
+
+    With buffered=True, received bytes go into one reusable bytearray filled by
+    recv_into, and frames are parsed out of it in place: a single recv usually
+    yields several frames, and receive_frame hands them out as memoryview slices.
+    Those views are only valid until the next receive call on this passer.
+
+    Frames are written with socket.sendmsg, header and body as separate buffers.
+    Inside `with passer.corked():` frames are queued instead and leave in one
+    sendmsg when the block ends; send_many does the same for a known batch.
+
+    Encoding, compression and fragmentation are inherited from PasserBase.
+    """
+    def __init__(self, sock: socket.socket | None = None, timeout: float | None = None, 
+                 buffered: bool = False, trusted: bool = False, 
+                 compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD, 
+                 compression_level: int = DEFAULT_COMPRESSION_LEVEL, 
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE) -> None:
+        super().__init__(trusted, compression_threshold, compression_level, max_message_size)
         if sock is None:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         else:
@@ -23,6 +263,18 @@ class MessageFormatPasser:
         self.sock.settimeout(timeout)
         self.send_lock = threading.Lock()
         self.receive_lock = threading.Lock()
+        self._cork_depth = 0
+        self._corked_frames: list[bytes] = []
+
+        self.buffered = buffered
+        self._recv_buf = bytearray(RECEIVE_BUFFER_SIZE if buffered else 0)
+        self._recv_view = memoryview(self._recv_buf)
+        self._buf_start = 0
+        self._buf_end = 0
+        self._reassembly: Reassembly | None = None  # fragmented message in progress
+        # a receive timeout keeps what it had read, so the next receive goes on from there
+        self._partial_read: tuple[bytearray, int] | None = None  # (buffer, bytes filled)
+        self._partial_header: int | None = None  # unbuffered: prefix of a frame whose body is pending
 
     def connect(self, host: str = "127.0.0.1", port: int = 21354) -> None:
         self.sock.connect((host, port))
@@ -34,90 +286,251 @@ class MessageFormatPasser:
         self.sock.settimeout(timeout)
 
     def send_args(self, msgfmt: MessageFormat, *args) -> None:
-        json_data = msgfmt.to_json(*args)
-        encoded = json_data.encode('utf-8')
-        self.send_raw(encoded)
-        # sending_data = struct.pack('!I', len(encoded)) + encoded
-        # print(f"Sending message: {sending_data}")
-        # with self.send_lock:
-        #     self.sock.sendall(sending_data)
+        self.send_raw(self.encode_args(msgfmt, *args))
 
     def send_raw(self, data: bytes) -> None:
         """Send raw bytes with 4-byte length prefix"""
-        # Prefix the JSON data with its length (4 bytes, network byte order)
-        sending_data = struct.pack('!I', len(data)) + data
-        print(f"\nSending raw data: {sending_data}")
         with self.send_lock:
-            self.sock.sendall(sending_data)
+            if self._cork_depth:
+                self._corked_frames.append(data)
+                return
+        # Prefix the data with its length (4 bytes, network byte order), without copying it
+        buffers = self._frame_buffers(data)
+        with self.send_lock:
+            self._send_buffers(buffers)
 
-    def send_chunk(self, seq: int, chunk: bytes | None):
+    def send_many(self, frames: Iterable[bytes]) -> None:
+        """Send several length-prefixed frames with as few syscalls as possible."""
+        buffers: list[bytes] = []
+        for data in frames:
+            buffers.extend(self._frame_buffers(data))
+        if not buffers:
+            return
+        with self.send_lock:
+            self._send_buffers(buffers)
+
+    @contextmanager
+    def corked(self) -> Iterator["MessageFormatPasser"]:
+        """Queue every frame sent inside the block and flush them together at the end."""
+        with self.send_lock:
+            self._cork_depth += 1
+        try:
+            yield self
+        finally:
+            with self.send_lock:
+                self._cork_depth -= 1
+                frames = self._corked_frames if self._cork_depth == 0 else []
+                if frames:
+                    self._corked_frames = []
+            if frames:
+                self.send_many(frames)
+
+    def _send_buffers(self, buffers: list) -> None:
+        """sendall for a list of buffers. Caller holds send_lock."""
+        if not HAS_SENDMSG:
+            self.sock.sendall(b"".join(buffers))
+            return
+        views = [memoryview(b).cast("B") for b in buffers if len(b)]
+        i = 0
+        while i < len(views):
+            sent = self.sock.sendmsg(views[i:i + SENDMSG_MAX_BUFFERS])
+            # drop what went out, keep the unsent tail of a partially sent buffer
+            while sent and i < len(views):
+                if sent >= len(views[i]):
+                    sent -= len(views[i])
+                    i += 1
+                else:
+                    views[i] = views[i][sent:]
+                    sent = 0
+
+    def send_chunk(self, seq: int, chunk: bytes | None, framing: int = FRAMING_V1):
+        """One file chunk (None or empty ends the file) in the given
+        transfer_framing framing; FRAMING_V2 chunks carry a fixed CHUNK header
+        instead of a JSON frame. The receiver must be told the framing."""
+        if framing == FRAMING_V2:
+            with self.send_lock:
+                self._send_buffers([CHUNK.pack(seq, len(chunk) if chunk else 0), chunk or b""])
+            return
         if not chunk:
             header = json.dumps({"seq": seq, "size": 0}).encode("utf-8")
             self.send_raw(header)
             return
         header = json.dumps({"seq": seq, "size": len(chunk)}).encode("utf-8")
-        frame = struct.pack("!I", len(header)) + header + chunk
         with self.send_lock:
-            self.sock.sendall(frame)
-
-    def recv_chunk(self) -> tuple[int, bytes | None]:
-        prefix_dict = json.loads(self.receive_raw())
-        print(f"\nreceived prefix_dict: {prefix_dict}")
-        size = prefix_dict.get("size")
-        seq = prefix_dict.get("seq")
-        if size == 0:
-            return seq, None
-        chunk = self.read_exactly(size)
-        return seq, chunk
-
+            self._send_buffers([struct.pack("!I", len(header)), header, chunk])
 
+    def recv_chunk(self, framing: int = FRAMING_V1) -> tuple[int, bytes | None]:
+        with self.receive_lock:
+            if framing == FRAMING_V2:
+                seq, size = CHUNK.unpack(self._read_exactly_locked(CHUNK.size))
+            else:
+                prefix_dict = json.loads(bytes(self._receive_frame_locked()))
+                size = prefix_dict.get("size")
+                seq = prefix_dict.get("seq")
+            if size == 0:
+                return seq, None
+            chunk = self._read_exactly_locked(size)
+        return seq, chunk
 
     def read_exactly(self, num_bytes: int) -> bytes:
         """Read exactly num_bytes from self.sock."""
-        data = b""
         with self.receive_lock:
-            data = self.sock.recv(num_bytes)
-            # temp_timeout = self.timeout
-            # self.settimeout(None)
-            while len(data) < num_bytes:
-                try:
-                    chunk = self.sock.recv(num_bytes - len(data))
-                except socket.timeout:
-                    raise TimeoutError("recv timeout") from None
-                if not chunk:
-                    raise ConnectionError("Connection closed")
-                data += chunk
-            # self.settimeout(temp_timeout)
-        return data
+            return self._read_exactly_locked(num_bytes)
+
+    def _read_exactly_locked(self, num_bytes: int) -> bytes:
+        if self._partial_read is not None:
+            data, got = self._partial_read
+            self._partial_read = None
+            if len(data) != num_bytes:
+                raise ValueError(f"read of {num_bytes} bytes while a timed out read of {len(data)} is unfinished")
+        else:
+            data, got = bytearray(num_bytes), 0
+        view = memoryview(data)
+        if self.buffered:
+            # bytes already pulled into the receive buffer come first
+            n = min(num_bytes - got, self._buf_end - self._buf_start)
+            view[got:got + n] = self._recv_view[self._buf_start:self._buf_start + n]
+            self._buf_start += n
+            got += n
+        while got < num_bytes:
+            try:
+                n = self.sock.recv_into(view[got:])
+            except socket.timeout:
+                self._partial_read = (data, got)
+                raise TimeoutError("recv timeout") from None
+            if not n:
+                raise ConnectionError("Connection closed")
+            got += n
+        return bytes(data)
 
     def receive_args(self, msgfmt: MessageFormat) -> list:
-        json_data = self.receive_raw().decode("utf-8")
-        # self.settimeout(temp_timeout)
-        # print(f"Received message: {json_data}")
-        return msgfmt.to_arg_list(json_data)
+        with self.receive_lock:
+            # in buffered mode this decodes straight from the receive buffer
+            return self.decode_args(msgfmt, self._receive_frame_locked())
     
+    def receive_ready(self, msgfmt: MessageFormat) -> list[list]:
+        """For event loops: one recv (call it only when the socket is readable),
+        then decode every message that is complete in the buffer. Partial
+        frames and unfinished fragmented messages wait for the next call.
+        Needs buffered=True."""
+        if not self.buffered:
+            raise ValueError("receive_ready needs a buffered passer")
+        messages = []
+        with self.receive_lock:
+            self._fill_buffer()
+            while (frame := self._next_buffered_frame()) is not None:
+                header, body = frame
+                if self._reassembly is None and header & FLAG_MORE:
+                    self._reassembly = Reassembly(self, header)
+                if self._reassembly is not None:
+                    try:
+                        done = self._reassembly.feed(header, body)
+                        if done:
+                            body = self._reassembly.finish()
+                    except Exception:
+                        done = True
+                        raise
+                    finally:
+                        if done:
+                            self._reassembly = None
+                            self.stats.set_reassembly_bytes(0)
+                    if not done:
+                        continue
+                elif header & FLAG_COMPRESSED:
+                    body = self._decompress(body)
+                messages.append(self.decode_args(msgfmt, body))
+        return messages
+
     def receive_raw(self) -> bytes:
         """Receive 4-byte length-prefixed raw bytes"""
-        # print("Entered receive_raw")
+        with self.receive_lock:
+            return bytes(self._receive_frame_locked())
+
+    def receive_frame(self) -> memoryview:
+        """Receive one whole frame. In buffered mode the result is a view into
+        the receive buffer, valid until the next receive call."""
+        with self.receive_lock:
+            return memoryview(self._receive_frame_locked())
+
+    def _receive_frame_locked(self) -> bytes | memoryview:
+        header, body = self._receive_physical_frame_locked()
+        if self._reassembly is not None or header & FLAG_MORE:
+            return self._reassemble_locked(header, body)
+        if header & FLAG_COMPRESSED:
+            return self._decompress(body)
+        return body
+
+    def _reassemble_locked(self, header: int, body: bytes | memoryview) -> bytes:
+        """Collect the rest of a fragmented message. On a receive timeout the
+        fragments so far stay in self._reassembly for the next receive."""
+        if self._reassembly is None:
+            self._reassembly = Reassembly(self, header)
+        try:
+            while not self._reassembly.feed(header, body):
+                header, body = self._receive_physical_frame_locked()
+            body = self._reassembly.finish()
+        except TimeoutError:
+            raise
+        except Exception:
+            self._reassembly = None
+            self.stats.set_reassembly_bytes(0)
+            raise
+        self._reassembly = None
+        self.stats.set_reassembly_bytes(0)
+        return body
+
+    def _receive_physical_frame_locked(self) -> tuple[int, bytes | memoryview]:
+        """One frame off the wire as (length prefix, body), without acting on its flags."""
+        if self.buffered:
+            while True:
+                frame = self._next_buffered_frame()
+                if frame is not None:
+                    return frame
+                self._fill_buffer()
 
         # Read the prefix (exactly 4 bytes) to determine the length of the incoming message
-        length_prefix = self.read_exactly(4)
-        print(f"\nreceived length_prefix: {length_prefix}")
-        if not length_prefix:
-            raise ConnectionError("Connection closed")
-        message_length = struct.unpack('!I', length_prefix)[0]
-        if message_length <= 0:
-            raise ValueError("Received message with non-positive length")
-        elif message_length > LENGTH_LIMIT:
-            raise ValueError("Received message exceeds length limit")
+        if self._partial_header is None:
+            length_prefix = self._read_exactly_locked(PREFIX_SIZE)
+            header = struct.unpack('!I', length_prefix)[0]
+            self._check_length(header)
+            self._partial_header = header
+        header = self._partial_header
+        message_length = self._check_length(header)
         
         # Now read the actual raw data
-        # temp_timeout = self.timeout
-        # self.settimeout(None)
-        raw_data = self.read_exactly(message_length)
-        print(f"received raw_data: {raw_data}")
-        # self.settimeout(temp_timeout)
-        return raw_data
+        raw_data = self._read_exactly_locked(message_length)
+        self._partial_header = None
+        return header, raw_data
+
+    def _next_buffered_frame(self) -> tuple[int, memoryview] | None:
+        """Cut the next complete frame out of the receive buffer, if there is one."""
+        available = self._buf_end - self._buf_start
+        if available < PREFIX_SIZE:
+            return None
+        header = struct.unpack_from('!I', self._recv_buf, self._buf_start)[0]
+        message_length = self._check_length(header)
+        if available < PREFIX_SIZE + message_length:
+            return None
+        body_start = self._buf_start + PREFIX_SIZE
+        self._buf_start = body_start + message_length
+        return header, self._recv_view[body_start:self._buf_start]
+
+    def _fill_buffer(self) -> None:
+        """One recv_into at the buffer tail. Unparsed bytes are moved to the front
+        first when the tail cannot hold a maximum-size frame."""
+        if self._buf_start == self._buf_end:
+            self._buf_start = self._buf_end = 0
+        elif len(self._recv_buf) - self._buf_start < PREFIX_SIZE + LENGTH_LIMIT:
+            pending = self._buf_end - self._buf_start
+            self._recv_view[:pending] = self._recv_view[self._buf_start:self._buf_end]
+            self._buf_start, self._buf_end = 0, pending
+        try:
+            n = self.sock.recv_into(self._recv_view[self._buf_end:])
+        except socket.timeout:
+            raise TimeoutError("recv timeout") from None
+        if not n:
+            raise ConnectionError("Connection closed")
+        self._buf_end += n
     
     def close(self) -> None:
         try:
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Optional
+from base.message_format_passer import MessageFormatPasser
+from base.peer_worker import PeerWorker, WindowFullError
+
+DEFAULT_PEER_POOL_SIZE = 4
+DEFAULT_MAX_CONSECUTIVE_FAILURES = 3
+
+
+class PoolMember:
+    """One connection slot of a PeerPool and its health record."""
+    __slots__ = ("index", "passer", "worker", "outstanding", "requests", "failures",
+                 "consecutive_failures", "connects", "last_error", "last_success_time")
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.passer: Optional[MessageFormatPasser] = None
+        self.worker: Optional[PeerWorker] = None  # set while the connection is up
+        self.outstanding = 0  # requests routed here and not answered yet
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.connects = 0
+        self.last_error: Optional[str] = None
+        self.last_success_time: Optional[float] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.worker is not None and not self.worker.conn_loss_event.is_set()
+
+    def health(self) -> dict:
+        return {
+            "index": self.index,
+            "connected": self.connected,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "connects": self.connects,
+            "last_error": self.last_error,
+        }
+
+
+class PeerPool:
+    """N connections (one PeerWorker each) to the same peer.
+
+    Every slot is kept up by its owner (ServerBase.interact_to_db_loop) through
+    attach / detach. pend_and_wait routes each request to the connected member
+    with the fewest outstanding requests; members whose last
+    max_consecutive_failures requests failed are only used when nothing else
+    is connected.
+    """
+    def __init__(self, size: int = DEFAULT_PEER_POOL_SIZE, name: str = "peer",
+                 max_consecutive_failures: int = DEFAULT_MAX_CONSECUTIVE_FAILURES) -> None:
+        if size <= 0:
+            raise ValueError("Pool size must be positive")
+        self.name = name
+        self.max_consecutive_failures = max_consecutive_failures
+        self.members = [PoolMember(i) for i in range(size)]
+        self.lock = threading.Lock()
+
+    def attach(self, index: int, worker: PeerWorker) -> None:
+        member = self.members[index]
+        with self.lock:
+            member.worker = worker
+            member.connects += 1
+            member.consecutive_failures = 0
+
+    def detach(self, index: int) -> None:
+        with self.lock:
+            self.members[index].worker = None
+
+    @property
+    def connected_count(self) -> int:
+        return sum(1 for member in self.members if member.connected)
+
+    def health(self) -> list[dict]:
+        return [member.health() for member in self.members]
+
+    def pend_and_wait(self, message_type: str, data: dict, timeout: Optional[float] = None) -> dict:
+        """PeerWorker.pend_and_wait on the least loaded connection.
+        ConnectionError when no connection is up."""
+        member, worker = self._acquire()
+        try:
+            response = worker.pend_and_wait(message_type, data, timeout)
+        except WindowFullError:
+            raise  # busy, not broken
+        except Exception as e:
+            self._record(member, e)
+            raise
+        else:
+            self._record(member, None)
+            return response
+        finally:
+            with self.lock:
+                member.outstanding -= 1
+
+    def _acquire(self) -> tuple[PoolMember, PeerWorker]:
+        with self.lock:
+            connected = [m for m in self.members if m.connected]
+            if not connected:
+                raise ConnectionError(f"no {self.name} connection is up")
+            healthy = [m for m in connected if m.consecutive_failures < self.max_consecutive_failures]
+            member = min(healthy or connected, key=lambda m: m.outstanding)
+            member.outstanding += 1
+            member.requests += 1
+            worker = member.worker
+            assert worker is not None
+            return member, worker
+
+    def _record(self, member: PoolMember, error: Optional[Exception]) -> None:
+        with self.lock:
+            if error is None:
+                member.consecutive_failures = 0
+                member.last_success_time = time.time()
+                return
+            member.failures += 1
+            member.consecutive_failures += 1
+            member.last_error = f"{type(error).__name__}: {error}"
+            if member.consecutive_failures == self.max_consecutive_failures:
+                print(f"[PeerPool] {self.name} connection {member.index} marked unhealthy: {member.last_error}")
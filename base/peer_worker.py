@@ -1,4 +1,5 @@
 from __future__ import annotations
+import queue
 import threading
 import time
 import uuid
@@ -6,11 +7,36 @@ from typing import Callable, Optional, Tuple, Dict
 from base.message_format_passer import MessageFormatPasser
 from protocols.protocols import Formats, Words
 
+SEND_BATCH_LIMIT = 64
+DEFAULT_MAX_IN_FLIGHT = 128
+
+
+class WindowFullError(TimeoutError):
+    """No free slot in the in-flight window before the caller's timeout."""
+
+
+class PendingRequest:
+    """A request waiting for its response. `done` is set by the recv thread
+    as soon as the response arrives, or by the worker when the connection dies."""
+    __slots__ = ("message_type", "data", "done", "response")
+
+    def __init__(self, message_type: str, data: dict) -> None:
+        self.message_type = message_type
+        self.data = data
+        self.done = threading.Event()
+        self.response: Optional[Tuple[str, dict]] = None
+
+
 class PeerWorker:
     """
     Generic peer worker:
     - owns a MessageFormatPasser
-    - handles pending messages {id: ((type, data), sent, recv)}
+    - keeps requests awaiting a response in pending_messages {id: PendingRequest}
+    - queues outbound messages in outbound_queue, drained by the send thread
+    - allows at most max_in_flight requests between pend_request and the end of
+      wait_response; further callers block (or fail fast with window_timeout=0).
+      Heartbeats use one reserved slot on top, so a window kept full by a slow
+      peer never reads as a dead one
     - runs send/recv/heartbeat threads
     - exposes pend_and_wait API
     """
@@ -23,6 +49,7 @@ class PeerWorker:
         on_recv_message: Optional[Callable[[Tuple[str, str, dict]], None]] = None,
         on_connection_lost: Optional[Callable[[], None]] = None,
         make_heartbeat: Optional[Callable[[], Tuple[str, dict]]] = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
     ) -> None:
         self.passer = passer
         self.receive_timeout = receive_timeout
@@ -31,12 +58,19 @@ class PeerWorker:
         self.on_recv_message = on_recv_message
         self.on_connection_lost = on_connection_lost
         self.make_heartbeat = make_heartbeat  # returns (msg_type, data) or None
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be positive")
+        self.max_in_flight = max_in_flight
 
         self.stop_event = threading.Event()
         self.conn_loss_event = threading.Event()
 
-        self.pending_messages: Dict[str, Tuple[Tuple[str, dict], bool, Optional[Tuple[str, dict]]]] = {}
+        self.pending_messages: Dict[str, PendingRequest] = {}
         self.pending_lock = threading.Lock()
+        # notified whenever a window slot frees up or the connection goes away
+        self.window_cond = threading.Condition(self.pending_lock)
+        # (message_id, message_type, data); None wakes the send thread up to exit
+        self.outbound_queue: queue.Queue[Optional[Tuple[str, str, dict]]] = queue.Queue()
 
         self.send_thread: Optional[threading.Thread] = None
         self.recv_thread: Optional[threading.Thread] = None
@@ -65,6 +99,8 @@ class PeerWorker:
         # Signal loops
         self.stop_event.set()
         self.conn_loss_event.set()
+        self.outbound_queue.put(None)
+        self._wake_pending()
         try:
             self.passer.close()
         except Exception:
@@ -73,58 +109,100 @@ class PeerWorker:
         self.join()
         
         # Cleanup pending
-        with self.pending_lock:
+        with self.window_cond:
             self.pending_messages.clear()
+            self.window_cond.notify_all()
         
 
-    def pend_request(self, message_type: str, data: dict) -> str:
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending_messages)
+
+    def pend_request(self, message_type: str, data: dict, window_timeout: Optional[float] = None,
+                     reserved: bool = False) -> str:
+        """Queue a request once the in-flight window has room. window_timeout=None
+        waits as long as it takes, 0 fails fast; WindowFullError when it runs out.
+        reserved (heartbeats only, one at a time) may take the slot beyond max_in_flight."""
         message_id = str(uuid.uuid4())
-        with self.pending_lock:
-            self.pending_messages[message_id] = ((message_type, data), False, None)
+        limit = self.max_in_flight + 1 if reserved else self.max_in_flight
+        with self.window_cond:
+            has_room = self.window_cond.wait_for(
+                lambda: len(self.pending_messages) < limit or self.conn_loss_event.is_set(),
+                window_timeout)
+            if self.conn_loss_event.is_set():
+                if self.stop_event.is_set():
+                    raise Exception("worker stopped")
+                raise ConnectionResetError("connection lost")
+            if not has_room:
+                raise WindowFullError(f"{self.max_in_flight} requests already in flight")
+            self.pending_messages[message_id] = PendingRequest(message_type, data)
+        self.outbound_queue.put((message_id, message_type, data))
         return message_id
 
     def wait_response(self, message_id: str, timeout: Optional[float] = None) -> dict:
-        deadline = time.monotonic() + (timeout if timeout is not None else float('inf'))
-        while not self.stop_event.is_set() and not self.conn_loss_event.is_set() and time.monotonic() < deadline:
-            with self.pending_lock:
-                entry = self.pending_messages.get(message_id)
-                if entry is not None:
-                    _, _, recv = entry
-                    if recv is not None:
-                        del self.pending_messages[message_id]
-                        return recv[1] # {responding_id: ..., result: ..., params: ...}
-                
-            time.sleep(0.05)
-
         with self.pending_lock:
-            self.pending_messages.pop(message_id, None)
-        if time.monotonic() >= deadline:
+            entry = self.pending_messages.get(message_id)
+        if entry is None:
+            raise KeyError(f"unknown message_id {message_id}")
+        got = entry.done.wait(timeout)
+
+        with self.window_cond:
+            if self.pending_messages.pop(message_id, None) is not None:
+                self.window_cond.notify()
+        if entry.response is not None:
+            return entry.response[1] # {responding_id: ..., result: ..., params: ...}
+        if not got:
             raise TimeoutError("timeout expired")
-        elif self.conn_loss_event.is_set():
-            raise ConnectionResetError("connection lost")
-        else:
+        elif self.stop_event.is_set():
             raise Exception("worker stopped")
+        else:
+            raise ConnectionResetError("connection lost")
+
+    def pend_and_wait(self, message_type: str, data: dict, timeout: Optional[float] = None,
+                      reserved: bool = False) -> dict:
+        """timeout covers both waiting for a window slot and waiting for the response."""
+        if timeout is None:
+            return self.wait_response(self.pend_request(message_type, data, None, reserved), None)
+        deadline = time.monotonic() + timeout
+        message_id = self.pend_request(message_type, data, timeout, reserved)
+        return self.wait_response(message_id, max(0.0, deadline - time.monotonic()))
 
-    def pend_and_wait(self, message_type: str, data: dict, timeout: Optional[float] = None) -> dict:
-        message_id = self.pend_request(message_type, data)
-        return self.wait_response(message_id, timeout)
+    def _wake_pending(self) -> None:
+        """Release every waiter; they see no response and raise."""
+        with self.window_cond:
+            entries = list(self.pending_messages.values())
+            self.window_cond.notify_all()
+        for entry in entries:
+            entry.done.set()
+
+    def _set_connection_lost(self) -> None:
+        if self.conn_loss_event.is_set():
+            return
+        self.conn_loss_event.set()
+        self.outbound_queue.put(None)
+        self._wake_pending()
+        if self.on_connection_lost:
+            self.on_connection_lost()
 
     def _send_loop(self):
         print("[Worker] Entered send_loop")
         while not self.stop_event.is_set() and not self.conn_loss_event.is_set():
+            batch = [self.outbound_queue.get()]
+            # whatever queued up meanwhile leaves in the same sendmsg
+            while batch[-1] is not None and len(batch) < SEND_BATCH_LIMIT:
+                try:
+                    batch.append(self.outbound_queue.get_nowait())
+                except queue.Empty:
+                    break
+            items = [item for item in batch if item is not None]
             try:
-                with self.pending_lock:
-                    for msg_id, (msg_tuple, is_sent, recv) in list(self.pending_messages.items()):
-                        if not is_sent:
-                            msg_type, data = msg_tuple
-                            self.passer.send_args(Formats.MESSAGE, msg_id, msg_type, data)
-                            self.pending_messages[msg_id] = (msg_tuple, True, recv)
+                if items:
+                    self.passer.send_many([self.passer.encode_args(Formats.MESSAGE, *item) for item in items])
             except Exception as e:
                 # Sending failed -> likely connection gone
-                self.conn_loss_event.set()
-                if self.on_connection_lost:
-                    self.on_connection_lost()
-            time.sleep(0.1)
+                self._set_connection_lost()
+            if batch[-1] is None:
+                break
         print("[Worker] Exited send_loop")
 
     def _recv_loop(self):
@@ -138,11 +216,11 @@ class PeerWorker:
                     responding_id = data[Words.DataKeys.Response.RESPONDING_ID]
                     with self.pending_lock:
                         entry = self.pending_messages.get(responding_id)
-                        if entry:
-                            msg_tuple, is_sent, _ = entry
-                            self.pending_messages[responding_id] = (msg_tuple, is_sent, (msg_type, data))
-                        else:
-                            print(f"[PeerWorker] received response with unknown responding_id: {data}")
+                    if entry:
+                        entry.response = (msg_type, data)
+                        entry.done.set()
+                    else:
+                        print(f"[PeerWorker] received response with unknown responding_id: {data}")
                 else:
                     # Push non-response messages to upper layer
                     if self.on_recv_message:
@@ -153,14 +231,10 @@ class PeerWorker:
                 continue
             except ConnectionError:
                 print("recv loop connectionerror")
-                self.conn_loss_event.set()
-                if self.on_connection_lost:
-                    self.on_connection_lost()
+                self._set_connection_lost()
             except Exception as e:
                 print(f"recv loop exception: {e}")
-                self.conn_loss_event.set()
-                if self.on_connection_lost:
-                    self.on_connection_lost()
+                self._set_connection_lost()
                 # print("exception here")
         # exit
         print("[Worker] Exited recv_loop")
@@ -169,34 +243,27 @@ class PeerWorker:
         if not self.make_heartbeat:
             return  # optional
         print("[Worker] Entered heartbeat_loop")
-        now = time.monotonic()
-        pre = now
-        remain = self.heartbeat_interval
         fail_count = 0
-        while not self.stop_event.is_set() and not self.conn_loss_event.is_set():
-            if remain <= 0:
-                remain = self.heartbeat_interval
-                try:
-                    hb_type, hb_data = self.make_heartbeat()
-                    hb_resp = self.pend_and_wait(hb_type, hb_data, self.heartbeat_interval / 2)
-                    rslt = hb_resp.get(Words.DataKeys.Response.RESULT)
-                    if rslt != Words.Result.SUCCESS:
-                        print(f"[Worker] Received handshake result: {rslt}, expected: {Words.Result.SUCCESS}")
-                        fail_count += 1
-                    else:
-                        fail_count = 0
-                except TimeoutError:
-                    print("[Worker] Handshake timeout expired.")
-                    fail_count += 1
-                except Exception as e:
-                    print(f"[Worker] Unknown exception occurred in heartbeat_loop: {e}")
+        # conn_loss_event is also set by stop(), so this wait ends on either
+        while not self.conn_loss_event.wait(self.heartbeat_interval):
+            try:
+                hb_type, hb_data = self.make_heartbeat()
+                hb_resp = self.pend_and_wait(hb_type, hb_data, self.heartbeat_interval / 2, reserved=True)
+                rslt = hb_resp.get(Words.DataKeys.Response.RESULT)
+                if rslt != Words.Result.SUCCESS:
+                    print(f"[Worker] Received handshake result: {rslt}, expected: {Words.Result.SUCCESS}")
                     fail_count += 1
+                else:
+                    fail_count = 0
+            except WindowFullError:
+                # a full window is backpressure, not a sign the peer is gone
+                continue
+            except TimeoutError:
+                print("[Worker] Handshake timeout expired.")
+                fail_count += 1
+            except Exception as e:
+                print(f"[Worker] Unknown exception occurred in heartbeat_loop: {e}")
+                fail_count += 1
             if fail_count >= self.heartbeat_patience:
-                self.conn_loss_event.set()
-                if self.on_connection_lost:
-                    self.on_connection_lost()
-            time.sleep(0.1)
-            now = time.monotonic()
-            remain -= now - pre
-            pre = now
-        print("[Worker] Exited heartbeat_loop")
\ No newline at end of file
+                self._set_connection_lost()
+        print("[Worker] Exited heartbeat_loop")
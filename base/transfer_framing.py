@@ -0,0 +1,57 @@
+"""Wire formats of the file transfer streams (FileSender -> FileReceiver).
+
+FRAMING_V1, what every peer reads: per chunk a 4-byte big-endian header
+length, a JSON header {"seq", "size"} and `size` payload bytes; a size 0
+chunk ends the file.
+
+FRAMING_V2 opens the stream with PREAMBLE (MAGIC, version, flags), then per
+chunk a fixed CHUNK header (seq, size), or CHUNK_CRC (seq, size, crc32 of
+the payload) when FLAG_CRC is set, and the payload; a size 0 chunk ends the
+file. Chunks can be as large as the sender likes (up to MAX_CHUNK_SIZE).
+MAGIC read as a v1 header length would be far beyond any JSON header, so a
+receiver tells the two apart from the first four bytes.
+
+FRAMING_V3 is FRAMING_V2 with a resume exchange after the preamble: the
+sender adds RESUME (file size, sha256 digest), the receiver answers with
+OFFSET, the bytes of that file it already holds from an interrupted
+transfer, and the chunks carry the file from there on. The receiver
+verifies the sha256 of the whole file at the end.
+
+The framing is negotiated on the control connection before the transfer:
+the receiving side lists the framings it reads under
+ParamKeys.Transfer.FRAMINGS (the DOWNLOAD_START request, the UPLOAD_START
+response) and the sender picks with choose_framing. Peers that list nothing
+get FRAMING_V1.
+"""
+import struct
+
+FRAMING_V1 = 1
+FRAMING_V2 = 2
+FRAMING_V3 = 3
+SUPPORTED_FRAMINGS = (FRAMING_V3, FRAMING_V2, FRAMING_V1)  # most preferred first
+
+MAGIC = b"\xf7FT"
+PREAMBLE = struct.Struct("!3sBB")  # magic, version, flags
+CHUNK = struct.Struct("!II")  # seq, size
+CHUNK_CRC = struct.Struct("!III")  # seq, size, crc32
+RESUME = struct.Struct("!Q32s")  # file size, sha256 digest
+OFFSET = struct.Struct("!Q")  # where the sender starts
+FLAG_CRC = 0x01
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 0xFFFFFFFF
+
+
+def offer_framings() -> list[int]:
+    """What to announce under ParamKeys.Transfer.FRAMINGS as a receiver."""
+    return list(SUPPORTED_FRAMINGS)
+
+
+def choose_framing(offered) -> int:
+    """The framing to send with, given the receiver's FRAMINGS list (None or
+    anything malformed from peers that predate the negotiation)."""
+    if isinstance(offered, list):
+        for framing in SUPPORTED_FRAMINGS:
+            if framing in offered:
+                return framing
+    return FRAMING_V1
@@ -95,8 +95,9 @@ class ClientBase:
                 # 呼叫 send_args 或其他 handshake 流程
                 self.server_passer.settimeout(self.handshake_timeout)
                 message_id = str(uuid.uuid4())
-                self.server_passer.send_args(Formats.MESSAGE, message_id, Words.MessageType.HANDSHAKE, 
-                                            {Words.DataKeys.Handshake.ROLE: self.role})
+                handshake_data = {Words.DataKeys.Handshake.ROLE: self.role}
+                handshake_data.update(self.server_passer.handshake_offer())
+                self.server_passer.send_args(Formats.MESSAGE, message_id, Words.MessageType.HANDSHAKE, handshake_data)
                 
                 _, message_type, data = self.server_passer.receive_args(Formats.MESSAGE)
 
@@ -119,6 +120,7 @@ class ClientBase:
                     print(f"[Client] {error_message}")
                     raise Exception(error_message)
                 
+                self.server_passer.apply_negotiated(data.get(Words.DataKeys.PARAMS))
                 return True
             except Exception as e:
                 attempt += 1
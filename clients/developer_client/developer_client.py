@@ -9,6 +9,7 @@ from protocols.protocols import Formats, Words
 from clients.client_base import ClientBase
 from pathlib import Path
 from base.file_sender import FileSender
+from base.transfer_framing import choose_framing
 import hashlib
 # from datetime import datetime, timezone
 import zipfile
@@ -23,6 +24,7 @@ DEFAULT_RECEIVE_TIMEOUT = 1.0
 DEFAULT_HEARTBEAT_INTERVAL = 10.0
 DEFAULT_HEARTBEAT_PATIENCE = 3
 DEFAULT_LOBBY_RESPONSE_TIMEOUT = 5.0
+DEFAULT_UPLOAD_ATTEMPTS = 3  # a broken-off transfer is retried and resumes where it stopped
 
 
 class DeveloperClient(ClientBase):
@@ -88,49 +90,57 @@ class DeveloperClient(ClientBase):
                 game_name = manifest.get("name") or game_name
                 players = manifest.get("players") or players
 
-            # start sending
-            assert self.worker is not None
-            response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
-                Words.DataKeys.Request.COMMAND: Words.Command.UPLOAD_START, 
-                Words.DataKeys.PARAMS: {
-                            Words.ParamKeys.Metadata.GAME_ID: game_id,
-                            Words.ParamKeys.Metadata.GAME_NAME: game_name, 
-                            Words.ParamKeys.Metadata.VERSION: version,
-                            Words.ParamKeys.Metadata.FILE_NAME: path.name,
-                            Words.ParamKeys.Metadata.PLAYERS: players, 
-                            Words.ParamKeys.Metadata.SIZE: size,
-                            Words.ParamKeys.Metadata.SHA256: sha256,
-                            # Optional: echo manifest details for server-side validation
-                            # "manifest": {"min_players": manifest.get("min_players"), "max_players": manifest.get("max_players")}
-                        }
-            }, self.server_response_timeout)
+            reason = "Upload end rejected"
+            for attempt in range(DEFAULT_UPLOAD_ATTEMPTS):
+                # start sending
+                assert self.worker is not None
+                response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
+                    Words.DataKeys.Request.COMMAND: Words.Command.UPLOAD_START, 
+                    Words.DataKeys.PARAMS: {
+                                Words.ParamKeys.Metadata.GAME_ID: game_id,
+                                Words.ParamKeys.Metadata.GAME_NAME: game_name, 
+                                Words.ParamKeys.Metadata.VERSION: version,
+                                Words.ParamKeys.Metadata.FILE_NAME: path.name,
+                                Words.ParamKeys.Metadata.PLAYERS: players, 
+                                Words.ParamKeys.Metadata.SIZE: size,
+                                Words.ParamKeys.Metadata.SHA256: sha256,
+                                # Optional: echo manifest details for server-side validation
+                                # "manifest": {"min_players": manifest.get("min_players"), "max_players": manifest.get("max_players")}
+                            }
+                }, self.server_response_timeout)
 
-            if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
-                params = response.get(Words.DataKeys.PARAMS) or {}
-                reason = params.get(Words.ParamKeys.Failure.REASON, "Upload start rejected")
-                return (False, {Words.ParamKeys.Failure.REASON: reason})
-            
-            params = response.get(Words.DataKeys.PARAMS)
-            assert isinstance(params, dict)
-            port = params.get(Words.ParamKeys.Success.PORT)
-            temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            assert isinstance(port, int)
-            temp_sock.connect((self.host, port))
-            temp_sender = FileSender(temp_sock, path)
-            temp_sender.send()
+                if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                    params = response.get(Words.DataKeys.PARAMS) or {}
+                    reason = params.get(Words.ParamKeys.Failure.REASON, "Upload start rejected")
+                    return (False, {Words.ParamKeys.Failure.REASON: reason})
+                
+                params = response.get(Words.DataKeys.PARAMS)
+                assert isinstance(params, dict)
+                port = params.get(Words.ParamKeys.Success.PORT)
+                temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                assert isinstance(port, int)
+                temp_sender = FileSender(temp_sock, path, framing=choose_framing(params.get(Words.ParamKeys.Transfer.FRAMINGS)), 
+                                         sha256=sha256)
+                try:
+                    temp_sock.connect((self.host, port))
+                    temp_sender.send()
+                except OSError as e:
+                    # UPLOAD_END below reports the failure; the next attempt resumes
+                    print(f"[DeveloperClient] upload of {path.name} broke off: {e}")
+                finally:
+                    temp_sender.close()
 
-            # end sending
-            response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
-                Words.DataKeys.Request.COMMAND: Words.Command.UPLOAD_END
-            }, self.server_response_timeout)
+                # end sending
+                response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
+                    Words.DataKeys.Request.COMMAND: Words.Command.UPLOAD_END
+                }, self.server_response_timeout)
 
-            if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                if response.get(Words.DataKeys.Response.RESULT) == Words.Result.SUCCESS:
+                    return (True, {})
                 params = response.get(Words.DataKeys.PARAMS) or {}
                 reason = params.get(Words.ParamKeys.Failure.REASON, "Upload end rejected")
-                return (False, {Words.ParamKeys.Failure.REASON: reason})
-
-            temp_sender.close()
-            return (True, {})
+                print(f"[DeveloperClient] upload attempt {attempt + 1} of {path.name} failed: {reason}")
+            return (False, {Words.ParamKeys.Failure.REASON: reason})
 
         except Exception as e:
             return (False, {Words.ParamKeys.Failure.REASON: str(e)})
@@ -9,6 +9,7 @@ from protocols.protocols import Formats, Words
 from clients.client_base import ClientBase
 import socket
 from base.file_receiver import FileReceiver
+from base.transfer_framing import offer_framings
 from pathlib import Path
 import shutil
 
@@ -20,6 +21,7 @@ DEFAULT_RECEIVE_TIMEOUT = 1.0
 DEFAULT_HEARTBEAT_INTERVAL = 10.0
 DEFAULT_HEARTBEAT_PATIENCE = 3
 DEFAULT_LOBBY_RESPONSE_TIMEOUT = 5.0
+DEFAULT_DOWNLOAD_ATTEMPTS = 3  # a broken-off download is retried and resumes where it stopped
 
 GAME_DIR = Path(__file__).resolve().parent / "games"
 
@@ -70,33 +72,70 @@ class PlayerClient(ClientBase):
             return (False, params)
         return (True, params)
     
-    def try_download_game(self, game_id: str) -> tuple[bool, dict]:
+    def try_query_store(self, name: Optional[str] = None, players: Optional[int] = None,
+                        uploader: Optional[str] = None, sort: Optional[str] = None, descending: bool = False,
+                        limit: Optional[int] = None, cursor: Optional[str] = None) -> tuple[bool, dict]:
+        """One page of the store. On success params holds StoreStatus.GAMES (a list of
+        metadata) and StoreQuery.NEXT_CURSOR (pass it back as cursor for the next page)."""
+        query = {
+            Words.ParamKeys.StoreQuery.NAME: name,
+            Words.ParamKeys.StoreQuery.PLAYERS: players,
+            Words.ParamKeys.StoreQuery.UPLOADER: uploader,
+            Words.ParamKeys.StoreQuery.SORT: sort,
+            Words.ParamKeys.StoreQuery.DESCENDING: descending,
+            Words.ParamKeys.StoreQuery.LIMIT: limit,
+            Words.ParamKeys.StoreQuery.CURSOR: cursor,
+        }
         try:
             assert self.worker is not None
             response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
-                Words.DataKeys.Request.COMMAND: Words.Command.DOWNLOAD_START, 
-                Words.DataKeys.PARAMS: {
-                    Words.ParamKeys.Metadata.GAME_ID: game_id
-                }
-            }, self.server_response_timeout)
+                Words.DataKeys.Request.COMMAND: Words.Command.QUERY_STORE,
+                Words.DataKeys.PARAMS: {k: v for k, v in query.items() if v is not None}
+                }, self.server_response_timeout)
         except Exception as e:
             return (False, {'error': str(e)})
         params = response.get(Words.DataKeys.PARAMS)
         assert isinstance(params, dict)
         if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
             return (False, params)
-        port = params.get(Words.ParamKeys.Success.PORT)
-        temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        temp_sock.connect((self.host, port))
+        return (True, params)
+
+    def try_download_game(self, game_id: str) -> tuple[bool, dict]:
         assert self.username is not None
         file_path = GAME_DIR / self.username / game_id / (game_id + ".zip")
         dest_dir = GAME_DIR / self.username / game_id
-        file_receiver = FileReceiver(temp_sock, file_path)
-        success = file_receiver.receive()
-        if not success:
-            return (False, {Words.ParamKeys.Failure.REASON: "file receiver error"})
-        shutil.unpack_archive(file_path, dest_dir)
-        return (True, {})
+        for attempt in range(DEFAULT_DOWNLOAD_ATTEMPTS):
+            try:
+                assert self.worker is not None
+                response = self.worker.pend_and_wait(Words.MessageType.REQUEST, {
+                    Words.DataKeys.Request.COMMAND: Words.Command.DOWNLOAD_START, 
+                    Words.DataKeys.PARAMS: {
+                        Words.ParamKeys.Metadata.GAME_ID: game_id, 
+                        Words.ParamKeys.Transfer.FRAMINGS: offer_framings()
+                    }
+                }, self.server_response_timeout)
+            except Exception as e:
+                return (False, {'error': str(e)})
+            params = response.get(Words.DataKeys.PARAMS)
+            assert isinstance(params, dict)
+            if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                return (False, params)
+            port = params.get(Words.ParamKeys.Success.PORT)
+            temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            file_receiver = FileReceiver(temp_sock, file_path)
+            try:
+                temp_sock.connect((self.host, port))
+                success = file_receiver.receive()
+            except OSError:
+                success = False
+            finally:
+                file_receiver.close()
+            if success:
+                shutil.unpack_archive(file_path, dest_dir)
+                return (True, {})
+            # the partial file is kept, the next attempt resumes from it
+            print(f"[PlayerClient] download attempt {attempt + 1} of {game_id} failed")
+        return (False, {Words.ParamKeys.Failure.REASON: "file receiver error"})
     
     def try_create_room(self, room_name: str, game_id: str)  -> tuple[bool, dict]:
         try:
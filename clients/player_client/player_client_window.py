@@ -23,6 +23,8 @@ HOVER_LABEL_COLOR = "#295fff"
 CLICK_LABEL_COLOR = "#1f4fcc"
 
 GAME_DIR = Path(__file__).resolve().parent / "games"
+STORE_PAGE_SIZE = 50
+STORE_MORE_KEY = "__more__"  # ObjectList key of the "load the next page" row
 
 class PlayerClientWindow(ClientWindowBase):
     # LOGIN_TIMEOUT = 5.0
@@ -47,8 +49,14 @@ class PlayerClientWindow(ClientWindowBase):
         
         self.store_frame = customtkinter.CTkFrame(master=self.home_frame, corner_radius=0, width=800, height=560)
         customtkinter.CTkLabel(master=self.store_frame, text="store!").place(relx=0.5, rely=0.5, anchor=tkinter.CENTER)
-        self.game_list = ObjectList(self.store_frame, width=780, height=560)
-        self.game_list.place(relx=0, rely=0)
+        self.store_search_inputbox = customtkinter.CTkEntry(master=self.store_frame, width=300, placeholder_text="Search games")
+        self.store_search_inputbox.place(x=10, y=8)
+        self.store_search_btn = customtkinter.CTkButton(master=self.store_frame, text="Search", width=80, command=self.update_store)
+        self.store_search_btn.place(x=320, y=8)
+        self.game_list = ObjectList(self.store_frame, width=780, height=510)
+        self.game_list.place(x=0, y=48)
+        self.store_query_name: Optional[str] = None
+        self.store_next_cursor: Optional[str] = None
 
 
         self.my_games_frame = customtkinter.CTkFrame(master=self.home_frame, corner_radius=0, width=800, height=560)
@@ -519,23 +527,39 @@ class PlayerClientWindow(ClientWindowBase):
                 pass
 
     def update_store(self):
-        threading.Thread(target=self._update_store_thread).start()
+        # first page of the store, filtered by the search box
+        self.store_query_name = self.store_search_inputbox.get().strip() or None
+        threading.Thread(target=self._update_store_thread, args=(self.store_query_name, None)).start()
 
-    def _update_store_thread(self):
+    def load_more_store(self):
+        if self.store_next_cursor:
+            threading.Thread(target=self._update_store_thread, args=(self.store_query_name, self.store_next_cursor)).start()
+
+    def _update_store_thread(self, name: Optional[str], cursor: Optional[str]):
         try:
             assert isinstance(self.client, PlayerClient)
-            success, params = self.client.try_update_store()
-            self.app.after(0, self._on_update_store_result_ui, success, params)
+            success, params = self.client.try_query_store(name=name, limit=STORE_PAGE_SIZE, cursor=cursor)
+            self.app.after(0, self._on_update_store_result_ui, success, params, cursor is not None)
         except Exception as e:
             print(f"[PlayerClientWindow] Exception in _update_store_thread: {e}")
 
-    def _on_update_store_result_ui(self, success: bool, params: dict):
+    def _on_update_store_result_ui(self, success: bool, params: dict, append: bool = False):
         if success:
-            # Build rows: key=text=username; disable invite on yourself
             def make_actions(u: str):
                 enabled = True
                 return [("Download", (lambda: self.download_game(u)), enabled)]
-            self.game_list.set_items([(u, params[u][Words.ParamKeys.Metadata.GAME_NAME]) for u in params], make_actions)
+            games = params.get(Words.ParamKeys.StoreStatus.GAMES) or []
+            items = [(g[Words.ParamKeys.Metadata.GAME_ID], g.get(Words.ParamKeys.Metadata.GAME_NAME) or g[Words.ParamKeys.Metadata.GAME_ID]) for g in games]
+            if append:
+                # only the new page is rendered; rows already shown stay as they are
+                self.game_list.remove_item(STORE_MORE_KEY)
+                for key, text in items:
+                    self.game_list.add_item(key, text, make_actions(key))
+            else:
+                self.game_list.set_items(items, make_actions)
+            self.store_next_cursor = params.get(Words.ParamKeys.StoreQuery.NEXT_CURSOR)
+            if self.store_next_cursor:
+                self.game_list.add_item(STORE_MORE_KEY, "...", [("More", self.load_more_store, True)])
         else:
             print(f"update failed. Params: {params}")
 
@@ -33,6 +33,7 @@ class Words:
         DOWNLOAD_START = 'download_start'
         CHECK_GAME_VALID = 'check_game_valid'
         CHECK_STORE = 'check_store'
+        QUERY_STORE = 'query_store'
         CREATE_ROOM = 'create_room'
         JOIN_ROOM = 'join_room'
         LEAVE_ROOM = 'leave_room'
@@ -47,6 +48,8 @@ class Words:
         PARAMS = 'params'
         class Handshake:
             ROLE = 'role'
+            COMPRESSION = 'compression'
+            MAX_MESSAGE_SIZE = 'max_message_size'
         class Response:
             RESPONDING_ID = 'responding_id'
             RESULT = 'result'
@@ -55,6 +58,9 @@ class Words:
         class Event:
             EVENT_NAME = 'event_name'
     class ParamKeys:
+        class Handshake:
+            COMPRESSION = 'compression'
+            MAX_MESSAGE_SIZE = 'max_message_size'
         class Login:
             USERNAME = 'username'
             PASSWORD = 'password'
@@ -74,6 +80,11 @@ class Words:
             ROOMS = 'rooms'
         class Success:
             PORT = 'port'
+        class Upload:
+            UPLOAD_ID = 'upload_id'
+        class Transfer:
+            # file transfer framings the receiving side reads, see base.transfer_framing
+            FRAMINGS = 'transfer_framings'
         class Metadata:
             GAME_ID = 'game_id'
             GAME_NAME = 'game_name'
@@ -87,6 +98,16 @@ class Words:
             ALL_VERSIONS = 'all_versions'
         class StoreStatus:
             GAMES = 'games'
+        class StoreQuery:
+            # filters; sort is one of the Metadata keys GAME_NAME, GAME_ID, PLAYERS, UPLOADER, SIZE
+            NAME = 'name'
+            PLAYERS = 'players'
+            UPLOADER = 'uploader'
+            SORT = 'sort'
+            DESCENDING = 'descending'
+            LIMIT = 'limit'
+            CURSOR = 'cursor'
+            NEXT_CURSOR = 'next_cursor'
         class CheckInfo:
             USERNAME = 'username'
         class Room:
@@ -106,4 +127,6 @@ class Words:
     class Result:
         SUCCESS = 'success'
         FAILURE = 'failure'
+    class Compression:
+        ZLIB = 'zlib'
     
\ No newline at end of file
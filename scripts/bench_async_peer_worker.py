@@ -0,0 +1,144 @@
+"""Exercise and time AsyncMessageFormatPasser / AsyncPeerWorker against a real server.
+
+Starts a DatabaseServer on loopback, connects to it with an asyncio passer,
+runs the HANDSHAKE (compression negotiated as usual), then
+issues N requests through AsyncPeerWorker.pend_and_wait with up to
+`concurrency` in flight while heartbeats run. The request uses an unknown
+command so the database answers immediately without touching its data.
+
+Then checks heartbeat loss: a peer that accepts the connection but never
+answers must be declared lost after heartbeat_patience missed heartbeats,
+and a request pending on it must fail with ConnectionResetError.
+
+Usage: python -m scripts.bench_async_peer_worker [iterations] [concurrency]
+"""
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from base.async_message_format_passer import AsyncMessageFormatPasser
+from base.async_peer_worker import AsyncPeerWorker
+from protocols.protocols import Words
+from servers.database_server.database_server import DatabaseServer
+
+DEFAULT_ITERATIONS = 2000
+DEFAULT_CONCURRENCY = 16
+HEARTBEAT_INTERVAL = 0.2
+HEARTBEAT_PATIENCE = 2
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _make_heartbeat() -> tuple[str, dict]:
+    return (Words.MessageType.HEARTBEAT, {})
+
+
+async def _connect(port: int, timeout: float = 10.0) -> AsyncMessageFormatPasser:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await AsyncMessageFormatPasser.connect("127.0.0.1", port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError("database server did not come up")
+            await asyncio.sleep(0.05)
+
+
+async def _round_trips(db_port: int, iterations: int, concurrency: int) -> dict:
+    passer = await _connect(db_port)
+    await passer.handshake(Words.Roles.LOBBYSERVER, timeout=5)
+    lost = asyncio.Event()
+    worker = AsyncPeerWorker(passer, HEARTBEAT_INTERVAL, HEARTBEAT_PATIENCE,
+                             on_connection_lost=lost.set, make_heartbeat=_make_heartbeat)
+    worker.start()
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            response = await worker.pend_and_wait("bench_noop", {}, 5)
+            samples.append((time.perf_counter() - start) * 1000)
+            if Words.DataKeys.Response.RESULT not in response:
+                raise RuntimeError(f"malformed response: {response}")
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    wall = time.perf_counter() - wall_start
+    # idle long enough for several heartbeats; a live server must answer them all
+    await asyncio.sleep(HEARTBEAT_INTERVAL * (HEARTBEAT_PATIENCE + 2))
+    if lost.is_set():
+        raise RuntimeError("live connection was declared lost")
+    await worker.stop()
+    return {
+        "iterations": len(samples),
+        "concurrency": concurrency,
+        "requests_per_s": len(samples) / wall,
+        "p50_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+async def _heartbeat_loss() -> float:
+    """Seconds until a silent peer is declared lost."""
+    async def silent(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while await reader.read(65536):
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    lost = asyncio.Event()
+    worker = AsyncPeerWorker(await _connect(port), HEARTBEAT_INTERVAL, HEARTBEAT_PATIENCE,
+                             on_connection_lost=lost.set, make_heartbeat=_make_heartbeat)
+    start = time.perf_counter()
+    worker.start()
+    pending = asyncio.create_task(worker.pend_and_wait("bench_noop", {}))
+    limit = HEARTBEAT_INTERVAL * 1.5 * (HEARTBEAT_PATIENCE + 1) + 1
+    try:
+        await asyncio.wait_for(lost.wait(), limit)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"silent peer not declared lost within {limit:.1f} s") from None
+    elapsed = time.perf_counter() - start
+    try:
+        await pending
+        raise RuntimeError("request on a lost connection returned")
+    except ConnectionResetError:
+        pass
+    await worker.stop()
+    server.close()
+    await server.wait_closed()
+    return elapsed
+
+
+def run(iterations: int = DEFAULT_ITERATIONS, concurrency: int = DEFAULT_CONCURRENCY) -> dict:
+    db_port = _free_port()
+    db = DatabaseServer(host="127.0.0.1", port=db_port)
+    threading.Thread(target=db.run, daemon=True).start()
+    try:
+        result = asyncio.run(_round_trips(db_port, iterations, concurrency))
+    finally:
+        db.stop()
+    result["loss_detected_s"] = asyncio.run(_heartbeat_loss())
+    return result
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    c = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CONCURRENCY
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = run(n, c)
+    print(f"async pend_and_wait x{result['iterations']} (concurrency {result['concurrency']}): "
+          f"{result['requests_per_s']:.0f} req/s  "
+          f"p50={result['p50_ms']:.2f} ms  mean={result['mean_ms']:.2f} ms")
+    print(f"silent peer declared lost after {result['loss_detected_s']:.2f} s "
+          f"(heartbeat every {HEARTBEAT_INTERVAL} s, patience {HEARTBEAT_PATIENCE})")
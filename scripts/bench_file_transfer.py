@@ -0,0 +1,93 @@
+"""Throughput benchmark for FileSender -> FileReceiver over loopback TCP.
+
+Sends a temporary file of size_mb random bytes `repeats` times in each
+FileSender mode and reports MB/s per mode. v1 is the JSON-header framing
+(chunked: CHUNK_MAX frames built in Python; single frame: one frame sent with
+socket.sendfile, opt-in), v2 the binary framing of base.transfer_framing with
+DEFAULT_CHUNK_SIZE chunks, plain, with sendfile, and with per-chunk CRC.
+Every received file is checked against the source.
+
+Usage: python -m scripts.bench_file_transfer [size_mb] [repeats]
+"""
+import hashlib
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from base.file_receiver import FileReceiver
+from base.file_sender import FileSender
+from base.transfer_framing import FRAMING_V1, FRAMING_V2
+
+DEFAULT_SIZE_MB = 64
+DEFAULT_REPEATS = 5
+MODES = {  # name -> FileSender keyword arguments
+    "v1 chunked": {"framing": FRAMING_V1},
+    "v1 single frame": {"framing": FRAMING_V1, "v1_single_frame": True},
+    "v2": {"framing": FRAMING_V2, "zero_copy": False},
+    "v2 zero-copy": {"framing": FRAMING_V2, "zero_copy": True},
+    "v2 crc": {"framing": FRAMING_V2, "crc": True},
+}
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _transfer(src: Path, dst: Path, **sender_options) -> float:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        result = {}
+
+        def receive():
+            conn, _ = listener.accept()
+            with conn:
+                result["ok"] = FileReceiver(conn, dst).receive()
+
+        receiver = threading.Thread(target=receive, daemon=True)
+        receiver.start()
+        start = time.perf_counter()
+        with socket.create_connection(listener.getsockname()) as sock:
+            FileSender(sock, src, **sender_options).send()
+            receiver.join()
+        elapsed = time.perf_counter() - start
+    if not result.get("ok"):
+        raise RuntimeError("FileReceiver.receive failed")
+    return elapsed
+
+
+def run(size_mb: int = DEFAULT_SIZE_MB, repeats: int = DEFAULT_REPEATS) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "game.zip"
+        with src.open("wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+        expected = _sha256(src)
+        for mode, sender_options in MODES.items():
+            rates = []
+            for i in range(repeats):
+                dst = Path(tmp) / f"{mode}-{i}.zip".replace(" ", "-")
+                elapsed = _transfer(src, dst, **sender_options)
+                if _sha256(dst) != expected:
+                    raise RuntimeError(f"{mode}: received file differs from the source")
+                dst.unlink()
+                rates.append(size_mb / elapsed)
+            results[mode] = {"median_mbps": statistics.median(rates), "best_mbps": max(rates)}
+    return results
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE_MB
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_REPEATS
+    for mode, stats in run(size_mb, repeats).items():
+        print(f"{mode:>15}: {size_mb} MiB x{repeats}  median {stats['median_mbps']:.0f} MB/s  best {stats['best_mbps']:.0f} MB/s")
@@ -0,0 +1,73 @@
+"""Encode/decode throughput benchmark for `Formats.MESSAGE`.
+
+Times `to_json` / `to_arg_list` with validation on and off on a typical
+lobby request, then on a typical response. Frame sizes are printed too.
+
+Usage: python -m scripts.bench_message_format [iterations]
+"""
+import sys
+import time
+import uuid
+
+from protocols.protocols import Formats, Words
+
+DEFAULT_ITERATIONS = 100000
+
+
+def _sample_args() -> tuple:
+    data = {
+        Words.DataKeys.Request.COMMAND: Words.Command.LOGIN,
+        Words.DataKeys.PARAMS: {
+            Words.ParamKeys.Login.USERNAME: "player1",
+            Words.ParamKeys.Login.PASSWORD: "secret",
+        },
+    }
+    return (str(uuid.uuid4()), Words.MessageType.REQUEST, data)
+
+
+def _sample_response() -> tuple:
+    data = {
+        Words.DataKeys.Response.RESPONDING_ID: str(uuid.uuid4()),
+        Words.DataKeys.Response.RESULT: Words.Result.SUCCESS,
+        Words.DataKeys.PARAMS: {Words.ParamKeys.Success.PORT: 34567},
+    }
+    return (str(uuid.uuid4()), Words.MessageType.RESPONSE, data)
+
+
+def _rate(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return iterations / (time.perf_counter() - start)
+
+
+def run(iterations: int = DEFAULT_ITERATIONS) -> dict:
+    fmt = Formats.MESSAGE
+    args = _sample_args()
+    json_str = fmt.to_json(*args)
+    response = _sample_response()
+    response_json = fmt.to_json(*response)
+    return {
+        "json encode": _rate(lambda: fmt.to_json(*args), iterations),
+        "json encode (no validation)": _rate(lambda: fmt.to_json(*args, validate=False), iterations),
+        "json decode": _rate(lambda: fmt.to_arg_list(json_str), iterations),
+        "json decode (no validation)": _rate(lambda: fmt.to_arg_list(json_str, False), iterations),
+        "response json encode": _rate(lambda: fmt.to_json(*response), iterations),
+        "response json decode": _rate(lambda: fmt.to_arg_list(response_json), iterations),
+    }
+
+
+def frame_sizes() -> dict:
+    fmt = Formats.MESSAGE
+    sizes = {}
+    for name, args in (("request", _sample_args()), ("response", _sample_response())):
+        sizes[name] = len(fmt.to_json(*args).encode("utf-8"))
+    return sizes
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    for name, rate in run(n).items():
+        print(f"{name:<30} {rate / 1000:8.1f} k msg/s")
+    for name, size in frame_sizes().items():
+        print(f"{name:<30} {size:8d} bytes")
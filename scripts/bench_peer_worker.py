@@ -0,0 +1,103 @@
+"""Round-trip latency benchmark for lobby -> database `try_request_and_wait`.
+
+Starts a real DatabaseServer and a ServerBase (lobby role) on loopback, then
+times N requests through `ServerBase.try_request_and_wait`. The request uses an
+unknown command so the database answers immediately without touching its data.
+With threads > 1 the requests are issued from that many threads at once and
+spread over a database connection pool of db_pool_size.
+
+Usage: python -m scripts.bench_peer_worker [iterations] [threads] [db_pool_size]
+"""
+import contextlib
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from protocols.protocols import Words
+from servers.database_server.database_server import DatabaseServer
+from servers.server_base import ServerBase, DEFAULT_DB_POOL_SIZE
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_THREADS = 1
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run(iterations: int = DEFAULT_ITERATIONS, threads: int = DEFAULT_THREADS, 
+        db_pool_size: int = DEFAULT_DB_POOL_SIZE) -> dict:
+    db_port = _free_port()
+    db = DatabaseServer(host="127.0.0.1", port=db_port)
+    db_thread = threading.Thread(target=db.run, daemon=True)
+    db_thread.start()
+
+    lobby = ServerBase("127.0.0.1", _free_port(), "127.0.0.1", db_port, Words.Roles.LOBBYSERVER, 
+                       db_pool_size=db_pool_size)
+    lobby.stop_event.clear()
+    lobby_threads = [threading.Thread(target=lobby.interact_to_db_loop, args=(i,), daemon=True) 
+                     for i in range(db_pool_size)]
+    for thread in lobby_threads:
+        thread.start()
+
+    deadline = time.monotonic() + 10
+    while lobby.db_pool.connected_count < db_pool_size:
+        if time.monotonic() > deadline:
+            raise RuntimeError("lobby did not connect to database server")
+        time.sleep(0.05)
+
+    samples = []
+    samples_lock = threading.Lock()
+
+    def issue(count: int) -> None:
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            lobby.try_request_and_wait("bench_noop", {})
+            local.append((time.perf_counter() - start) * 1000)
+        with samples_lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=issue, args=(iterations // threads,)) for _ in range(threads)]
+    wall_start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+
+    lobby.stop()
+    db.stop()
+    for thread in lobby_threads:
+        thread.join(timeout=5)
+    return {
+        "iterations": len(samples),
+        "threads": threads,
+        "db_pool_size": db_pool_size,
+        "requests_per_s": len(samples) / wall,
+        "p50_ms": statistics.median(samples),
+        "p99_ms": _percentile(samples, 99),
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    t = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_THREADS
+    pool = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_DB_POOL_SIZE
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = run(n, t, pool)
+    print(f"try_request_and_wait x{result['iterations']} ({result['threads']} threads, "
+          f"{result['db_pool_size']} db links): {result['requests_per_s']:.0f} req/s  "
+          f"p50={result['p50_ms']:.2f} ms  p99={result['p99_ms']:.2f} ms  mean={result['mean_ms']:.2f} ms")
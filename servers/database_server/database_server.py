@@ -1,9 +1,9 @@
-# next: 
-# supply only two connection, one from lobby server, one from developer server 
-
 import threading
 import socket
+import copy
+from contextlib import contextmanager
 from base.message_format_passer import MessageFormatPasser
+from base.handler_pool import HandlerPool
 from protocols.protocols import Formats, Words
 from typing import Optional
 import time
@@ -15,11 +15,25 @@ from base.file_receiver import FileReceiver
 import hashlib
 from base.file_checker import FileChecker
 from base.file_sender import FileSender
+from base.transfer_framing import FRAMING_V1, choose_framing, offer_framings
+from servers.database_server.storage import (Storage, JsonStorage, SqliteStorage, JournalStorage,
+                                             DEFAULT_WRITE_BEHIND_INTERVAL, DEFAULT_WRITE_BEHIND_BATCH,
+                                             DEFAULT_JOURNAL_SYNC_INTERVAL, DEFAULT_JOURNAL_COMPACT_BYTES,
+                                             PLAYERS, ROOMS, DEVELOPERS)
+from servers.database_server.game_catalog import GameCatalog, DEFAULT_STORE_PAGE_SIZE
+from servers.database_server.upload_sessions import (UploadSessions, UploadSession, UploadLimitError,
+                                                     DEFAULT_MAX_UPLOAD_SESSIONS, DEFAULT_MAX_UPLOAD_BYTES)
 
 DEFAULT_ACCEPT_TIMEOUT = 1.0
 DEFAULT_RECEIVE_TIMEOUT = 1.0
 DEFAULT_HANDSHAKE_TIMEOUT = 5.0
 DEFAULT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_TRUST_SERVER_LINKS = True
+DEFAULT_MAX_SERVER_LINKS = 16  # per role; lobby / developer servers open a pool of connections each
+DEFAULT_REQUEST_POOL_SIZE = 16
+DEFAULT_UPLOAD_IDLE_TIMEOUT = 30.0  # for the uploader to connect to the port UPLOAD_START handed out, and between reads
+DEFAULT_UPLOAD_END_TIMEOUT = 2.5  # UPLOAD_END waits this long for the transfer to finish; below the callers' response timeout
+DEFAULT_STORAGE = "json"  # "json" (data/*.json, the original format), "sqlite" or "journal"
 
 PARENT_DIR = Path(__file__).resolve().parents[0]
 
@@ -30,16 +44,58 @@ PLAYER_DB_FILE = DATA_DIR / "player_db.json"
 ROOM_DB_FILE = DATA_DIR / "room_db.json"
 
 DEVELOPER_DB_FILE = DATA_DIR / "developer_db.json"
+SQLITE_DB_FILE = DATA_DIR / "database.sqlite3"
+JOURNAL_DIR = DATA_DIR / "journal"
 
 GAME_FOLDER = PARENT_DIR / "games"
 GAME_FOLDER.mkdir(parents=True, exist_ok=True)
 
+
+class EntityLocks:
+    """One lock per key (username, room name), created on demand and dropped
+    once nobody holds or waits for it."""
+    def __init__(self) -> None:
+        self._guard = threading.Lock()
+        self._locks: dict[str, list] = {}  # key -> [lock, users]
+
+    @contextmanager
+    def hold(self, *keys):
+        """Hold the locks of all given keys (None is skipped), taken in sorted order."""
+        ordered = sorted({str(key) for key in keys if key is not None})
+        held = []
+        try:
+            for key in ordered:
+                with self._guard:
+                    entry = self._locks.setdefault(key, [threading.Lock(), 0])
+                    entry[1] += 1
+                entry[0].acquire()
+                held.append((key, entry))
+            yield
+        finally:
+            for key, entry in reversed(held):
+                entry[0].release()
+                with self._guard:
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del self._locks[key]
+
+
 class DatabaseServer:
     def __init__(self, host: str = "0.0.0.0", port: int = 32132, 
                  accept_timeout = DEFAULT_ACCEPT_TIMEOUT, 
                  receive_timeout = DEFAULT_RECEIVE_TIMEOUT, 
                  handshake_timeout = DEFAULT_HANDSHAKE_TIMEOUT, 
-                 heartbeat_timeout = DEFAULT_HEARTBEAT_TIMEOUT):
+                 heartbeat_timeout = DEFAULT_HEARTBEAT_TIMEOUT, 
+                 trust_server_links = DEFAULT_TRUST_SERVER_LINKS, 
+                 max_server_links = DEFAULT_MAX_SERVER_LINKS, 
+                 request_pool_size = DEFAULT_REQUEST_POOL_SIZE, 
+                 storage: str | Storage = DEFAULT_STORAGE, 
+                 write_behind_interval = DEFAULT_WRITE_BEHIND_INTERVAL, 
+                 write_behind_batch = DEFAULT_WRITE_BEHIND_BATCH, 
+                 journal_sync_interval = DEFAULT_JOURNAL_SYNC_INTERVAL, 
+                 journal_compact_bytes = DEFAULT_JOURNAL_COMPACT_BYTES, 
+                 max_upload_sessions = DEFAULT_MAX_UPLOAD_SESSIONS, 
+                 max_upload_bytes = DEFAULT_MAX_UPLOAD_BYTES):
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.host = host
         self.port = port
@@ -47,46 +103,92 @@ class DatabaseServer:
         self.receive_timeout = receive_timeout
         self.handshake_timeout = handshake_timeout
         self.heartbeat_timeout = heartbeat_timeout
+        self.trust_server_links = trust_server_links
+        self.max_server_links = max_server_links
+        self.request_pool_size = request_pool_size
+        # requests of every lobby / developer link run here, answered in completion order
+        self.request_pool: Optional[HandlerPool] = None
 
         self.stop_event = threading.Event()
 
-        self.lobby_passer: Optional[MessageFormatPasser] = None
-        self.developer_passer: Optional[MessageFormatPasser] = None
+        self.lobby_passers: set[MessageFormatPasser] = set()
+        self.developer_passers: set[MessageFormatPasser] = set()
+        self.server_links_lock = threading.Lock()
 
+        self.write_behind_interval = write_behind_interval
+        self.write_behind_batch = write_behind_batch
+        self.journal_sync_interval = journal_sync_interval
+        self.journal_compact_bytes = journal_compact_bytes
+        self.storage = storage if isinstance(storage, Storage) else self.make_storage(storage)
         self.player_db = self.load_player_db()
         self.developer_db = self.load_developer_db()
         self.room_db = self.load_room_db()
 
-        self.upload_params: dict = {}
-        self.upload_lock = threading.Lock()
-
-    def load_db(self, path: Path):
-        if not os.path.exists(path):
-            return {}
-        with open(path, 'r') as f:
-            return json.load(f)
-    
-    def save_db(self, path: Path, data: dict):
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Locking, for requests running in parallel on request_pool:
+        # - entity locks make a check-then-modify on one player / room / developer
+        #   atomic. Take room locks before player locks; EntityLocks.hold orders
+        #   several keys of one kind.
+        # - table locks only guard the dict itself: every write to a *_db (nested
+        #   values included) and the copy the storage takes when saving. They are
+        #   held briefly and never while acquiring an entity lock.
+        self.player_locks = EntityLocks()
+        self.room_locks = EntityLocks()
+        self.developer_locks = EntityLocks()
+        self.player_db_lock = threading.RLock()
+        self.room_db_lock = threading.RLock()
+        self.developer_db_lock = threading.RLock()
+        self.storage.bind(PLAYERS, self.player_db, self.player_db_lock)
+        self.storage.bind(ROOMS, self.room_db, self.room_db_lock)
+        self.storage.bind(DEVELOPERS, self.developer_db, self.developer_db_lock)
+
+        self.upload_sessions = UploadSessions(max_upload_sessions, max_upload_bytes)
+        self.game_locks = EntityLocks()  # finalizing uploads of one game_id one at a time
+
+        self.game_catalog = GameCatalog(GAME_FOLDER)
+        self.game_catalog.load()
+
+    def make_storage(self, engine: str) -> Storage:
+        json_paths = {PLAYERS: PLAYER_DB_FILE, ROOMS: ROOM_DB_FILE, DEVELOPERS: DEVELOPER_DB_FILE}
+        match engine:
+            case "json":
+                return JsonStorage(json_paths, self.write_behind_interval, self.write_behind_batch)
+            case "sqlite":
+                storage = SqliteStorage(SQLITE_DB_FILE)
+                if storage.migrate_from_json(json_paths, GAME_FOLDER):
+                    print(f"[DatabaseServer] migrated {DATA_DIR}/*.json into {SQLITE_DB_FILE}")
+                return storage
+            case "journal":
+                JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+                return JournalStorage(JOURNAL_DIR, json_paths, self.journal_sync_interval, self.journal_compact_bytes)
+            case _:
+                raise ValueError(f"Unknown storage engine: {engine}")
 
     def load_player_db(self):
-        return self.load_db(PLAYER_DB_FILE)
+        return self.storage.load(PLAYERS)
         
     def save_player_db(self):
-        self.save_db(PLAYER_DB_FILE, self.player_db)
+        self.storage.table_changed(PLAYERS)
+
+    def save_player(self, username: str):
+        self.storage.record_changed(PLAYERS, username)
 
     def load_developer_db(self):
-        return self.load_db(DEVELOPER_DB_FILE)
+        return self.storage.load(DEVELOPERS)
         
     def save_developer_db(self):
-        self.save_db(DEVELOPER_DB_FILE, self.developer_db)
+        self.storage.table_changed(DEVELOPERS)
+
+    def save_developer(self, username: str):
+        self.storage.record_changed(DEVELOPERS, username)
 
     def load_room_db(self):
-        return self.load_db(ROOM_DB_FILE)
+        return self.storage.load(ROOMS)
         
     def save_room_db(self):
-        self.save_db(ROOM_DB_FILE, self.room_db)
+        self.storage.table_changed(ROOMS)
+
+    def save_room(self, room_name: str):
+        self.storage.record_changed(ROOMS, room_name)
 
     # def load_room_db(self):
     #     if not os.path.exists(ROOM_DB_FILE):
@@ -103,14 +205,19 @@ class DatabaseServer:
         self.server_sock.listen(5)
         self.server_sock.settimeout(self.accept_timeout)
         print(f"Database server listening on {self.host}:{self.port}")
-        self.accept_connections()
+        self.request_pool = HandlerPool(self.request_pool_size, name="db-request")
+        self.request_pool.start()
+        try:
+            self.accept_connections()
+        finally:
+            self.request_pool.stop(wait=False)
 
     def accept_connections(self) -> None:
         while not self.stop_event.is_set():
             try:
                 connection_sock, addr = self.server_sock.accept()
                 print(f"Accepted connection from {addr}")
-                msgfmt_passer = MessageFormatPasser(connection_sock)
+                msgfmt_passer = MessageFormatPasser(connection_sock, buffered=True)
                 #self.clients.append(msgfmt_passer)
                 #self.user_infos[msgfmt_passer] = UserInfo()
                 # self.connections.append(msgfmt_passer)
@@ -135,25 +242,11 @@ class DatabaseServer:
             role = data[Words.DataKeys.Handshake.ROLE]
             match role:
                 case Words.Roles.LOBBYSERVER:
-                    if self.lobby_passer is None:
-                        self.lobby_passer = msgfmt_passer
-                        self.send_response(msgfmt_passer, received_message_id, Words.Result.SUCCESS)
-                        self.handle_lobby(msgfmt_passer)
-                        self.lobby_passer.close()
-                        self.lobby_passer = None
-                    else:
-                        self.send_response(msgfmt_passer, received_message_id, Words.Result.FAILURE, 
-                                           {Words.ParamKeys.Failure.REASON: "already connected one lobby server"})
+                    self.serve_server_link(msgfmt_passer, received_message_id, data, 
+                                           self.lobby_passers, self.handle_lobby, "lobby server")
                 case Words.Roles.DEVELOPERSERVER:
-                    if self.developer_passer is None:
-                        self.developer_passer = msgfmt_passer
-                        self.send_response(msgfmt_passer, received_message_id, Words.Result.SUCCESS)
-                        self.handle_developer(msgfmt_passer)
-                        self.developer_passer.close()
-                        self.developer_passer = None
-                    else:
-                        self.send_response(msgfmt_passer, received_message_id, Words.Result.FAILURE, 
-                                           {Words.ParamKeys.Failure.REASON: "already connected one developer server"})
+                    self.serve_server_link(msgfmt_passer, received_message_id, data, 
+                                           self.developer_passers, self.handle_developer, "developer server")
                 case _:
                     print(f"Unknown role: {role}")
             # if data[Words.DataKeys.Handshake.ROLE] == Words.Roles.PLAYER:
@@ -177,6 +270,25 @@ class DatabaseServer:
         # print(f"Connection closed. Active connections: {len(self.connections)}")
         msgfmt_passer.close()
 
+    def serve_server_link(self, passer: MessageFormatPasser, received_message_id: str, handshake_data: dict, 
+                          links: set[MessageFormatPasser], handler, name: str) -> None:
+        """Run one pooled connection of a lobby / developer server, up to max_server_links per role."""
+        with self.server_links_lock:
+            admitted = len(links) < self.max_server_links
+            if admitted:
+                links.add(passer)
+        if not admitted:
+            self.send_response(passer, received_message_id, Words.Result.FAILURE, 
+                               {Words.ParamKeys.Failure.REASON: f"too many {name} connections"})
+            return
+        try:
+            self.accept_handshake(passer, received_message_id, handshake_data)
+            handler(passer)
+        finally:
+            with self.server_links_lock:
+                links.discard(passer)
+            passer.close()
+
     def handle_lobby(self, passer: MessageFormatPasser):
         passer.settimeout(self.receive_timeout)
         last_hb_time = time.time()
@@ -185,255 +297,7 @@ class DatabaseServer:
                 msg_id, msg_type, data = passer.receive_args(Formats.MESSAGE)
                 match msg_type:
                     case Words.MessageType.REQUEST:
-                        assert isinstance(data, dict)
-                        cmd = data.get(Words.DataKeys.Request.COMMAND)
-                        params = data.get(Words.DataKeys.PARAMS)
-                        match cmd:
-                            case Words.Command.LOGIN:
-                                # time.sleep(10)
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Login.USERNAME)
-                                password = params.get(Words.ParamKeys.Login.PASSWORD)
-                                
-                                success, reason = self._verify_player_credential(username, password)
-                                if success:
-                                    assert username is not None
-                                    self._set_player_online(username)
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: reason})
-                            case Words.Command.LOGOUT:
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Logout.USERNAME)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
-                                    continue
-                                room_id = None
-                                try:
-                                    room_id = self.player_db[username].get("current_room")
-                                except Exception:
-                                    room_id = None
-
-                                if room_id and room_id in self.room_db:
-                                    players = self.room_db[room_id].get("player_list") or []
-                                    if username in players:
-                                        try:
-                                            players.remove(username)
-                                        except ValueError:
-                                            # already not in list
-                                            pass
-                                    # update or remove room
-                                    if not players:
-                                        self.room_db.pop(room_id, None)
-                                    else:
-                                        # assign new owner if needed
-                                        room_owner = self.room_db[room_id].get("owner")
-                                        if room_owner == username:
-                                            self.room_db[room_id]["owner"] = players[0]
-                                        self.room_db[room_id]["player_list"] = players
-                                    self.save_room_db()
-
-                                now_room_data = self.room_db.get(room_id)
-
-                                self._set_player_offline(username)
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Room.ROOM_NAME: room_id,
-                                    Words.ParamKeys.Room.NOW_ROOM_DATA: now_room_data
-                                })
-                                
-                            case Words.Command.REGISTER:
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Register.USERNAME)
-                                password = params.get(Words.ParamKeys.Register.PASSWORD)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
-                                    continue
-                                if not password:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing password."})
-                                    continue
-                                if self._verify_player_regable(username):
-                                    self.write_player_data(username, password)
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Username used by others"})
-                            case Words.Command.DOWNLOAD_START:
-                                try:
-                                    assert isinstance(params, dict)
-                                    game_id = str(params.get(Words.ParamKeys.Metadata.GAME_ID))
-                                    game_dir = GAME_FOLDER / game_id
-                                    if not game_dir.exists():
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: f"game_id {game_id} not found."
-                                        })
-                                        continue
-                                    big_meta_dir = game_dir / "big_metadata.json"
-                                    if not big_meta_dir.exists():
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: f"big_metadata.json in game_id {game_id} not found."
-                                        })
-                                        continue
-                                    with open(big_meta_dir, "rb") as rf:
-                                        big_meta = json.load(rf)
-                                    assert isinstance(big_meta, dict)
-                                    latest_version = str(big_meta.get(Words.ParamKeys.Metadata.VERSION))
-                                    file_name = str(big_meta.get(Words.ParamKeys.Metadata.FILE_NAME))
-                                    game_file_dir = game_dir / latest_version / file_name
-                                    if not game_file_dir.exists():
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: f"game file of latest version not found."
-                                        })
-                                        continue
-                                    temp_server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                    temp_server_sock.bind(("0.0.0.0", 0))
-                                    temp_server_sock.listen(1)
-                                    port = temp_server_sock.getsockname()[1]
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                        Words.ParamKeys.Success.PORT: port
-                                    })
-                                    threading.Thread(target=self.handle_download, args=(temp_server_sock, game_file_dir), daemon=True).start()
-                                except Exception as e:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE,
-                                                       {Words.ParamKeys.Failure.REASON: f"Exception calling download_start: {str(e)}"})
-
-                            case Words.Command.CHECK_STORE:
-                                result_dict = self.check_game_folder()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, result_dict)
-                            case Words.Command.CREATE_ROOM:
-                                assert isinstance(params, dict)
-                                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
-                                game_id = str(params.get(Words.ParamKeys.Room.GAME_ID))
-                                username = params.get(Words.ParamKeys.Room.USERNAME)
-                                if not (room_name and username and game_id):
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "missing fields"
-                                    })
-                                    continue
-                                if room_name in self.room_db:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "room name occupied by others"
-                                    })
-                                    continue
-                                big_meta_dir = GAME_FOLDER / game_id / "big_metadata.json"
-                                with open(big_meta_dir, "rb") as rf:
-                                    big_meta = json.load(rf)
-
-                                assert isinstance(big_meta, dict)
-                                players = big_meta.get(Words.ParamKeys.Metadata.PLAYERS)
-
-                                self.room_db[room_name] = {
-                                    Words.ParamKeys.Room.OWNER: username, 
-                                    Words.ParamKeys.Room.GAME_ID: game_id, 
-                                    Words.ParamKeys.Room.PLAYER_LIST: [username], 
-                                    Words.ParamKeys.Room.EXPECTED_PLAYERS: players, 
-                                    Words.ParamKeys.Room.IS_PLAYING: False
-                                }
-                                self.save_room_db()
-                                self.player_db[username]["current_room"] = room_name
-                                self.save_player_db()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Room.EXPECTED_PLAYERS: players
-                                })
-                            case Words.Command.JOIN_ROOM:
-                                assert isinstance(params, dict)
-                                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
-                                username = params.get(Words.ParamKeys.Room.USERNAME)
-                                if not (room_name and username):
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "missing fields"
-                                    })
-                                    continue
-                                now_room = self.room_db.get(room_name)
-                                if now_room is None:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'room not found'})
-                                    continue
-                                players = now_room.get(Words.ParamKeys.Room.PLAYER_LIST) or []
-                                expected = now_room.get(Words.ParamKeys.Room.EXPECTED_PLAYERS) or 0
-                                if username in players:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "already in room"
-                                    })
-                                    continue
-                                if len(players) >= expected:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "room full"
-                                    })
-                                    continue
-                                players.append(username)
-                                now_room[Words.ParamKeys.Room.PLAYER_LIST] = players
-                                self.room_db[room_name] = now_room
-                                self.save_room_db()
-                                self.player_db[username]["current_room"] = room_name
-                                self.save_player_db()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                            case Words.Command.LEAVE_ROOM:
-                                assert isinstance(params, dict)
-                                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
-                                username = params.get(Words.ParamKeys.Room.USERNAME)
-                                if not (room_name and username):
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "missing fields"
-                                    })
-                                    continue
-                                now_room = self.room_db.get(room_name)
-                                if now_room is None:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'room not found'})
-                                    continue
-                                players = now_room.get(Words.ParamKeys.Room.PLAYER_LIST) or []
-                                if username not in players:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'not in room'})
-                                    continue
-                                # remove player
-                                players = [p for p in players if p != username]
-                                now_room[Words.ParamKeys.Room.PLAYER_LIST] = players
-                                # if owner left, assign new owner or remove room
-                                owner = now_room.get(Words.ParamKeys.Room.OWNER)
-                                if owner == username:
-                                    if players:
-                                        now_room[Words.ParamKeys.Room.OWNER] = players[0]
-                                    else:
-                                        # remove empty room
-                                        self.room_db.pop(room_name, None)
-                                        self.save_room_db()
-                                        self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                            Words.ParamKeys.Room.ROOM_NAME: room_name,
-                                            Words.ParamKeys.Room.NOW_ROOM_DATA: None
-                                        })
-                                        continue
-                                self.room_db[room_name] = now_room
-                                self.save_room_db()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Room.ROOM_NAME: room_name,
-                                    Words.ParamKeys.Room.NOW_ROOM_DATA: now_room
-                                })
-                            case Words.Command.START_GAME:
-                                assert isinstance(params, dict)
-                                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
-                                if not room_name:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "missing room_name"
-                                    })
-                                    continue
-                                now_room = self.room_db.get(room_name)
-                                if now_room is None:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "room not found"
-                                    })
-                                    continue
-                                now_room[Words.ParamKeys.Room.IS_PLAYING] = True
-                                self.room_db[room_name] = now_room
-                                self.save_room_db()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Room.ROOM_NAME: room_name,
-                                    Words.ParamKeys.Room.NOW_ROOM_DATA: now_room
-                                })
-                            case _:
-                                self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                   {Words.ParamKeys.Failure.REASON: "Invalid command"})
+                        self.request_pool.submit(self._run_request, self._process_lobby_request, passer, msg_id, data)
                     case Words.MessageType.HEARTBEAT:
                         last_hb_time = time.time()
                         self.send_response(passer, msg_id, Words.Result.SUCCESS)   
@@ -446,7 +310,7 @@ class DatabaseServer:
                     print(f"[DatabaseServer] client heartbeat timeout (>{self.heartbeat_timeout}s), terminating connection")
                     break
                 continue
-            except ConnectionError as e:
+            except OSError as e:  # ConnectionError, or the socket was closed under us
                 print(f"[DatabaseServer] ConnectionError raised in handle_lobby: {e}")
                 break
             except Exception as e:
@@ -459,6 +323,301 @@ class DatabaseServer:
                         pass
                 print(f"[DatabaseServer] Exception occurred in handle_lobby: {e}")
 
+    def _run_request(self, process, passer: MessageFormatPasser, msg_id: str, data: dict) -> None:
+        """request_pool task: one request of a lobby / developer link."""
+        try:
+            process(passer, msg_id, data)
+        except Exception as e:
+            try:
+                self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                   {Words.ParamKeys.Failure.REASON: "Error occurred in database server."})
+            except Exception:
+                pass
+            print(f"[DatabaseServer] Exception occurred in {process.__name__}: {e}")
+
+    def _process_lobby_request(self, passer: MessageFormatPasser, msg_id: str, data: dict) -> None:
+        assert isinstance(data, dict)
+        cmd = data.get(Words.DataKeys.Request.COMMAND)
+        params = data.get(Words.DataKeys.PARAMS)
+        match cmd:
+            case Words.Command.LOGIN:
+                # time.sleep(10)
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Login.USERNAME)
+                password = params.get(Words.ParamKeys.Login.PASSWORD)
+
+                with self.player_locks.hold(username):
+                    success, reason = self._verify_player_credential(username, password)
+                    if success:
+                        assert username is not None
+                        self._set_player_online(username)
+                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                    else:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                           {Words.ParamKeys.Failure.REASON: reason})
+            case Words.Command.LOGOUT:
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Logout.USERNAME)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
+                    return
+                with self._hold_player_room(username) as room_id:
+                    if room_id and room_id in self.room_db:
+                        with self.room_db_lock:
+                            players = self.room_db[room_id].get("player_list") or []
+                            if username in players:
+                                try:
+                                    players.remove(username)
+                                except ValueError:
+                                    # already not in list
+                                    pass
+                            # update or remove room
+                            if not players:
+                                self.room_db.pop(room_id, None)
+                            else:
+                                # assign new owner if needed
+                                room_owner = self.room_db[room_id].get("owner")
+                                if room_owner == username:
+                                    self.room_db[room_id]["owner"] = players[0]
+                                self.room_db[room_id]["player_list"] = players
+                        self.save_room(room_id)
+
+                    now_room_data = self.room_db.get(room_id)
+
+                    self._set_player_offline(username)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                        Words.ParamKeys.Room.ROOM_NAME: room_id,
+                        Words.ParamKeys.Room.NOW_ROOM_DATA: now_room_data
+                    })
+
+            case Words.Command.REGISTER:
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Register.USERNAME)
+                password = params.get(Words.ParamKeys.Register.PASSWORD)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
+                    return
+                if not password:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing password."})
+                    return
+                with self.player_locks.hold(username):
+                    if self._verify_player_regable(username):
+                        self.write_player_data(username, password)
+                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                    else:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                           {Words.ParamKeys.Failure.REASON: "Username used by others"})
+            case Words.Command.DOWNLOAD_START:
+                try:
+                    assert isinstance(params, dict)
+                    game_id = str(params.get(Words.ParamKeys.Metadata.GAME_ID))
+                    game_dir = GAME_FOLDER / game_id
+                    if not game_dir.exists():
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"game_id {game_id} not found."
+                        })
+                        return
+                    big_meta = self.game_catalog.big_metadata(game_id)
+                    if big_meta is None:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"big_metadata.json in game_id {game_id} not found."
+                        })
+                        return
+                    latest_version = str(big_meta.get(Words.ParamKeys.Metadata.VERSION))
+                    file_name = str(big_meta.get(Words.ParamKeys.Metadata.FILE_NAME))
+                    game_file_dir = game_dir / latest_version / file_name
+                    if not game_file_dir.exists():
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"game file of latest version not found."
+                        })
+                        return
+                    temp_server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    temp_server_sock.bind(("0.0.0.0", 0))
+                    temp_server_sock.listen(1)
+                    port = temp_server_sock.getsockname()[1]
+                    framing = choose_framing(params.get(Words.ParamKeys.Transfer.FRAMINGS))
+                    sha256 = big_meta.get(Words.ParamKeys.Metadata.SHA256)
+                    sha256 = sha256 if isinstance(sha256, str) else None
+                    # size and sha256 let a relaying lobby pass the file on in FRAMING_V3 before it has all of it
+                    response = {
+                        Words.ParamKeys.Success.PORT: port,
+                        Words.ParamKeys.Metadata.SIZE: game_file_dir.stat().st_size
+                    }
+                    if sha256 is not None:
+                        response[Words.ParamKeys.Metadata.SHA256] = sha256
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS, response)
+                    threading.Thread(target=self.handle_download, daemon=True,
+                                     args=(temp_server_sock, game_file_dir, framing, sha256)).start()
+                except Exception as e:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE,
+                                       {Words.ParamKeys.Failure.REASON: f"Exception calling download_start: {str(e)}"})
+
+            case Words.Command.CHECK_STORE:
+                result_dict = self.check_game_folder()
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, result_dict)
+            case Words.Command.QUERY_STORE:
+                query = params if isinstance(params, dict) else {}
+                try:
+                    games, next_cursor = self.game_catalog.query(
+                        name=query.get(Words.ParamKeys.StoreQuery.NAME),
+                        players=query.get(Words.ParamKeys.StoreQuery.PLAYERS),
+                        uploader=query.get(Words.ParamKeys.StoreQuery.UPLOADER),
+                        sort=query.get(Words.ParamKeys.StoreQuery.SORT) or Words.ParamKeys.Metadata.GAME_NAME,
+                        descending=bool(query.get(Words.ParamKeys.StoreQuery.DESCENDING)),
+                        limit=query.get(Words.ParamKeys.StoreQuery.LIMIT) or DEFAULT_STORE_PAGE_SIZE,
+                        cursor=query.get(Words.ParamKeys.StoreQuery.CURSOR))
+                except (TypeError, ValueError) as e:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: f"Invalid store query: {e}"
+                    })
+                    return
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                    Words.ParamKeys.StoreStatus.GAMES: games,
+                    Words.ParamKeys.StoreQuery.NEXT_CURSOR: next_cursor
+                })
+            case Words.Command.CREATE_ROOM:
+                assert isinstance(params, dict)
+                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
+                game_id = str(params.get(Words.ParamKeys.Room.GAME_ID))
+                username = params.get(Words.ParamKeys.Room.USERNAME)
+                if not (room_name and username and game_id):
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "missing fields"
+                    })
+                    return
+                with self.room_locks.hold(room_name), self.player_locks.hold(username):
+                    if room_name in self.room_db:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: "room name occupied by others"
+                        })
+                        return
+                    big_meta = self.game_catalog.big_metadata(game_id)
+                    if big_meta is None:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"game_id {game_id} not found."
+                        })
+                        return
+                    players = big_meta.get(Words.ParamKeys.Metadata.PLAYERS)
+
+                    with self.room_db_lock:
+                        self.room_db[room_name] = {
+                            Words.ParamKeys.Room.OWNER: username, 
+                            Words.ParamKeys.Room.GAME_ID: game_id, 
+                            Words.ParamKeys.Room.PLAYER_LIST: [username], 
+                            Words.ParamKeys.Room.EXPECTED_PLAYERS: players, 
+                            Words.ParamKeys.Room.IS_PLAYING: False
+                        }
+                    self.save_room(room_name)
+                    self._set_player_room(username, room_name)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                        Words.ParamKeys.Room.EXPECTED_PLAYERS: players
+                    })
+            case Words.Command.JOIN_ROOM:
+                assert isinstance(params, dict)
+                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
+                username = params.get(Words.ParamKeys.Room.USERNAME)
+                if not (room_name and username):
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "missing fields"
+                    })
+                    return
+                with self.room_locks.hold(room_name), self.player_locks.hold(username):
+                    now_room = self.room_db.get(room_name)
+                    if now_room is None:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'room not found'})
+                        return
+                    players = now_room.get(Words.ParamKeys.Room.PLAYER_LIST) or []
+                    expected = now_room.get(Words.ParamKeys.Room.EXPECTED_PLAYERS) or 0
+                    if username in players:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: "already in room"
+                        })
+                        return
+                    if len(players) >= expected:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: "room full"
+                        })
+                        return
+                    with self.room_db_lock:
+                        players.append(username)
+                        now_room[Words.ParamKeys.Room.PLAYER_LIST] = players
+                        self.room_db[room_name] = now_room
+                    self.save_room(room_name)
+                    self._set_player_room(username, room_name)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
+            case Words.Command.LEAVE_ROOM:
+                assert isinstance(params, dict)
+                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
+                username = params.get(Words.ParamKeys.Room.USERNAME)
+                if not (room_name and username):
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "missing fields"
+                    })
+                    return
+                with self.room_locks.hold(room_name):
+                    now_room = self.room_db.get(room_name)
+                    if now_room is None:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'room not found'})
+                        return
+                    players = now_room.get(Words.ParamKeys.Room.PLAYER_LIST) or []
+                    if username not in players:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'not in room'})
+                        return
+                    with self.room_db_lock:
+                        # remove player
+                        players = [p for p in players if p != username]
+                        now_room[Words.ParamKeys.Room.PLAYER_LIST] = players
+                        # if owner left, assign new owner or remove room
+                        owner = now_room.get(Words.ParamKeys.Room.OWNER)
+                        if owner == username and players:
+                            now_room[Words.ParamKeys.Room.OWNER] = players[0]
+                        elif owner == username:
+                            # remove empty room
+                            self.room_db.pop(room_name, None)
+                    if owner == username and not players:
+                        self.save_room(room_name)
+                        self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                            Words.ParamKeys.Room.ROOM_NAME: room_name,
+                            Words.ParamKeys.Room.NOW_ROOM_DATA: None
+                        })
+                        return
+                    with self.room_db_lock:
+                        self.room_db[room_name] = now_room
+                    self.save_room(room_name)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                        Words.ParamKeys.Room.ROOM_NAME: room_name,
+                        Words.ParamKeys.Room.NOW_ROOM_DATA: now_room
+                    })
+            case Words.Command.START_GAME:
+                assert isinstance(params, dict)
+                room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
+                if not room_name:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "missing room_name"
+                    })
+                    return
+                with self.room_locks.hold(room_name):
+                    now_room = self.room_db.get(room_name)
+                    if now_room is None:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: "room not found"
+                        })
+                        return
+                    with self.room_db_lock:
+                        now_room[Words.ParamKeys.Room.IS_PLAYING] = True
+                        self.room_db[room_name] = now_room
+                    self.save_room(room_name)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                        Words.ParamKeys.Room.ROOM_NAME: room_name,
+                        Words.ParamKeys.Room.NOW_ROOM_DATA: now_room
+                    })
+            case _:
+                self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                   {Words.ParamKeys.Failure.REASON: "Invalid command"})
+
     def handle_developer(self, passer: MessageFormatPasser):
         passer.settimeout(self.receive_timeout)
         last_hb_time = time.time()
@@ -467,247 +626,7 @@ class DatabaseServer:
                 msg_id, msg_type, data = passer.receive_args(Formats.MESSAGE)
                 match msg_type:
                     case Words.MessageType.REQUEST:
-                        assert isinstance(data, dict)
-                        cmd = data.get(Words.DataKeys.Request.COMMAND)
-                        params = data.get(Words.DataKeys.PARAMS)
-                        match cmd:
-                            case Words.Command.LOGIN:
-                                # time.sleep(10)
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Login.USERNAME)
-                                password = params.get(Words.ParamKeys.Login.PASSWORD)
-                                
-                                success, reason = self._verify_developer_credential(username, password)
-                                if success:
-                                    assert username is not None
-                                    self._set_developer_online(username)
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: reason})
-                            case Words.Command.LOGOUT:
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Logout.USERNAME)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
-                                    continue
-                                if username in self.room_db:
-                                    room_info = self.room_db[username]
-                                    if room_info.get(Words.ParamKeys.Room.IS_PLAYING, False):
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                           {Words.ParamKeys.Failure.REASON: "Cannot logout when game is in playing."})
-                                        continue
-                                    else:
-                                        del self.room_db[username]
-                                        self.save_room_db()
-                                self._set_developer_offline(username)
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                            case Words.Command.REGISTER:
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Register.USERNAME)
-                                password = params.get(Words.ParamKeys.Register.PASSWORD)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
-                                    continue
-                                if not password:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Missing password."})
-                                    continue
-                                if self._verify_developer_regable(username):
-                                    self.write_developer_data(username, password)
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                       {Words.ParamKeys.Failure.REASON: "Username used by others"})
-                            case Words.Command.CHECK_GAME_VALID:
-                                assert isinstance(params, dict)
-                                game_id = str(params.get(Words.ParamKeys.Metadata.GAME_ID))
-                                version = str(params.get(Words.ParamKeys.Metadata.VERSION))
-                                uploader = str(params.get(Words.ParamKeys.Metadata.UPLOADER))
-
-                                big_meta_path = GAME_FOLDER / game_id / "big_metadata.json"
-                                if big_meta_path.exists():
-                                    # big_meta_path = path / "big_metadata.json"
-                                    try:
-                                        with open(big_meta_path, "rb") as rf:
-                                            big_meta = json.load(rf)
-                                        assert isinstance(big_meta, dict)
-                                        actual_uploader = str(big_meta.get(Words.ParamKeys.Metadata.UPLOADER))
-                                        if actual_uploader != uploader:
-                                            self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                                Words.ParamKeys.Failure.REASON: f"Exists same game_id but not yours. Uploader: {actual_uploader}"
-                                            })
-                                            continue
-                                    except Exception as e:
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: f"Exception when comparing uploaders: {e}"
-                                        })
-                                        continue
-                                    previous_version = str(big_meta.get(Words.ParamKeys.Metadata.VERSION))
-                                    try:
-                                        px, py, pz = [int(s) for s in previous_version.split(".")]
-                                        nx, ny, nz = [int(s) for s in version.split(".")]
-                                        if px > nx or (px == nx and py > ny) or (px == nx and py == ny and pz >= nz):
-                                            self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                                Words.ParamKeys.Failure.REASON: f"version not lexigraphically bigger than previous version. Previous version: {previous_version}, Uploading version: {version}"
-                                            })
-                                            continue
-                                    except Exception as e:
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: f"Exception when comparing versions: {e}"
-                                        })
-                                        continue
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                    
-
-                            case Words.Command.UPLOAD_START:
-                                with self.upload_lock:
-                                    if self.upload_params:
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: "Other data is uploading."
-                                        })
-                                        continue
-                                assert isinstance(params, dict)
-                                game_id = params.get(Words.ParamKeys.Metadata.GAME_ID)
-                                game_name = params.get(Words.ParamKeys.Metadata.GAME_NAME)
-                                version = params.get(Words.ParamKeys.Metadata.VERSION)
-                                uploader = params.get(Words.ParamKeys.Metadata.UPLOADER)
-                                file_name = params.get(Words.ParamKeys.Metadata.FILE_NAME)
-                                players = params.get(Words.ParamKeys.Metadata.PLAYERS)
-                                size = params.get(Words.ParamKeys.Metadata.SIZE)
-                                sha256 = params.get(Words.ParamKeys.Metadata.SHA256)
-                                assert isinstance(game_id, str) and isinstance(version, str) and isinstance(file_name, str) and isinstance(players, int)
-                                assert isinstance(uploader, str) and isinstance(size, int) and isinstance(sha256, str) and isinstance(game_name, str)
-                                # game_root_dir = GAME_FOLDER / game_id
-                                # game_root_dir.mkdir(parents=True, exist_ok=True)
-                                # metadata_path = GAME_FOLDER / game_id / "metadata.json"
-                                # try:
-                                #     meta_obj = params
-                                #     with metadata_path.open("w", encoding="utf-8") as outf:
-                                #         json.dump(meta_obj, outf, ensure_ascii=False, indent=2)
-                                # except Exception as e:
-                                #     self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                #         Words.ParamKeys.Failure.REASON: f"Failed to write metadata: {e}"
-                                #     })
-                                #     continue
-                                game_dir = GAME_FOLDER / game_id / version
-                                game_dir.mkdir(parents=True, exist_ok=True)
-                                # game_file_path = game_dir / file_name
-                                with self.upload_lock:
-                                    self.upload_params = dict(params)
-                                    self.upload_params["upload_done"] = False
-                                    # self.upload_params["game_file_path"] = game_file_path
-                                server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                server_sock.bind(("0.0.0.0", 0))
-                                server_sock.listen(1)
-                                port = server_sock.getsockname()[1]
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Success.PORT: port
-                                })
-                                threading.Thread(target=self.handle_upload, args=(server_sock,), daemon=True).start()
-                            case Words.Command.UPLOAD_END:
-                                with self.upload_lock:
-                                    if not self.upload_params:
-                                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: "No data is uploading."
-                                        })
-                                        continue
-                                done = False
-                                check_count = 0
-                                while check_count <= 15:
-                                    with self.upload_lock:
-                                        upload_done = self.upload_params.get("upload_done")
-                                        print(f"upload_done: {upload_done}")
-                                        if upload_done:
-                                            done = True
-                                            break
-                                    check_count += 1
-                                    time.sleep(0.2)
-                                if not done:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                            Words.ParamKeys.Failure.REASON: "Upload is not done"
-                                        })
-                                    continue
-                                    
-                                with self.upload_lock:
-                                    st = self.upload_params.copy()
-
-                                # part_path = st["cache_root"] / (str(st["filename"]) + ".part")
-                                game_id = str(st.get(Words.ParamKeys.Metadata.GAME_ID))
-                                game_name = str(st.get(Words.ParamKeys.Metadata.GAME_NAME))
-                                version = str(st.get(Words.ParamKeys.Metadata.VERSION))
-                                uploader = str(st.get(Words.ParamKeys.Metadata.UPLOADER))
-                                file_name = str(st.get(Words.ParamKeys.Metadata.FILE_NAME))
-                                size = st.get(Words.ParamKeys.Metadata.SIZE)
-                                players = st.get(Words.ParamKeys.Metadata.PLAYERS)
-                                sha256 = str(st.get(Words.ParamKeys.Metadata.SHA256))
-
-                                final_path = GAME_FOLDER / game_id / version / file_name
-                                assert isinstance(size, int)
-
-                                file_checker = FileChecker(final_path, st)
-                                success, params = file_checker.check()
-                                if not success:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
-                                    continue
-
-                                # move into place
-                                try:
-                                    # final_path.replace(final_path)
-                                    # write metadata
-                                    meta = {
-                                        Words.ParamKeys.Metadata.GAME_ID: game_id,
-                                        Words.ParamKeys.Metadata.GAME_NAME: game_name, 
-                                        Words.ParamKeys.Metadata.VERSION: version,
-                                        Words.ParamKeys.Metadata.UPLOADER: uploader, 
-                                        Words.ParamKeys.Metadata.FILE_NAME: file_name,
-                                        Words.ParamKeys.Metadata.PLAYERS: players, 
-                                        Words.ParamKeys.Metadata.SIZE: size,
-                                        Words.ParamKeys.Metadata.SHA256: sha256,
-                                    }
-
-                                    big_meta_path = GAME_FOLDER / game_id / "big_metadata.json"
-                                    # big_meta = {}
-                                    version_list = []
-                                    if big_meta_path.exists():
-                                        with open(big_meta_path, "rb") as rf:
-                                            temp_big_meta = json.load(rf)
-                                            version_list = temp_big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS]
-                                    big_meta = meta.copy()
-                                    version_list.append(version)
-                                    big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS] = version_list
-                                    # else:
-                                    #     big_meta = meta.copy()
-                                    #     big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS] = []
-                                    # try:
-                                    #     big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS].append(version)
-                                    # except Exception:
-                                    #     print("failed to add version to all_versions")
-                                        
-                                    
-                                    (GAME_FOLDER / game_id / version / "metadata.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
-                                    big_meta_path.write_text(json.dumps(big_meta, indent=2), encoding="utf-8")
-                                except Exception as e:
-                                    with self.upload_lock:
-                                        self.upload_params.clear()
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: f"Finalize error: {e}"
-                                    })
-                                    continue
-                                self.add_developer_uploaded_games(uploader, game_id, game_name, version)
-                                with self.upload_lock:
-                                    self.upload_params.clear()
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                            case Words.Command.CHECK_DEV_WORKS:
-                                assert isinstance(params, dict)
-                                username = str(params.get(Words.ParamKeys.CheckInfo.USERNAME))
-                                params = self.developer_db[username]["uploaded_games"]
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, params)
-                            case _:
-                                self.send_response(passer, msg_id, Words.Result.FAILURE, 
-                                                   {Words.ParamKeys.Failure.REASON: "Invalid command"})
+                        self.request_pool.submit(self._run_request, self._process_developer_request, passer, msg_id, data)
                     case Words.MessageType.HEARTBEAT:
                         last_hb_time = time.time()
                         self.send_response(passer, msg_id, Words.Result.SUCCESS)   
@@ -720,7 +639,7 @@ class DatabaseServer:
                     print(f"[DatabaseServer] client heartbeat timeout (>{self.heartbeat_timeout}s), terminating connection")
                     break
                 continue
-            except ConnectionError as e:
+            except OSError as e:  # ConnectionError, or the socket was closed under us
                 print(f"[DatabaseServer] ConnectionError raised in handle_developer: {e}")
                 break
             except Exception as e:
@@ -728,88 +647,292 @@ class DatabaseServer:
                                             {Words.ParamKeys.Failure.REASON: "Error occurred in database server."})
                 print(f"[DatabaseServer] Exception occurred in handle_developer: {e}")
 
-    def check_game_folder(self) -> dict:
-        result: dict[str, dict] = {}
-        print("Entered check_game_folder")
-        try:
-            for p in GAME_FOLDER.iterdir():
-                if not p.is_dir():
-                    continue
-                game_id = p.name
-                big_meta_path = p / "big_metadata.json"
-                meta_obj: dict | None = None
-                if big_meta_path.exists():
+    def _process_developer_request(self, passer: MessageFormatPasser, msg_id: str, data: dict) -> None:
+        assert isinstance(data, dict)
+        cmd = data.get(Words.DataKeys.Request.COMMAND)
+        params = data.get(Words.DataKeys.PARAMS)
+        match cmd:
+            case Words.Command.LOGIN:
+                # time.sleep(10)
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Login.USERNAME)
+                password = params.get(Words.ParamKeys.Login.PASSWORD)
+
+                with self.developer_locks.hold(username):
+                    success, reason = self._verify_developer_credential(username, password)
+                    if success:
+                        assert username is not None
+                        self._set_developer_online(username)
+                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                    else:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                           {Words.ParamKeys.Failure.REASON: reason})
+            case Words.Command.LOGOUT:
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Logout.USERNAME)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
+                    return
+                with self.room_locks.hold(username), self.developer_locks.hold(username):
+                    if username in self.room_db:
+                        room_info = self.room_db[username]
+                        if room_info.get(Words.ParamKeys.Room.IS_PLAYING, False):
+                            self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                               {Words.ParamKeys.Failure.REASON: "Cannot logout when game is in playing."})
+                            return
+                        else:
+                            with self.room_db_lock:
+                                del self.room_db[username]
+                            self.save_room(username)
+                    self._set_developer_offline(username)
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
+            case Words.Command.REGISTER:
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Register.USERNAME)
+                password = params.get(Words.ParamKeys.Register.PASSWORD)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing username."})
+                    return
+                if not password:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                       {Words.ParamKeys.Failure.REASON: "Missing password."})
+                    return
+                with self.developer_locks.hold(username):
+                    if self._verify_developer_regable(username):
+                        self.write_developer_data(username, password)
+                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                    else:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                           {Words.ParamKeys.Failure.REASON: "Username used by others"})
+            case Words.Command.CHECK_GAME_VALID:
+                assert isinstance(params, dict)
+                game_id = str(params.get(Words.ParamKeys.Metadata.GAME_ID))
+                version = str(params.get(Words.ParamKeys.Metadata.VERSION))
+                uploader = str(params.get(Words.ParamKeys.Metadata.UPLOADER))
+
+                big_meta_path = GAME_FOLDER / game_id / "big_metadata.json"
+                big_meta = self.game_catalog.big_metadata(game_id)
+                if big_meta is not None or big_meta_path.exists():
                     try:
-                        meta_obj = json.loads(big_meta_path.read_text(encoding="utf-8"))
+                        assert big_meta is not None, "big_metadata.json is unreadable"
+                        actual_uploader = str(big_meta.get(Words.ParamKeys.Metadata.UPLOADER))
+                        if actual_uploader != uploader:
+                            self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                                Words.ParamKeys.Failure.REASON: f"Exists same game_id but not yours. Uploader: {actual_uploader}"
+                            })
+                            return
                     except Exception as e:
-                        print(f"[check_game_folder] failed to read big_metadata for {game_id}: {e}")
-                        meta_obj = None
-                else:
-                    # try to collect metadata from version folders (pick one and collect versions)
-                    versions = []
-                    for v in p.iterdir():
-                        if not v.is_dir():
-                            continue
-                        mpath = v / "metadata.json"
-                        if mpath.exists():
-                            try:
-                                m = json.loads(mpath.read_text(encoding="utf-8"))
-                                versions.append(m)
-                            except Exception:
-                                continue
-                    if versions:
-                        # build a simple aggregate big_meta from first entry and versions list
-                        base = dict(versions[0])
-                        base[Words.ParamKeys.Metadata.ALL_VERSIONS] = [str(m.get(Words.ParamKeys.Metadata.VERSION)) for m in versions if isinstance(m, dict)]
-                        meta_obj = base
-
-                if meta_obj is None:
-                    # no metadata available
-                    continue
-
-                # remove game_id from the metadata value (we keep folder name as the key)
-                cleaned = dict(meta_obj)
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"Exception when comparing uploaders: {e}"
+                        })
+                        return
+                    previous_version = str(big_meta.get(Words.ParamKeys.Metadata.VERSION))
+                    try:
+                        px, py, pz = [int(s) for s in previous_version.split(".")]
+                        nx, ny, nz = [int(s) for s in version.split(".")]
+                        if px > nx or (px == nx and py > ny) or (px == nx and py == ny and pz >= nz):
+                            self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                                Words.ParamKeys.Failure.REASON: f"version not lexigraphically bigger than previous version. Previous version: {previous_version}, Uploading version: {version}"
+                            })
+                            return
+                    except Exception as e:
+                        self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                            Words.ParamKeys.Failure.REASON: f"Exception when comparing versions: {e}"
+                        })
+                        return
+                self.send_response(passer, msg_id, Words.Result.SUCCESS)
+
+
+            case Words.Command.UPLOAD_START:
+                assert isinstance(params, dict)
+                game_id = params.get(Words.ParamKeys.Metadata.GAME_ID)
+                game_name = params.get(Words.ParamKeys.Metadata.GAME_NAME)
+                version = params.get(Words.ParamKeys.Metadata.VERSION)
+                uploader = params.get(Words.ParamKeys.Metadata.UPLOADER)
+                file_name = params.get(Words.ParamKeys.Metadata.FILE_NAME)
+                players = params.get(Words.ParamKeys.Metadata.PLAYERS)
+                size = params.get(Words.ParamKeys.Metadata.SIZE)
+                sha256 = params.get(Words.ParamKeys.Metadata.SHA256)
+                assert isinstance(game_id, str) and isinstance(version, str) and isinstance(file_name, str) and isinstance(players, int)
+                assert isinstance(uploader, str) and isinstance(size, int) and isinstance(sha256, str) and isinstance(game_name, str)
+                # game_root_dir = GAME_FOLDER / game_id
+                # game_root_dir.mkdir(parents=True, exist_ok=True)
+                # metadata_path = GAME_FOLDER / game_id / "metadata.json"
+                # try:
+                #     meta_obj = params
+                #     with metadata_path.open("w", encoding="utf-8") as outf:
+                #         json.dump(meta_obj, outf, ensure_ascii=False, indent=2)
+                # except Exception as e:
+                #     self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                #         Words.ParamKeys.Failure.REASON: f"Failed to write metadata: {e}"
+                #     })
+                #     continue
+                game_dir = GAME_FOLDER / game_id / version
+                try:
+                    session = self.upload_sessions.open(dict(params), game_dir / file_name)
+                except UploadLimitError as e:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: str(e)
+                    })
+                    return
                 try:
-                    cleaned.pop(Words.ParamKeys.Metadata.GAME_ID, None)
+                    game_dir.mkdir(parents=True, exist_ok=True)
+                    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    server_sock.bind(("0.0.0.0", 0))
+                    server_sock.listen(1)
                 except Exception:
-                    pass
+                    self.upload_sessions.close(session)
+                    raise
+                port = server_sock.getsockname()[1]
+                threading.Thread(target=self.handle_upload, args=(server_sock, session), daemon=True).start()
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                    Words.ParamKeys.Success.PORT: port, 
+                    Words.ParamKeys.Upload.UPLOAD_ID: session.upload_id, 
+                    Words.ParamKeys.Transfer.FRAMINGS: offer_framings()
+                })
+            case Words.Command.UPLOAD_END:
+                upload_id = params.get(Words.ParamKeys.Upload.UPLOAD_ID) if isinstance(params, dict) else None
+                session = self.upload_sessions.claim(upload_id)
+                if session is None:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "No data is uploading." if upload_id is None else f"Unknown upload_id {upload_id}."
+                    })
+                    return
+                if not session.wait(DEFAULT_UPLOAD_END_TIMEOUT):
+                    # left open while the transfer may still be writing; reaped once it ends
+                    self.upload_sessions.release(session)
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Upload is not done"
+                    })
+                    return
+                try:
+                    result, reply = self._finish_upload(session)
+                finally:
+                    self.upload_sessions.close(session)
+                self.send_response(passer, msg_id, result, reply)
+
+            case Words.Command.CHECK_DEV_WORKS:
+                assert isinstance(params, dict)
+                username = str(params.get(Words.ParamKeys.CheckInfo.USERNAME))
+                with self.developer_db_lock:
+                    params = copy.deepcopy(self.developer_db[username]["uploaded_games"])
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, params)
+            case _:
+                self.send_response(passer, msg_id, Words.Result.FAILURE, 
+                                   {Words.ParamKeys.Failure.REASON: "Invalid command"})
 
-                result[game_id] = cleaned
-        except Exception as e:
-            print(f"[check_game_folder] unexpected error: {e}")
-        return result
+    def check_game_folder(self) -> dict:
+        return self.game_catalog.store_listing()
     
-    def handle_upload(self, server_sock: socket.socket):
-        sock, addr = server_sock.accept()
-        print(f"accepted connection in handle_upload: {addr}")
-        server_sock.close()
-        with self.upload_lock:
-            game_id = str(self.upload_params.get(Words.ParamKeys.Metadata.GAME_ID))
-            version = str(self.upload_params.get(Words.ParamKeys.Metadata.VERSION))
-            file_name = str(self.upload_params.get(Words.ParamKeys.Metadata.FILE_NAME))
-            game_file_path = GAME_FOLDER / game_id / version / file_name
-        if not isinstance(game_file_path, Path):
-            print("game_file_path is not Path. Closing sock...")
-            with self.upload_lock:
-                self.upload_params.clear()
-            sock.close()
+    def _finish_upload(self, session: UploadSession) -> tuple[str, Optional[dict]]:
+        """UPLOAD_END after the transfer ended: verify the file and publish the
+        version. Returns the result and params to answer with."""
+        if not session.received:
+            return Words.Result.FAILURE, {
+                Words.ParamKeys.Failure.REASON: "Upload broke off; start it again to resume."
+            }
+        st = session.params
+        game_id = str(st.get(Words.ParamKeys.Metadata.GAME_ID))
+        # the version list in big_metadata.json is read-modify-write
+        with self.game_locks.hold(game_id):
+            # part_path = st["cache_root"] / (str(st["filename"]) + ".part")
+            game_name = str(st.get(Words.ParamKeys.Metadata.GAME_NAME))
+            version = str(st.get(Words.ParamKeys.Metadata.VERSION))
+            uploader = str(st.get(Words.ParamKeys.Metadata.UPLOADER))
+            file_name = str(st.get(Words.ParamKeys.Metadata.FILE_NAME))
+            size = st.get(Words.ParamKeys.Metadata.SIZE)
+            players = st.get(Words.ParamKeys.Metadata.PLAYERS)
+            sha256 = str(st.get(Words.ParamKeys.Metadata.SHA256))
+
+            final_path = GAME_FOLDER / game_id / version / file_name
+            assert isinstance(size, int)
+
+            file_checker = FileChecker(final_path, st, session.received_sha256, session.received_size)
+            success, params = file_checker.check()
+            if not success:
+                return Words.Result.FAILURE, params
+
+            # move into place
+            try:
+                # final_path.replace(final_path)
+                # write metadata
+                meta = {
+                    Words.ParamKeys.Metadata.GAME_ID: game_id,
+                    Words.ParamKeys.Metadata.GAME_NAME: game_name, 
+                    Words.ParamKeys.Metadata.VERSION: version,
+                    Words.ParamKeys.Metadata.UPLOADER: uploader, 
+                    Words.ParamKeys.Metadata.FILE_NAME: file_name,
+                    Words.ParamKeys.Metadata.PLAYERS: players, 
+                    Words.ParamKeys.Metadata.SIZE: size,
+                    Words.ParamKeys.Metadata.SHA256: sha256,
+                }
+
+                big_meta_path = GAME_FOLDER / game_id / "big_metadata.json"
+                # big_meta = {}
+                version_list = []
+                temp_big_meta = self.game_catalog.big_metadata(game_id)
+                if temp_big_meta is not None:
+                    version_list = list(temp_big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS])
+                big_meta = meta.copy()
+                version_list.append(version)
+                big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS] = version_list
+                # else:
+                #     big_meta = meta.copy()
+                #     big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS] = []
+                # try:
+                #     big_meta[Words.ParamKeys.Metadata.ALL_VERSIONS].append(version)
+                # except Exception:
+                #     print("failed to add version to all_versions")
+
+
+                (GAME_FOLDER / game_id / version / "metadata.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+                big_meta_path.write_text(json.dumps(big_meta, indent=2), encoding="utf-8")
+                self.storage.record_game(game_id, big_meta)
+                self.game_catalog.put(game_id, big_meta)
+            except Exception as e:
+                self.game_catalog.invalidate(game_id)  # big_metadata.json may be half written
+                return Words.Result.FAILURE, {
+                    Words.ParamKeys.Failure.REASON: f"Finalize error: {e}"
+                }
+            self.add_developer_uploaded_games(uploader, game_id, game_name, version)
+            return Words.Result.SUCCESS, None
+
+    def handle_upload(self, server_sock: socket.socket, session: UploadSession):
+        server_sock.settimeout(DEFAULT_UPLOAD_IDLE_TIMEOUT)
+        try:
+            sock, addr = server_sock.accept()
+        except OSError as e:
+            print(f"[DatabaseServer] upload {session.upload_id} never connected: {e}")
+            session.finish(False)
             return
-        file_receiver = FileReceiver(sock, game_file_path)
+        finally:
+            server_sock.close()
+        print(f"accepted connection in handle_upload: {addr}")
+        sock.settimeout(DEFAULT_UPLOAD_IDLE_TIMEOUT)
+        file_receiver = FileReceiver(sock, session.game_file_path, compute_sha256=True)
         success = file_receiver.receive()
         if not success:
             print("Warning: file receive not success.")
         file_receiver.close()
-        with self.upload_lock:
-            self.upload_params["upload_done"] = True
+        session.finish(success, file_receiver.sha256, file_receiver.received_size)
         print("exited handle_upload")
 
-    def handle_download(self, server_sock: socket.socket, path: Path):
+    def handle_download(self, server_sock: socket.socket, path: Path, framing: int = FRAMING_V1,
+                        sha256: Optional[str] = None):
         sock, addr = server_sock.accept()
         print(f"accepted connection in handle_upload: {addr}")
         server_sock.close()
-        file_sender = FileSender(sock, path)
-        file_sender.send()
-        file_sender.close()
+        file_sender = FileSender(sock, path, framing=framing, sha256=sha256)
+        try:
+            file_sender.send()
+            if file_sender.resumed_from:
+                print(f"[DatabaseServer] download of {path.name} resumed at byte {file_sender.resumed_from}")
+        except OSError as e:
+            print(f"[DatabaseServer] download of {path.name} broke off: {e}")
+        finally:
+            file_sender.close()
         print("exited handle_download")
 
     def _verify_player_credential(self, username, password) -> tuple[bool, str]:
@@ -838,24 +961,46 @@ class DatabaseServer:
         return not username in self.player_db.keys()
     
     def _set_player_online(self, username: str):
-        self.player_db[username]["last_login_time"] = time.time()
-        self.player_db[username]["online"] = True
-        self.save_player_db()
+        with self.player_db_lock:
+            self.player_db[username]["last_login_time"] = time.time()
+            self.player_db[username]["online"] = True
+        self.save_player(username)
 
     def _set_player_offline(self, username):
-        self.player_db[username]["online"] = False
-        self.player_db[username]["current_room"] = None
-        self.save_player_db()
+        with self.player_db_lock:
+            self.player_db[username]["online"] = False
+            self.player_db[username]["current_room"] = None
+        self.save_player(username)
+
+    def _set_player_room(self, username: str, room_name: Optional[str]):
+        with self.player_db_lock:
+            self.player_db[username]["current_room"] = room_name
+        self.save_player(username)
+
+    @contextmanager
+    def _hold_player_room(self, username: str):
+        """Hold the entity locks of a player and of the room it is in (room first),
+        yields the room name or None."""
+        while True:
+            record = self.player_db.get(username)
+            room_id = record.get("current_room") if isinstance(record, dict) else None
+            with self.room_locks.hold(room_id), self.player_locks.hold(username):
+                record = self.player_db.get(username)
+                if room_id != (record.get("current_room") if isinstance(record, dict) else None):
+                    continue  # moved to another room before we got the locks
+                yield room_id
+                return
 
     def write_player_data(self, username: str, password: str):
-        self.player_db[username] = {
-            "password": password, 
-            "create_time": time.time(), 
-            "last_login_time": None, 
-            "current_room": None,
-            "online": False
-        }
-        self.save_player_db()
+        with self.player_db_lock:
+            self.player_db[username] = {
+                "password": password, 
+                "create_time": time.time(), 
+                "last_login_time": None, 
+                "current_room": None,
+                "online": False
+            }
+        self.save_player(username)
 
     def _verify_developer_credential(self, username, password) -> tuple[bool, str]:
         if not username:
@@ -883,31 +1028,36 @@ class DatabaseServer:
         return not username in self.developer_db.keys()
     
     def _set_developer_online(self, username: str):
-        self.developer_db[username]["last_login_time"] = time.time()
-        self.developer_db[username]["online"] = True
-        self.save_developer_db()
+        with self.developer_db_lock:
+            self.developer_db[username]["last_login_time"] = time.time()
+            self.developer_db[username]["online"] = True
+        self.save_developer(username)
 
     def _set_developer_offline(self, username):
-        self.developer_db[username]["online"] = False
-        self.save_developer_db()
+        with self.developer_db_lock:
+            self.developer_db[username]["online"] = False
+        self.save_developer(username)
 
     def write_developer_data(self, username: str, password: str):
-        self.developer_db[username] = {
-            "password": password, 
-            "create_time": time.time(), 
-            "last_login_time": None, 
-            "online": False, 
-            "uploaded_games": {}
-        }
-        self.save_developer_db()
+        with self.developer_db_lock:
+            self.developer_db[username] = {
+                "password": password, 
+                "create_time": time.time(), 
+                "last_login_time": None, 
+                "online": False, 
+                "uploaded_games": {}
+            }
+        self.save_developer(username)
 
     def add_developer_uploaded_games(self, username: str, game_id: str, game_name: str, version: str):
-        if username not in self.developer_db:
-            return
-        self.developer_db[username]["uploaded_games"][game_id] = {Words.ParamKeys.Metadata.GAME_NAME: game_name, 
-                                                                  Words.ParamKeys.Metadata.VERSION: version, 
-                                                                  "last_update": time.time()}
-        self.save_developer_db()
+        with self.developer_locks.hold(username):
+            if username not in self.developer_db:
+                return
+            with self.developer_db_lock:
+                self.developer_db[username]["uploaded_games"][game_id] = {Words.ParamKeys.Metadata.GAME_NAME: game_name, 
+                                                                          Words.ParamKeys.Metadata.VERSION: version, 
+                                                                          "last_update": time.time()}
+            self.save_developer(username)
 
     def start(self) -> None:
         server_thread = threading.Thread(target=self.run)
@@ -926,7 +1076,8 @@ class DatabaseServer:
                 elif cmd == 'resetdeveloper':
                     self.reset_developer()
                 elif cmd == 'clearrooms':
-                    self.room_db.clear()
+                    with self.room_db_lock:
+                        self.room_db.clear()
                     self.save_room_db()
                 else:
                     print("invalid command.")
@@ -941,16 +1092,19 @@ class DatabaseServer:
         self.save_player_db()
         self.save_room_db()
         self.save_developer_db()
+        self.storage.close()
 
     def reset_player(self):
-        for username in self.player_db.keys():
-            self.player_db[username]["online"] = False
-            self.player_db[username]["current_room"] = None
+        with self.player_db_lock:
+            for username in self.player_db.keys():
+                self.player_db[username]["online"] = False
+                self.player_db[username]["current_room"] = None
         self.save_player_db()
 
     def reset_developer(self):
-        for username in self.developer_db.keys():
-            self.developer_db[username]["online"] = False
+        with self.developer_db_lock:
+            for username in self.developer_db.keys():
+                self.developer_db[username]["online"] = False
         self.save_developer_db()
 
     def stop(self):
@@ -965,18 +1119,24 @@ class DatabaseServer:
         except Exception:
             pass
 
-        if self.lobby_passer:
+        with self.server_links_lock:
+            links = list(self.lobby_passers) + list(self.developer_passers)
+        for passer in links:
             try:
-                self.lobby_passer.close()
+                passer.close()
             except Exception:
                 pass
 
-        if self.developer_passer:
-            try:
-                self.developer_passer.close()
-            except Exception:
-                pass
-        
+        self.storage.flush()
+
+
+    def accept_handshake(self, passer: MessageFormatPasser, received_message_id: str, handshake_data: dict) -> None:
+        """Answer a HANDSHAKE with SUCCESS, including the negotiated wire options, then switch to them."""
+        params = passer.negotiate(handshake_data)
+        self.send_response(passer, received_message_id, Words.Result.SUCCESS, params or None)
+        passer.apply_negotiated(params)
+        # only lobby / developer servers get this far, skip per-message type checks for them
+        passer.trusted = self.trust_server_links
 
     def send_response(self, passer: MessageFormatPasser, responding_id: str, result: str, params: Optional[dict] = None) -> str:
         message_id = str(uuid.uuid4())
@@ -0,0 +1,288 @@
+import bisect
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+from protocols.protocols import Words
+
+DEFAULT_STORE_PAGE_SIZE = 50
+MAX_STORE_PAGE_SIZE = 200
+STORE_SORT_KEYS = (Words.ParamKeys.Metadata.GAME_NAME, Words.ParamKeys.Metadata.GAME_ID,
+                   Words.ParamKeys.Metadata.PLAYERS, Words.ParamKeys.Metadata.UPLOADER,
+                   Words.ParamKeys.Metadata.SIZE)
+_NUMERIC_SORT_KEYS = (Words.ParamKeys.Metadata.PLAYERS, Words.ParamKeys.Metadata.SIZE)
+
+
+class GameCatalog:
+    """In-memory index of the games in GAME_FOLDER.
+
+    Built once by load() (the folder walk CHECK_STORE used to do on every
+    call) and kept current by put() when an upload is finalized. Lookups by
+    game_id, uploader and player count never touch the filesystem.
+
+    store_listing() is the CHECK_STORE payload: game_id -> metadata without
+    the game_id key. It is rebuilt only after a change and shared between
+    callers, which must not modify it.
+
+    big_metadata() is the cache for the per-request big_metadata.json reads
+    (DOWNLOAD_START, CREATE_ROOM, CHECK_GAME_VALID, UPLOAD_END): an entry is
+    served while the file's mtime and size match what was parsed, so a hit
+    costs one stat instead of an open and a json.load. The upload finalize
+    path re-stamps (put) or drops (invalidate) the entry it rewrote.
+
+    query() serves QUERY_STORE pages: filters narrow the candidates through
+    the uploader / player-count indexes, and each sort key keeps a sorted
+    (value, game_id) list, rebuilt only after a change, that pages are cut
+    from with bisect. The cursor is the last (value, game_id) returned, so
+    paging stays consistent while games are added.
+    """
+    def __init__(self, game_folder: Path) -> None:
+        self.game_folder = game_folder
+        self.lock = threading.Lock()
+        self.games: dict[str, dict] = {}
+        self.by_uploader: dict[str, set[str]] = {}
+        self.by_players: dict[int, set[str]] = {}
+        # game_id -> (mtime_ns, size) of the big_metadata.json games[game_id] was parsed from
+        self.stamps: dict[str, tuple[int, int]] = {}
+        self._listing: Optional[dict[str, dict]] = None
+        self._orders: dict[str, list[tuple]] = {}  # sort key -> sorted (value, game_id)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        games = {}
+        stamps = {}
+        try:
+            for game_dir in self.game_folder.iterdir():
+                if game_dir.is_dir():
+                    stamp = self._stamp(game_dir.name)
+                    big_meta = self.read_game(game_dir)
+                    if big_meta is not None:
+                        games[game_dir.name] = big_meta
+                        if stamp is not None:
+                            stamps[game_dir.name] = stamp
+        except Exception as e:
+            print(f"[GameCatalog] unexpected error while scanning {self.game_folder}: {e}")
+        with self.lock:
+            self.games = {}
+            self.by_uploader = {}
+            self.by_players = {}
+            for game_id, big_meta in games.items():
+                self._index(game_id, big_meta)
+            self.stamps = stamps
+            self._changed()
+        print(f"[GameCatalog] indexed {len(games)} games")
+
+    @staticmethod
+    def read_game(game_dir: Path) -> Optional[dict]:
+        """big_metadata.json of one game, or an aggregate of its versions'
+        metadata.json when it has none. None if there is no metadata at all."""
+        game_id = game_dir.name
+        big_meta_path = game_dir / "big_metadata.json"
+        if big_meta_path.exists():
+            try:
+                return json.loads(big_meta_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"[GameCatalog] failed to read big_metadata for {game_id}: {e}")
+                return None
+        versions = []
+        for v in game_dir.iterdir():
+            if not v.is_dir():
+                continue
+            mpath = v / "metadata.json"
+            if mpath.exists():
+                try:
+                    versions.append(json.loads(mpath.read_text(encoding="utf-8")))
+                except Exception:
+                    continue
+        if not versions:
+            return None
+        base = dict(versions[0])
+        base[Words.ParamKeys.Metadata.ALL_VERSIONS] = [str(m.get(Words.ParamKeys.Metadata.VERSION)) for m in versions if isinstance(m, dict)]
+        return base
+
+    def put(self, game_id: str, big_meta: dict) -> None:
+        """big_meta was just written to game_id's big_metadata.json."""
+        stamp = self._stamp(game_id)
+        with self.lock:
+            self._unindex(game_id)
+            self._index(game_id, dict(big_meta))
+            if stamp is not None:
+                self.stamps[game_id] = stamp
+            self._changed()
+
+    def remove(self, game_id: str) -> None:
+        with self.lock:
+            self._unindex(game_id)
+            self._changed()
+
+    def invalidate(self, game_id: str) -> None:
+        """Re-read game_id's big_metadata.json on the next big_metadata() call."""
+        with self.lock:
+            self.stamps.pop(game_id, None)
+
+    def big_metadata(self, game_id: str) -> Optional[dict]:
+        """Contents of GAME_FOLDER/<game_id>/big_metadata.json, None if it is
+        missing or unreadable. The dict is a copy; nested values are shared
+        with the cache and must not be modified."""
+        stamp = self._stamp(game_id)
+        if stamp is None:
+            with self.lock:
+                if self.stamps.pop(game_id, None) is not None:  # deleted since it was read
+                    self._unindex(game_id)
+                    self._changed()
+            return None
+        with self.lock:
+            if self.stamps.get(game_id) == stamp:
+                self.hits += 1
+                return dict(self.games[game_id])
+        try:
+            big_meta = json.loads((self.game_folder / game_id / "big_metadata.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"[GameCatalog] failed to read big_metadata for {game_id}: {e}")
+            return None
+        if not isinstance(big_meta, dict):
+            return None
+        with self.lock:
+            self.misses += 1
+            self._unindex(game_id)
+            self._index(game_id, big_meta)
+            self.stamps[game_id] = stamp
+            self._changed()
+        return dict(big_meta)
+
+    def get(self, game_id: str) -> Optional[dict]:
+        with self.lock:
+            big_meta = self.games.get(game_id)
+            return dict(big_meta) if big_meta is not None else None
+
+    def ids_by_uploader(self, uploader: str) -> list[str]:
+        with self.lock:
+            return sorted(self.by_uploader.get(uploader, ()))
+
+    def ids_by_players(self, players: int) -> list[str]:
+        with self.lock:
+            return sorted(self.by_players.get(players, ()))
+
+    def store_listing(self) -> dict[str, dict]:
+        with self.lock:
+            if self._listing is None:
+                listing = {}
+                for game_id, big_meta in self.games.items():
+                    cleaned = dict(big_meta)
+                    cleaned.pop(Words.ParamKeys.Metadata.GAME_ID, None)  # the key already is the game_id
+                    listing[game_id] = cleaned
+                self._listing = listing
+            return self._listing
+
+    def query(self, name: Optional[str] = None, players: Optional[int] = None, uploader: Optional[str] = None,
+              sort: str = Words.ParamKeys.Metadata.GAME_NAME, descending: bool = False,
+              limit: int = DEFAULT_STORE_PAGE_SIZE, cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        """One page of games (metadata including game_id) matching every given
+        filter; name is a case-insensitive substring of the game name. Returns
+        the page and the cursor of the next one, None on the last page.
+        ValueError on an unknown sort key or a malformed cursor."""
+        if sort not in STORE_SORT_KEYS:
+            raise ValueError(f"unknown sort key: {sort}")
+        limit = max(1, min(int(limit), MAX_STORE_PAGE_SIZE))
+        after = self._decode_cursor(cursor) if cursor else None
+        if after is not None and isinstance(after[0], int) != (sort in _NUMERIC_SORT_KEYS):
+            raise ValueError(f"cursor does not belong to sort key {sort}")
+        needle = name.casefold() if name else None
+        with self.lock:
+            candidates: Optional[set[str]] = None
+            if uploader is not None:
+                candidates = self.by_uploader.get(str(uploader), set())
+            if players is not None:
+                with_players = self.by_players.get(players, set())
+                candidates = with_players if candidates is None else candidates & with_players
+            if candidates is None:
+                order = self._orders.get(sort)
+                if order is None:
+                    order = self._orders[sort] = sorted(
+                        (self._sort_value(big_meta, game_id, sort), game_id) for game_id, big_meta in self.games.items())
+            else:  # the index already narrowed it down, sort just those
+                order = sorted((self._sort_value(self.games[game_id], game_id, sort), game_id) for game_id in candidates)
+            if descending:
+                end = bisect.bisect_left(order, after) if after is not None else len(order)
+                positions = range(end - 1, -1, -1)
+            else:
+                start = bisect.bisect_right(order, after) if after is not None else 0
+                positions = range(start, len(order))
+            page = []
+            last = None
+            for i in positions:
+                key = order[i]
+                big_meta = self.games[key[1]]
+                if needle is not None and needle not in str(big_meta.get(Words.ParamKeys.Metadata.GAME_NAME, "")).casefold():
+                    continue
+                if len(page) == limit:
+                    return page, self._encode_cursor(last)
+                game = dict(big_meta)
+                game[Words.ParamKeys.Metadata.GAME_ID] = key[1]
+                page.append(game)
+                last = key
+            return page, None
+
+    @staticmethod
+    def _sort_value(big_meta: dict, game_id: str, sort: str):
+        if sort == Words.ParamKeys.Metadata.GAME_ID:
+            return game_id
+        value = big_meta.get(sort)
+        if sort in _NUMERIC_SORT_KEYS:
+            return value if isinstance(value, int) else -1
+        return str(value if value is not None else "").casefold()
+
+    @staticmethod
+    def _encode_cursor(key: Optional[tuple]) -> Optional[str]:
+        return json.dumps(list(key), separators=(",", ":")) if key is not None else None
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        try:
+            value, game_id = json.loads(cursor)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"invalid cursor: {cursor!r}") from e
+        if not isinstance(game_id, str) or not isinstance(value, (str, int)):
+            raise ValueError(f"invalid cursor: {cursor!r}")
+        return value, game_id
+
+    def _changed(self) -> None:
+        self._listing = None
+        self._orders = {}
+
+    def _index(self, game_id: str, big_meta: dict) -> None:
+        self.games[game_id] = big_meta
+        uploader, players = self._index_keys(big_meta)
+        if uploader is not None:
+            self.by_uploader.setdefault(uploader, set()).add(game_id)
+        if players is not None:
+            self.by_players.setdefault(players, set()).add(game_id)
+
+    def _stamp(self, game_id: str) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.game_folder / game_id / "big_metadata.json")
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _unindex(self, game_id: str) -> None:
+        self.stamps.pop(game_id, None)
+        big_meta = self.games.pop(game_id, None)
+        if big_meta is None:
+            return
+        uploader, players = self._index_keys(big_meta)
+        for index, key in ((self.by_uploader, uploader), (self.by_players, players)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(game_id)
+                if not ids:
+                    del index[key]
+
+    @staticmethod
+    def _index_keys(big_meta: dict) -> tuple[Optional[str], Optional[int]]:
+        uploader = big_meta.get(Words.ParamKeys.Metadata.UPLOADER)
+        players = big_meta.get(Words.ParamKeys.Metadata.PLAYERS)
+        return (str(uploader) if uploader is not None else None,
+                players if isinstance(players, int) else None)
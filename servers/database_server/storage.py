@@ -0,0 +1,623 @@
+import copy
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+from protocols.protocols import Words
+
+PLAYERS = "players"
+ROOMS = "rooms"
+DEVELOPERS = "developers"
+TABLES = (PLAYERS, ROOMS, DEVELOPERS)
+
+DEFAULT_WRITE_BEHIND_INTERVAL = 0.5  # seconds; 0 = write every change through
+DEFAULT_WRITE_BEHIND_BATCH = 256  # pending changes that trigger an early flush
+
+
+class Storage(ABC):
+    """Persistence behind DatabaseServer's in-memory tables.
+
+    DatabaseServer keeps player_db / room_db / developer_db as plain dicts and
+    serves every read from them. The storage loads them once at startup, is
+    handed the live dict plus its table lock (bind), and is told after each
+    write which record changed (record_changed) or that the whole table did
+    (table_changed). How and when that reaches the disk is up to the engine.
+    """
+    @abstractmethod
+    def load(self, table: str) -> dict:
+        ...
+
+    @abstractmethod
+    def bind(self, table: str, data: dict, lock: threading.RLock) -> None:
+        ...
+
+    @abstractmethod
+    def record_changed(self, table: str, key: str) -> None:
+        """table[key] was written, or deleted if it is gone from the dict."""
+
+    @abstractmethod
+    def table_changed(self, table: str) -> None:
+        ...
+
+    def record_game(self, game_id: str, big_meta: dict) -> None:
+        """A game version was finalized. Games live in GAME_FOLDER; engines may index them too."""
+
+    def flush(self) -> None:
+        """Make everything reported so far durable."""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class JsonStorage(Storage):
+    """One JSON file per table (the original format).
+
+    With write_behind_interval = 0 every change rewrites the table's file
+    before returning. Otherwise changes only mark the table dirty and a
+    flusher thread rewrites dirty tables every write_behind_interval seconds,
+    or as soon as write_behind_batch changes are pending, so a burst of
+    logins costs a few rewrites instead of one per login. flush / close
+    write whatever is pending. Files are replaced atomically (temp file +
+    os.replace), so a crash leaves the previous or the new version, never
+    half of one.
+    """
+    def __init__(self, paths: dict[str, Path],
+                 write_behind_interval: float = DEFAULT_WRITE_BEHIND_INTERVAL,
+                 write_behind_batch: int = DEFAULT_WRITE_BEHIND_BATCH) -> None:
+        self.paths = paths
+        self.tables: dict[str, tuple[dict, threading.RLock]] = {}
+        self.file_locks = {table: threading.Lock() for table in paths}
+        self.save_generations: dict[str, int] = {}
+        self.written_generations: dict[str, int] = {}
+        self.write_behind_interval = write_behind_interval
+        self.write_behind_batch = write_behind_batch
+        self.dirty: dict[str, int] = {}  # table -> changes not written yet
+        self.dirty_lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # one flush of the dirty set at a time
+        self.flush_event = threading.Event()
+        self.closed = False
+        self.changes = 0
+        self.writes = 0
+        self.flusher: Optional[threading.Thread] = None
+        if write_behind_interval > 0:
+            self.flusher = threading.Thread(target=self._flush_loop, name="json-flusher", daemon=True)
+            self.flusher.start()
+
+    def load(self, table: str) -> dict:
+        path = self.paths[table]
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def bind(self, table: str, data: dict, lock: threading.RLock) -> None:
+        self.tables[table] = (data, lock)
+
+    def record_changed(self, table: str, key: str) -> None:
+        self.table_changed(table)
+
+    def table_changed(self, table: str) -> None:
+        self.changes += 1
+        if self.flusher is None:
+            self._write(table)
+            return
+        with self.dirty_lock:
+            self.dirty[table] = self.dirty.get(table, 0) + 1
+            pending = sum(self.dirty.values())
+        if pending >= self.write_behind_batch:
+            self.flush_event.set()
+
+    def flush(self) -> None:
+        with self.flush_lock:
+            with self.dirty_lock:
+                tables = list(self.dirty)
+                self.dirty.clear()
+            for i, table in enumerate(tables):
+                try:
+                    self._write(table)
+                except OSError:
+                    with self.dirty_lock:  # retried on the next flush
+                        for unwritten in tables[i:]:
+                            self.dirty[unwritten] = self.dirty.get(unwritten, 0) + 1
+                    raise
+
+    def close(self) -> None:
+        self.closed = True
+        if self.flusher is not None:
+            self.flush_event.set()
+            self.flusher.join()
+        self.flush()
+
+    def _flush_loop(self) -> None:
+        while not self.closed:
+            self.flush_event.wait(self.write_behind_interval)
+            self.flush_event.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[JsonStorage] write-behind flush failed: {e}")
+
+    def _write(self, table: str) -> None:
+        """Copy the table under its lock, write the copy outside it. Saves of one
+        file are numbered; a copy older than what is already on disk is dropped."""
+        data, lock = self.tables[table]
+        with lock:
+            snapshot = copy.deepcopy(data)
+            generation = self.save_generations[table] = self.save_generations.get(table, 0) + 1
+        with self.file_locks[table]:
+            if self.written_generations.get(table, 0) > generation:
+                return
+            path = self.paths[table]
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self.written_generations[table] = generation
+            self.writes += 1
+
+
+# -- SQLite ----------------------------------------------------------------
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS players (
+    username TEXT PRIMARY KEY,
+    password TEXT,
+    create_time REAL,
+    last_login_time REAL,
+    current_room TEXT,
+    online INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS players_current_room ON players(current_room);
+CREATE INDEX IF NOT EXISTS players_online ON players(online);
+CREATE TABLE IF NOT EXISTS developers (
+    username TEXT PRIMARY KEY,
+    password TEXT,
+    create_time REAL,
+    last_login_time REAL,
+    online INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS developer_games (
+    username TEXT NOT NULL,
+    game_id TEXT NOT NULL,
+    game_name TEXT,
+    version TEXT,
+    last_update REAL,
+    PRIMARY KEY (username, game_id)
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    room_name TEXT PRIMARY KEY,
+    owner TEXT,
+    game_id TEXT,
+    expected_players INTEGER,
+    is_playing INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS rooms_game_id ON rooms(game_id);
+CREATE TABLE IF NOT EXISTS room_players (
+    room_name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (room_name, position)
+);
+CREATE INDEX IF NOT EXISTS room_players_username ON room_players(username);
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    game_name TEXT,
+    uploader TEXT,
+    version TEXT,
+    file_name TEXT,
+    players INTEGER,
+    size INTEGER,
+    sha256 TEXT,
+    all_versions TEXT
+);
+CREATE INDEX IF NOT EXISTS games_uploader ON games(uploader);
+CREATE INDEX IF NOT EXISTS games_players ON games(players);
+"""
+
+
+class _TableSpec:
+    """How the records of one in-memory table map onto a SQLite row (+ child rows)."""
+    def __init__(self, sql_table: str, key_column: str, fields: tuple[str, ...], bool_fields: tuple[str, ...],
+                 child_field: Optional[str] = None) -> None:
+        self.sql_table = sql_table
+        self.key_column = key_column
+        self.fields = fields
+        self.bool_fields = bool_fields
+        self.child_field = child_field  # kept in a child table, not in extra
+        columns = ", ".join((key_column, *fields, "extra"))
+        marks = ", ".join("?" * (len(fields) + 2))
+        # fixed SQL text, so sqlite3's statement cache prepares each one once
+        self.upsert_sql = f"INSERT OR REPLACE INTO {sql_table} ({columns}) VALUES ({marks})"
+        self.delete_sql = f"DELETE FROM {sql_table} WHERE {key_column} = ?"
+        self.clear_sql = f"DELETE FROM {sql_table}"
+        self.select_sql = f"SELECT {columns} FROM {sql_table}"
+
+    def to_row(self, key: str, record) -> tuple:
+        if not isinstance(record, dict):
+            record = {"password": record}  # very old player_db entries were just the password
+        extra = {k: v for k, v in record.items() if k not in self.fields and k != self.child_field}
+        values = tuple(record.get(field) for field in self.fields)
+        return (key, *values, json.dumps(extra) if extra else None)
+
+    def from_row(self, row: tuple) -> tuple[str, dict]:
+        key, *values, extra = row
+        record = json.loads(extra) if extra else {}
+        for field, value in zip(self.fields, values):
+            record[field] = bool(value) if field in self.bool_fields else value
+        return key, record
+
+
+_SPECS = {
+    PLAYERS: _TableSpec("players", "username",
+                        ("password", "create_time", "last_login_time", "current_room", "online"), ("online",)),
+    DEVELOPERS: _TableSpec("developers", "username",
+                           ("password", "create_time", "last_login_time", "online"), ("online",),
+                           child_field="uploaded_games"),
+    ROOMS: _TableSpec("rooms", "room_name",
+                      (Words.ParamKeys.Room.OWNER, Words.ParamKeys.Room.GAME_ID,
+                       Words.ParamKeys.Room.EXPECTED_PLAYERS, Words.ParamKeys.Room.IS_PLAYING),
+                      (Words.ParamKeys.Room.IS_PLAYING,),
+                      child_field=Words.ParamKeys.Room.PLAYER_LIST),
+}
+
+_DELETE_DEVELOPER_GAMES = "DELETE FROM developer_games WHERE username = ?"
+_INSERT_DEVELOPER_GAME = ("INSERT INTO developer_games (username, game_id, game_name, version, last_update) "
+                          "VALUES (?, ?, ?, ?, ?)")
+_SELECT_DEVELOPER_GAMES = "SELECT username, game_id, game_name, version, last_update FROM developer_games"
+_DELETE_ROOM_PLAYERS = "DELETE FROM room_players WHERE room_name = ?"
+_INSERT_ROOM_PLAYER = "INSERT INTO room_players (room_name, position, username) VALUES (?, ?, ?)"
+_SELECT_ROOM_PLAYERS = "SELECT room_name, username FROM room_players ORDER BY room_name, position"
+_UPSERT_GAME = ("INSERT OR REPLACE INTO games (game_id, game_name, uploader, version, file_name, players, size, "
+                "sha256, all_versions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class SqliteStorage(Storage):
+    """Embedded SQLite database in WAL mode. Each record change is one small
+    transaction touching only that record's rows, instead of a rewrite of the
+    whole table, and a crash leaves the last committed state intact.
+
+    One connection is shared by the request pool threads, serialized by
+    db_lock; WAL keeps the file readable for outside tools meanwhile.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.db_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; WAL keeps it consistent
+        self.conn.execute("PRAGMA foreign_keys=OFF")
+        self.conn.executescript(SCHEMA)
+        self.tables: dict[str, tuple[dict, threading.RLock]] = {}
+        with self.db_lock:
+            self._set_meta("schema_version", str(SCHEMA_VERSION))
+
+    def load(self, table: str) -> dict:
+        spec = _SPECS[table]
+        with self.db_lock:
+            data = dict(spec.from_row(row) for row in self.conn.execute(spec.select_sql))
+            if table == DEVELOPERS:
+                for record in data.values():
+                    record["uploaded_games"] = {}
+                for username, game_id, game_name, version, last_update in self.conn.execute(_SELECT_DEVELOPER_GAMES):
+                    if username in data:
+                        data[username]["uploaded_games"][game_id] = {
+                            Words.ParamKeys.Metadata.GAME_NAME: game_name,
+                            Words.ParamKeys.Metadata.VERSION: version,
+                            "last_update": last_update,
+                        }
+            elif table == ROOMS:
+                for record in data.values():
+                    record[Words.ParamKeys.Room.PLAYER_LIST] = []
+                for room_name, username in self.conn.execute(_SELECT_ROOM_PLAYERS):
+                    if room_name in data:
+                        data[room_name][Words.ParamKeys.Room.PLAYER_LIST].append(username)
+        return data
+
+    def bind(self, table: str, data: dict, lock: threading.RLock) -> None:
+        self.tables[table] = (data, lock)
+
+    def record_changed(self, table: str, key: str) -> None:
+        data, lock = self.tables[table]
+        with lock:
+            record = copy.deepcopy(data.get(key))
+        with self.db_lock:
+            self.conn.execute("BEGIN")
+            try:
+                self._write_record(table, key, record)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def table_changed(self, table: str) -> None:
+        data, lock = self.tables[table]
+        with lock:
+            snapshot = copy.deepcopy(data)
+        self._replace_table(table, snapshot)
+
+    def record_game(self, game_id: str, big_meta: dict) -> None:
+        meta = Words.ParamKeys.Metadata
+        row = (game_id, big_meta.get(meta.GAME_NAME), big_meta.get(meta.UPLOADER), big_meta.get(meta.VERSION),
+               big_meta.get(meta.FILE_NAME), big_meta.get(meta.PLAYERS), big_meta.get(meta.SIZE),
+               big_meta.get(meta.SHA256), json.dumps(big_meta.get(meta.ALL_VERSIONS) or []))
+        with self.db_lock:
+            self.conn.execute(_UPSERT_GAME, row)
+
+    def flush(self) -> None:
+        with self.db_lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        self.flush()
+        with self.db_lock:
+            self.conn.close()
+
+    def migrate_from_json(self, json_paths: dict[str, Path], game_folder: Optional[Path] = None) -> bool:
+        """One-time import of the JSON files (and GAME_FOLDER's big_metadata.json)
+        into an empty database. Returns True if anything was imported."""
+        with self.db_lock:
+            if self._get_meta("migrated_from_json"):
+                return False
+            for table in TABLES:
+                if self.conn.execute(f"SELECT 1 FROM {_SPECS[table].sql_table} LIMIT 1").fetchone():
+                    self._set_meta("migrated_from_json", "skipped, database not empty")
+                    return False
+        imported = JsonStorage(json_paths, write_behind_interval=0)
+        for table in TABLES:
+            if table in json_paths:
+                self._replace_table(table, imported.load(table))
+        if game_folder is not None and game_folder.exists():
+            for game_dir in game_folder.iterdir():
+                big_meta_path = game_dir / "big_metadata.json"
+                if big_meta_path.exists():
+                    try:
+                        self.record_game(game_dir.name, json.loads(big_meta_path.read_text(encoding="utf-8")))
+                    except Exception as e:
+                        print(f"[SqliteStorage] skipped {big_meta_path}: {e}")
+        with self.db_lock:
+            self._set_meta("migrated_from_json", ", ".join(str(p) for p in json_paths.values()))
+        return True
+
+    def _replace_table(self, table: str, data: dict) -> None:
+        spec = _SPECS[table]
+        with self.db_lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(spec.clear_sql)
+                if table == DEVELOPERS:
+                    self.conn.execute("DELETE FROM developer_games")
+                elif table == ROOMS:
+                    self.conn.execute("DELETE FROM room_players")
+                for key, record in data.items():
+                    self._write_record(table, key, record)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _write_record(self, table: str, key: str, record) -> None:
+        """Inside a transaction: replace the rows of one record (delete if record is None)."""
+        spec = _SPECS[table]
+        if table == DEVELOPERS:
+            self.conn.execute(_DELETE_DEVELOPER_GAMES, (key,))
+        elif table == ROOMS:
+            self.conn.execute(_DELETE_ROOM_PLAYERS, (key,))
+        if record is None:
+            self.conn.execute(spec.delete_sql, (key,))
+            return
+        self.conn.execute(spec.upsert_sql, spec.to_row(key, record))
+        if table == DEVELOPERS and isinstance(record, dict):
+            self.conn.executemany(_INSERT_DEVELOPER_GAME, [
+                (key, game_id, game.get(Words.ParamKeys.Metadata.GAME_NAME),
+                 game.get(Words.ParamKeys.Metadata.VERSION), game.get("last_update"))
+                for game_id, game in (record.get("uploaded_games") or {}).items()
+            ])
+        elif table == ROOMS and isinstance(record, dict):
+            self.conn.executemany(_INSERT_ROOM_PLAYER, [
+                (key, position, username)
+                for position, username in enumerate(record.get(Words.ParamKeys.Room.PLAYER_LIST) or [])
+            ])
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# -- Journal ---------------------------------------------------------------
+
+DEFAULT_JOURNAL_SYNC_INTERVAL = 0.2  # seconds between fsyncs of the journal; 0 = fsync every record
+DEFAULT_JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024  # journal size that triggers a snapshot
+
+
+class JournalStorage(Storage):
+    """Snapshot file plus an append-only journal.
+
+    Every change appends one line [table, key, record] (record null = deleted,
+    key null = the whole table) to the journal, so a write costs the size of
+    the record rather than of the database. The journal is fsync'd every
+    sync_interval seconds by a background thread, which bounds what a crash
+    can lose to that unsynced tail.
+
+    Once the journal outgrows compact_bytes, and on close, it is compacted:
+    appends switch to journal.<n+1>.log, the tables are written to the
+    snapshot tagged with generation n+1, and older journals are deleted.
+    Startup loads the snapshot (or the JSON files the first time) and
+    replays journals from the snapshot's generation on, last write winning;
+    a torn last line from a crash is dropped.
+    """
+    def __init__(self, directory: Path, json_paths: Optional[dict[str, Path]] = None,
+                 sync_interval: float = DEFAULT_JOURNAL_SYNC_INTERVAL,
+                 compact_bytes: int = DEFAULT_JOURNAL_COMPACT_BYTES) -> None:
+        self.directory = directory
+        self.snapshot_path = directory / "snapshot.json"
+        self.sync_interval = sync_interval
+        self.compact_bytes = compact_bytes
+        self.tables: dict[str, tuple[dict, threading.RLock]] = {}
+        self.journal_lock = threading.Lock()  # taken after a table lock, never before
+        self.compact_lock = threading.Lock()
+        self.unsynced = False
+        self.closed = False
+        self.wake_event = threading.Event()
+        self.loaded, self.generation = self._recover(json_paths)
+        self.journal = open(self._journal_path(self.generation), 'a', encoding="utf-8")
+        self.journal_bytes = self.journal.tell()
+        self.maintainer = threading.Thread(target=self._maintenance_loop, name="journal-maintainer", daemon=True)
+        self.maintainer.start()
+
+    def load(self, table: str) -> dict:
+        return self.loaded.pop(table, {})
+
+    def bind(self, table: str, data: dict, lock: threading.RLock) -> None:
+        self.tables[table] = (data, lock)
+
+    def record_changed(self, table: str, key: str) -> None:
+        data, lock = self.tables[table]
+        # serialized and appended under the table lock, so the journal order of
+        # one record's versions is the order they were written in memory
+        with lock:
+            self._append(json.dumps([table, key, data.get(key)], separators=(",", ":")))
+
+    def table_changed(self, table: str) -> None:
+        data, lock = self.tables[table]
+        with lock:
+            self._append(json.dumps([table, None, data], separators=(",", ":")))
+
+    def flush(self) -> None:
+        with self.journal_lock:
+            self._sync()
+
+    def close(self) -> None:
+        self.closed = True
+        self.wake_event.set()
+        self.maintainer.join()
+        self.compact()
+        with self.journal_lock:
+            self.journal.close()
+
+    def compact(self) -> None:
+        """Snapshot every table and drop the journals it covers."""
+        with self.compact_lock:
+            with self.journal_lock:
+                self._sync()
+                self.journal.close()
+                self.generation += 1
+                self.journal = open(self._journal_path(self.generation), 'a', encoding="utf-8")
+                self.journal_bytes = 0
+                generation = self.generation
+            # taken after the switch: the snapshot holds at least everything in
+            # the older journals, and the new journal replays on top of it
+            snapshot = {}
+            for table, (data, lock) in self.tables.items():
+                with lock:
+                    snapshot[table] = copy.deepcopy(data)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w', encoding="utf-8") as f:
+                json.dump({"generation": generation, "tables": snapshot}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            for older, path in self._journal_files():
+                if older < generation:
+                    os.remove(path)
+
+    def _append(self, line: str) -> None:
+        with self.journal_lock:
+            self.journal.write(line + "\n")
+            self.journal.flush()  # in the OS from here on; a crash of the process loses nothing
+            self.journal_bytes += len(line) + 1
+            self.unsynced = True
+            if self.sync_interval <= 0:
+                self._sync()
+        if self.journal_bytes >= self.compact_bytes:
+            self.wake_event.set()
+
+    def _sync(self) -> None:
+        if self.unsynced:
+            os.fsync(self.journal.fileno())
+            self.unsynced = False
+
+    def _maintenance_loop(self) -> None:
+        interval = self.sync_interval if self.sync_interval > 0 else 1.0
+        while not self.closed:
+            self.wake_event.wait(interval)
+            self.wake_event.clear()
+            try:
+                self.flush()
+                if self.journal_bytes >= self.compact_bytes and not self.closed:
+                    self.compact()
+            except OSError as e:
+                print(f"[JournalStorage] maintenance failed: {e}")
+
+    def _journal_path(self, generation: int) -> Path:
+        return self.directory / f"journal.{generation}.log"
+
+    def _journal_files(self) -> list[tuple[int, Path]]:
+        files = []
+        for path in self.directory.glob("journal.*.log"):
+            try:
+                files.append((int(path.name.split(".")[1]), path))
+            except ValueError:
+                continue
+        return sorted(files)
+
+    def _recover(self, json_paths: Optional[dict[str, Path]]) -> tuple[dict[str, dict], int]:
+        if self.snapshot_path.exists():
+            with open(self.snapshot_path, 'r', encoding="utf-8") as f:
+                snapshot = json.load(f)
+            tables, generation = snapshot["tables"], snapshot["generation"]
+        else:
+            seed = JsonStorage(json_paths or {}, write_behind_interval=0)
+            tables, generation = {table: seed.load(table) for table in seed.paths}, 0
+        for table in TABLES:
+            tables.setdefault(table, {})
+        journals = [(g, path) for g, path in self._journal_files() if g >= generation]
+        for g, path in journals:
+            replayed = self._replay(path, tables)
+            if replayed:
+                print(f"[JournalStorage] replayed {replayed} records from {path.name}")
+        if journals:
+            generation = journals[-1][0]
+        return tables, generation
+
+    @staticmethod
+    def _replay(path: Path, tables: dict[str, dict]) -> int:
+        replayed = 0
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for raw in f:
+                try:
+                    if not raw.endswith(b"\n"):
+                        raise ValueError("no newline")
+                    table, key, record = json.loads(raw)
+                except ValueError:
+                    print(f"[JournalStorage] dropped torn record at byte {good_bytes} of {path.name}")
+                    break
+                if key is None:
+                    tables[table] = record
+                elif record is None:
+                    tables[table].pop(key, None)
+                else:
+                    tables[table][key] = record
+                replayed += 1
+                good_bytes += len(raw)
+        if good_bytes < path.stat().st_size:
+            with open(path, 'r+b') as f:
+                f.truncate(good_bytes)  # appends continue after the last whole record
+        return replayed
@@ -0,0 +1,103 @@
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+from protocols.protocols import Words
+
+DEFAULT_MAX_UPLOAD_SESSIONS = 8
+DEFAULT_MAX_UPLOAD_BYTES = 1024 * 1024 * 1024  # declared sizes of all open sessions together
+DEFAULT_UPLOAD_SESSION_TTL = 120.0  # seconds a received upload waits for its UPLOAD_END
+
+
+class UploadLimitError(RuntimeError):
+    """UPLOAD_START refused: a session cap is reached or the same game version is already uploading."""
+
+
+class UploadSession:
+    """One UPLOAD_START .. UPLOAD_END exchange."""
+    def __init__(self, params: dict, game_file_path: Path) -> None:
+        self.upload_id = str(uuid.uuid4())
+        self.params = params
+        self.game_file_path = game_file_path
+        self.size: int = params[Words.ParamKeys.Metadata.SIZE]
+        self.key = (str(params[Words.ParamKeys.Metadata.GAME_ID]), str(params[Words.ParamKeys.Metadata.VERSION]))
+        self.created_at = time.time()
+        self.done_event = threading.Event()  # set once the file transfer ended, successfully or not
+        self.received = False
+        self.received_sha256: Optional[str] = None  # measured by FileReceiver while the file arrived
+        self.received_size: Optional[int] = None
+        self.finished_at: Optional[float] = None
+        self.claimed = False  # an UPLOAD_END is handling it
+
+    def finish(self, received: bool, received_sha256: Optional[str] = None,
+               received_size: Optional[int] = None) -> None:
+        self.received = received
+        self.received_sha256 = received_sha256
+        self.received_size = received_size
+        self.finished_at = time.time()
+        self.done_event.set()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        return self.done_event.wait(timeout)
+
+
+class UploadSessions:
+    """Open upload sessions by upload_id, capped by count and by declared bytes.
+    A single upload larger than max_bytes is still accepted when it is alone."""
+    def __init__(self, max_sessions: int = DEFAULT_MAX_UPLOAD_SESSIONS,
+                 max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+                 ttl: float = DEFAULT_UPLOAD_SESSION_TTL) -> None:
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.sessions: dict[str, UploadSession] = {}
+        self.inflight_bytes = 0
+
+    def open(self, params: dict, game_file_path: Path) -> UploadSession:
+        session = UploadSession(params, game_file_path)
+        with self.lock:
+            self._reap()
+            if any(other.key == session.key for other in self.sessions.values()):
+                raise UploadLimitError(f"Version {session.key[1]} of {session.key[0]} is already uploading.")
+            if len(self.sessions) >= self.max_sessions:
+                raise UploadLimitError("Too many uploads in progress, try again later.")
+            if self.sessions and self.inflight_bytes + session.size > self.max_bytes:
+                raise UploadLimitError("Too much upload data in flight, try again later.")
+            self.sessions[session.upload_id] = session
+            self.inflight_bytes += session.size
+        return session
+
+    def claim(self, upload_id: Optional[str]) -> Optional[UploadSession]:
+        """The session of upload_id, reserved for the calling UPLOAD_END; None if
+        there is none or another UPLOAD_END has it. Without an id (older
+        developer servers), the only open session, if there is exactly one."""
+        with self.lock:
+            if upload_id is None:
+                session = next(iter(self.sessions.values())) if len(self.sessions) == 1 else None
+            else:
+                session = self.sessions.get(upload_id)
+            if session is None or session.claimed:
+                return None
+            session.claimed = True
+            return session
+
+    def release(self, session: UploadSession) -> None:
+        """Give a claimed session back, for a later UPLOAD_END."""
+        with self.lock:
+            session.claimed = False
+
+    def close(self, session: UploadSession) -> None:
+        with self.lock:
+            if self.sessions.pop(session.upload_id, None) is not None:
+                self.inflight_bytes -= session.size
+
+    def _reap(self) -> None:
+        """Drop sessions whose transfer ended ttl seconds ago without an UPLOAD_END."""
+        now = time.time()
+        for upload_id, session in list(self.sessions.items()):
+            if not session.claimed and session.finished_at is not None and now - session.finished_at > self.ttl:
+                print(f"[UploadSessions] dropping abandoned upload {upload_id} of {session.key[0]} {session.key[1]}")
+                del self.sessions[upload_id]
+                self.inflight_bytes -= session.size
@@ -1,17 +1,19 @@
 import threading
 import socket
 from base.message_format_passer import MessageFormatPasser
-from protocols.protocols import Formats, Words
+from protocols.protocols import Words
 from typing import Optional
 from base.peer_worker import PeerWorker
-import time
 import uuid
-from servers.server_base import ServerBase
+from servers.server_base import (ServerBase, DEFAULT_MAX_PENDING_HANDSHAKES, DEFAULT_MAX_CONNECTIONS, 
+                                 DEFAULT_SESSION_POOL_SIZE, DEFAULT_DB_POOL_SIZE)
+from servers.selector_core import DEFAULT_HANDLER_POOL_SIZE
 from base.file_receiver import FileReceiver
 from base.file_sender import FileSender
+from base.transfer_framing import choose_framing, offer_framings
 import queue
 from pathlib import Path
-import hashlib, json, os
+import json, os
 from base.file_checker import FileChecker
 
 DEFAULT_ACCEPT_TIMEOUT = 1.0
@@ -23,10 +25,16 @@ DEFAULT_DB_HEARTBEAT_INTERVAL = 10.0
 DEFAULT_DB_HEARTBEAT_PATIENCE = 3
 DEFAULT_DB_RESPONSE_TIMEOUT = 3.0
 DEFAULT_CLIENT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_SELECTOR_CORE = True  # developers are multiplexed on one event loop + handler pool
+DEFAULT_DB_UPLOAD_WORKERS = 4  # uploads forwarded to the database concurrently
+DEFAULT_DB_UPLOAD_ATTEMPTS = 3  # a broken-off forward to the database is retried and resumes
+DEFAULT_UPLOAD_END_WAIT = 3.0  # how long UPLOAD_END waits for a file still arriving
 
 GAME_CACHE_DIR = Path(__file__).resolve().parent / "game_cache"
 
 class DeveloperServer(ServerBase):
+    SESSION_ROLES = (Words.Roles.DEVELOPER,)
+
     def __init__(self, host: str = "0.0.0.0", port: int = 21355, 
                  db_host: str = "127.0.0.1", db_port: int = 32132, 
                  accept_timeout = DEFAULT_ACCEPT_TIMEOUT, 
@@ -37,21 +45,33 @@ class DeveloperServer(ServerBase):
                  max_handshake_try_count = DEFAULT_MAX_HANDSHAKE_TRY_COUNT, 
                  db_heartbeat_interval = DEFAULT_DB_HEARTBEAT_INTERVAL, 
                  db_heartbeat_patience = DEFAULT_DB_HEARTBEAT_PATIENCE, 
-                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT) -> None:
+                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT, 
+                 selector_core = DEFAULT_SELECTOR_CORE, 
+                 handler_pool_size = DEFAULT_HANDLER_POOL_SIZE, 
+                 max_pending_handshakes = DEFAULT_MAX_PENDING_HANDSHAKES, 
+                 max_connections = DEFAULT_MAX_CONNECTIONS, 
+                 session_pool_size = DEFAULT_SESSION_POOL_SIZE, 
+                 db_pool_size = DEFAULT_DB_POOL_SIZE, 
+                 db_upload_workers = DEFAULT_DB_UPLOAD_WORKERS) -> None:
         super().__init__(host, port, db_host, db_port, Words.Roles.DEVELOPERSERVER, 
                          accept_timeout, connect_timeout, receive_timeout, handshake_timeout, 
                          db_response_timeout, max_handshake_try_count, db_heartbeat_interval, 
-                         db_heartbeat_patience, client_heartbeat_timeout)
+                         db_heartbeat_patience, client_heartbeat_timeout, 
+                         selector_core=selector_core, handler_pool_size=handler_pool_size, 
+                         max_pending_handshakes=max_pending_handshakes, max_connections=max_connections, 
+                         session_pool_size=session_pool_size, db_pool_size=db_pool_size)
         self.passer_developer_dict: dict[MessageFormatPasser, str | None] = {}
                 # track ongoing uploads per connection
         self.upload_state: dict[MessageFormatPasser, dict] = {}
         self.upload_state_lock = threading.Lock()
         self.upload_to_database_queue: queue.Queue[Path] = queue.Queue() # storing path of .zip
-        self.upload_to_database_thread = threading.Thread(target=self.upload_to_database_loop)
+        self.upload_to_database_threads = [threading.Thread(target=self.upload_to_database_loop, name=f"upload-to-db-{i}")
+                                           for i in range(db_upload_workers)]
         
     def _run_threads(self):
         super()._run_threads()
-        self.upload_to_database_thread.start()
+        for thread in self.upload_to_database_threads:
+            thread.start()
 
     def upload_to_database_loop(self):
         while not self.stop_event.is_set():
@@ -69,23 +89,34 @@ class DeveloperServer(ServerBase):
                 except Exception as e:
                     print(f"[DeveloperServer] failed to load metadata: {e}")
                     continue
-                response = self.try_request_and_wait(Words.Command.UPLOAD_START, metadata)
-                if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
-                    print(f"Upload start failed. Params: {response.get(Words.DataKeys.PARAMS)}")
-                    continue
-                params = response.get(Words.DataKeys.PARAMS)
-                assert isinstance(params, dict)
-                port = params.get(Words.ParamKeys.Success.PORT)
-                temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                temp_sock.connect((self.db_host, port))
-                file_sender = FileSender(temp_sock, path)
-                file_sender.send()
+                sha256 = metadata.get(Words.ParamKeys.Metadata.SHA256)
+                for attempt in range(DEFAULT_DB_UPLOAD_ATTEMPTS):
+                    response = self.try_request_and_wait(Words.Command.UPLOAD_START, metadata)
+                    if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                        print(f"Upload start failed. Params: {response.get(Words.DataKeys.PARAMS)}")
+                        break
+                    params = response.get(Words.DataKeys.PARAMS)
+                    assert isinstance(params, dict)
+                    port = params.get(Words.ParamKeys.Success.PORT)
+                    upload_id = params.get(Words.ParamKeys.Upload.UPLOAD_ID)
+                    temp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    file_sender = FileSender(temp_sock, path, framing=choose_framing(params.get(Words.ParamKeys.Transfer.FRAMINGS)), 
+                                             sha256=sha256 if isinstance(sha256, str) else None)
+                    try:
+                        temp_sock.connect((self.db_host, port))
+                        file_sender.send()
+                    except OSError as e:
+                        # UPLOAD_END below reports the failure and frees the session; the next attempt resumes
+                        print(f"[DeveloperServer] upload of {path} to database broke off: {e}")
+                    finally:
+                        file_sender.close()
 
-                response = self.try_request_and_wait(Words.Command.UPLOAD_END, {})
-                if response.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
-                    print(f"Upload end failed. Params: {response.get(Words.DataKeys.PARAMS)}")
-                    continue
-                file_sender.close()
+                    response = self.try_request_and_wait(Words.Command.UPLOAD_END, {
+                        Words.ParamKeys.Upload.UPLOAD_ID: upload_id
+                    })
+                    if response.get(Words.DataKeys.Response.RESULT) == Words.Result.SUCCESS:
+                        break
+                    print(f"Upload end failed (attempt {attempt + 1}). Params: {response.get(Words.DataKeys.PARAMS)}")
             except queue.Empty:
                 continue
             except Exception as e:
@@ -96,283 +127,237 @@ class DeveloperServer(ServerBase):
     def on_new_connection(self, received_message_id: str, role: str, passer: MessageFormatPasser, handshake_data: dict):
         match role:
             case Words.Roles.DEVELOPER:
-                self.send_response(passer, received_message_id, Words.Result.SUCCESS)
+                self.accept_handshake(passer, received_message_id, handshake_data)
                 self.handle_developer(passer)
             case _:
                 print(f"Unknown role: {role}")
 
     def handle_developer(self, passer: MessageFormatPasser):
+        self.serve_session(passer, Words.Roles.DEVELOPER)
+
+    def on_session_start(self, passer: MessageFormatPasser, role: str) -> None:
         self.passer_developer_dict[passer] = None
-        passer.settimeout(self.receive_timeout)
-        last_hb_time = time.time()
-        while not self.stop_event.is_set():
-            try:
-                msg_id, msg_type, data = passer.receive_args(Formats.MESSAGE)
-                match msg_type:
-                    case Words.MessageType.REQUEST:
-                        assert isinstance(data, dict)
-                        cmd = data.get(Words.DataKeys.Request.COMMAND)
-                        match cmd:
-                            case Words.Command.LOGIN:
-                                # continue
-                                # time.sleep(7)
-                                # self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'suduiwee', '12': 345})
-                                params = data.get(Words.DataKeys.PARAMS)
-                                assert isinstance(params, dict)
-                                username = params.get(Words.ParamKeys.Login.USERNAME)
-                                # password = params.get(Words.ParamKeys.Login.PASSWORD)
-                                login_data = self.try_request_and_wait(Words.Command.LOGIN, params)
-                                
-                                if login_data[Words.DataKeys.Response.RESULT] == Words.Result.SUCCESS:
-                                    self.passer_developer_dict[passer] = username
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                elif login_data[Words.DataKeys.Response.RESULT] == Words.Result.FAILURE:
-                                    params = login_data.get(Words.DataKeys.PARAMS)
-                                    assert isinstance(params, dict)
-                                    # reason = params.get(Words.ParamKeys.Failure.REASON)
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Unknown login result."
-                                    })
-                            case Words.Command.REGISTER:
-                                params = data.get(Words.DataKeys.PARAMS)
-                                assert isinstance(params, dict)
-                                # username = params.get(Words.ParamKeys.Register.USERNAME)
-                                # password = params.get(Words.ParamKeys.Register.PASSWORD)
-                                reg_data = self.try_request_and_wait(Words.Command.REGISTER, params)
 
-                                
-                                if reg_data[Words.DataKeys.Response.RESULT] == Words.Result.SUCCESS:
-                                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                elif reg_data[Words.DataKeys.Response.RESULT] == Words.Result.FAILURE:
-                                    params = reg_data.get(Words.DataKeys.PARAMS)
-                                    assert isinstance(params, dict)
-                                    reason = params.get(Words.ParamKeys.Failure.REASON)
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: reason
-                                    })
-                                else:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Unknown register result."
-                                    })
-                            case Words.Command.LOGOUT:
-                                # params = data.get(Words.DataKeys.PARAMS)
-                                # assert isinstance(params, dict)
-                                username = self.passer_developer_dict.get(passer)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Developer not logged in yet."
-                                    })
-                                    continue
-                                result_data = self.try_request_and_wait(Words.Command.LOGOUT, {
-                                    Words.ParamKeys.Logout.USERNAME: username
-                                })
-                                self.send_response(passer, msg_id, result_data[Words.DataKeys.Response.RESULT], result_data.get(Words.DataKeys.PARAMS))
-                            case Words.Command.EXIT:
-                                username = self.passer_developer_dict.get(passer)
-                                if username:
-                                    self.try_request_and_wait(Words.Command.LOGOUT, {
-                                        Words.ParamKeys.Logout.USERNAME: username
-                                    })
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                time.sleep(5)
-                                break
-                            case Words.Command.UPLOAD_START:
-                                # initialize an upload session
-                                params = data.get(Words.DataKeys.PARAMS) or {}
-                                username = self.passer_developer_dict.get(passer)
-                                if not username:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Developer not logged in yet."
-                                    })
-                                    continue
-                                game_id = params.get(Words.ParamKeys.Metadata.GAME_ID)
-                                version = params.get(Words.ParamKeys.Metadata.VERSION)
-                                file_name = params.get(Words.ParamKeys.Metadata.FILE_NAME)
-                                size = params.get(Words.ParamKeys.Metadata.SIZE)
-                                sha256 = params.get(Words.ParamKeys.Metadata.SHA256)
-                                game_name = params.get(Words.ParamKeys.Metadata.GAME_NAME)
-                                players = params.get(Words.ParamKeys.Metadata.PLAYERS)
-                                if not (game_id and version and file_name and isinstance(size, int) and sha256 and game_name and isinstance(players, int)):
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Missing upload metadata"
-                                    })
-                                    continue
-                                # check game valid
-                                result_data = self.try_request_and_wait(Words.Command.CHECK_GAME_VALID, {
-                                    Words.ParamKeys.Metadata.GAME_ID: game_id, 
-                                    Words.ParamKeys.Metadata.VERSION: version, 
-                                    Words.ParamKeys.Metadata.UPLOADER: self.passer_developer_dict.get(passer)
-                                })
+    def on_session_message(self, passer: MessageFormatPasser, msg_id: str, msg_type: str, data: dict) -> bool:
+        match msg_type:
+            case Words.MessageType.REQUEST:
+                assert isinstance(data, dict)
+                return self._process_request(passer, msg_id, data)
+            case Words.MessageType.HEARTBEAT:
+                # time.sleep(12)
+                self.send_response(passer, msg_id, Words.Result.SUCCESS)
+        return True
+
+    def on_session_end(self, passer: MessageFormatPasser) -> None:
+        self.passer_developer_dict.pop(passer, None)
+
+    def _process_request(self, passer: MessageFormatPasser, msg_id: str, data: dict) -> bool:
+        """Handle one developer request; False once the developer has exited."""
+        cmd = data.get(Words.DataKeys.Request.COMMAND)
+        match cmd:
+            case Words.Command.LOGIN:
+                # continue
+                # time.sleep(7)
+                # self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: 'suduiwee', '12': 345})
+                params = data.get(Words.DataKeys.PARAMS)
+                assert isinstance(params, dict)
+                username = params.get(Words.ParamKeys.Login.USERNAME)
+                # password = params.get(Words.ParamKeys.Login.PASSWORD)
+                login_data = self.try_request_and_wait(Words.Command.LOGIN, params)
+
+                if login_data[Words.DataKeys.Response.RESULT] == Words.Result.SUCCESS:
+                    self.passer_developer_dict[passer] = username
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                elif login_data[Words.DataKeys.Response.RESULT] == Words.Result.FAILURE:
+                    params = login_data.get(Words.DataKeys.PARAMS)
+                    assert isinstance(params, dict)
+                    # reason = params.get(Words.ParamKeys.Failure.REASON)
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
+                else:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Unknown login result."
+                    })
+            case Words.Command.REGISTER:
+                params = data.get(Words.DataKeys.PARAMS)
+                assert isinstance(params, dict)
+                # username = params.get(Words.ParamKeys.Register.USERNAME)
+                # password = params.get(Words.ParamKeys.Register.PASSWORD)
+                reg_data = self.try_request_and_wait(Words.Command.REGISTER, params)
 
-                                if result_data.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, result_data.get(Words.DataKeys.PARAMS))
-                                    continue
 
-                                
+                if reg_data[Words.DataKeys.Response.RESULT] == Words.Result.SUCCESS:
+                    self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                elif reg_data[Words.DataKeys.Response.RESULT] == Words.Result.FAILURE:
+                    params = reg_data.get(Words.DataKeys.PARAMS)
+                    assert isinstance(params, dict)
+                    reason = params.get(Words.ParamKeys.Failure.REASON)
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: reason
+                    })
+                else:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Unknown register result."
+                    })
+            case Words.Command.LOGOUT:
+                # params = data.get(Words.DataKeys.PARAMS)
+                # assert isinstance(params, dict)
+                username = self.passer_developer_dict.get(passer)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Developer not logged in yet."
+                    })
+                    return True
+                result_data = self.try_request_and_wait(Words.Command.LOGOUT, {
+                    Words.ParamKeys.Logout.USERNAME: username
+                })
+                self.send_response(passer, msg_id, result_data[Words.DataKeys.Response.RESULT], result_data.get(Words.DataKeys.PARAMS))
+            case Words.Command.EXIT:
+                username = self.passer_developer_dict.get(passer)
+                if username:
+                    self.try_request_and_wait(Words.Command.LOGOUT, {
+                        Words.ParamKeys.Logout.USERNAME: username
+                    })
+                self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                return False
+            case Words.Command.UPLOAD_START:
+                # initialize an upload session
+                params = data.get(Words.DataKeys.PARAMS) or {}
+                username = self.passer_developer_dict.get(passer)
+                if not username:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Developer not logged in yet."
+                    })
+                    return True
+                game_id = params.get(Words.ParamKeys.Metadata.GAME_ID)
+                version = params.get(Words.ParamKeys.Metadata.VERSION)
+                file_name = params.get(Words.ParamKeys.Metadata.FILE_NAME)
+                size = params.get(Words.ParamKeys.Metadata.SIZE)
+                sha256 = params.get(Words.ParamKeys.Metadata.SHA256)
+                game_name = params.get(Words.ParamKeys.Metadata.GAME_NAME)
+                players = params.get(Words.ParamKeys.Metadata.PLAYERS)
+                if not (game_id and version and file_name and isinstance(size, int) and sha256 and game_name and isinstance(players, int)):
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Missing upload metadata"
+                    })
+                    return True
+                # check game valid
+                result_data = self.try_request_and_wait(Words.Command.CHECK_GAME_VALID, {
+                    Words.ParamKeys.Metadata.GAME_ID: game_id, 
+                    Words.ParamKeys.Metadata.VERSION: version, 
+                    Words.ParamKeys.Metadata.UPLOADER: self.passer_developer_dict.get(passer)
+                })
 
+                if result_data.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, result_data.get(Words.DataKeys.PARAMS))
+                    return True
 
-                                # prepare cache path
-                                from pathlib import Path
-                                import os, json, hashlib
-                                cache_root = GAME_CACHE_DIR / str(game_id) / str(version)
-                                try:
-                                    cache_root.mkdir(parents=True, exist_ok=True)
-                                except Exception as e:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: f"Cannot create cache: {e}"
-                                    })
-                                    continue
-                                # part_path = cache_root / (str(filename) + ".part")
-                                # try:
-                                #     f = open(part_path, "wb")
-                                # except Exception as e:
-                                #     self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                #         Words.ParamKeys.Failure.REASON: f"Cannot open temp file: {e}"
-                                #     })
-                                #     continue
-                                # record state
-                                with self.upload_state_lock:
-                                    # "file": f,
-                                    self.upload_state[passer] = {
-                                        Words.ParamKeys.Metadata.SIZE: size,
-                                        Words.ParamKeys.Metadata.SHA256: sha256,
-                                        Words.ParamKeys.Metadata.FILE_NAME: file_name,
-                                        Words.ParamKeys.Metadata.GAME_ID: game_id,
-                                        Words.ParamKeys.Metadata.VERSION: version,
-                                        Words.ParamKeys.Metadata.GAME_NAME: game_name, 
-                                        Words.ParamKeys.Metadata.PLAYERS: players, 
-                                        "upload_done": False
-                                    }
-                                temp_server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                                temp_server_sock.bind(("0.0.0.0", 0))
-                                temp_server_sock.listen(1)
-                                port = temp_server_sock.getsockname()[1]
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
-                                    Words.ParamKeys.Success.PORT: port
-                                })
-                                threading.Thread(target=self.handle_upload, args=(temp_server_sock, passer), daemon=True).start()
-                            case Words.Command.UPLOAD_END:
-                                # finalize the upload: verify and move into place
-                                st = {}
-                                with self.upload_state_lock:
-                                    st = self.upload_state.get(passer)
-                                if not st:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "No active upload"
-                                    })
-                                    continue
-                                done = False
-                                check_count = 0
-                                while check_count <= 15:
-                                    with self.upload_state_lock:
-                                        st = self.upload_state.get(passer) or {}
-                                        print(f"upload_done: {st.get('upload_done')}")
-                                        if st.get("upload_done"):
-                                            done = True
-                                            break
-                                    check_count += 1
-                                    time.sleep(0.2)
 
-                                if not done:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: "Upload not done."
-                                    })
-                                    continue
-                                
-                                final_path = GAME_CACHE_DIR / str(st[Words.ParamKeys.Metadata.GAME_ID]) / str(st[Words.ParamKeys.Metadata.VERSION]) / str(st[Words.ParamKeys.Metadata.FILE_NAME])
-                                
-                                file_checker = FileChecker(final_path, st)
-                                success, params = file_checker.check()
-                                if not success:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
-                                    continue
 
-                                # move into place
-                                try:
-                                    # part_path.replace(final_path)
-                                    # write metadata
-                                    meta = {
-                                        Words.ParamKeys.Metadata.GAME_ID: st[Words.ParamKeys.Metadata.GAME_ID],
-                                        Words.ParamKeys.Metadata.GAME_NAME: st[Words.ParamKeys.Metadata.GAME_NAME], 
-                                        Words.ParamKeys.Metadata.VERSION: st[Words.ParamKeys.Metadata.VERSION],
-                                        Words.ParamKeys.Metadata.UPLOADER: self.passer_developer_dict.get(passer), 
-                                        Words.ParamKeys.Metadata.FILE_NAME: st[Words.ParamKeys.Metadata.FILE_NAME],
-                                        Words.ParamKeys.Metadata.PLAYERS: st[Words.ParamKeys.Metadata.PLAYERS], 
-                                        Words.ParamKeys.Metadata.SIZE: st[Words.ParamKeys.Metadata.SIZE],
-                                        Words.ParamKeys.Metadata.SHA256: st[Words.ParamKeys.Metadata.SHA256],
-                                    }
-                                    # meta = st.copy()
-                                    (GAME_CACHE_DIR / str(st[Words.ParamKeys.Metadata.GAME_ID]) / str(st[Words.ParamKeys.Metadata.VERSION]) / "metadata.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
-                                except Exception as e:
-                                    with self.upload_state_lock:
-                                        self.upload_state.pop(passer, None)
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
-                                        Words.ParamKeys.Failure.REASON: f"Finalize error: {e}"
-                                    })
-                                    continue
 
-                                with self.upload_state_lock:
-                                    self.upload_state.pop(passer, None)
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                                self.upload_to_database_queue.put(final_path)
-                            case Words.Command.CHECK_MY_WORKS:
-                                result_data = self.try_request_and_wait(Words.Command.CHECK_DEV_WORKS, {
-                                    Words.ParamKeys.CheckInfo.USERNAME: self.passer_developer_dict[passer]
-                                    })
-                                params = result_data.get(Words.DataKeys.PARAMS)
-                                if result_data.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
-                                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
-                                    continue
-                                self.send_response(passer, msg_id, Words.Result.SUCCESS, params)
-                            case _:
-                                self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: "Unknown command."})
-                    case Words.MessageType.HEARTBEAT:
-                        # time.sleep(12)
-                        last_hb_time = time.time()
-                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
-            except TimeoutError:
-                if time.time() - last_hb_time > self.client_heartbeat_timeout:
-                    print(f"[DeveloperServer] client heartbeat timeout (>{self.client_heartbeat_timeout}s), terminating connection")
-                    break
-                # also try to receive raw chunk frames during idle
+                # prepare cache path
+                cache_root = GAME_CACHE_DIR / str(game_id) / str(version)
+                try:
+                    cache_root.mkdir(parents=True, exist_ok=True)
+                except Exception as e:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: f"Cannot create cache: {e}"
+                    })
+                    return True
+                # part_path = cache_root / (str(filename) + ".part")
                 # try:
-                #     raw = passer.receive_raw()
-                #     if raw:
-                #         # parse: [4-byte header_len][header_json][chunk_bytes]
-                #         import struct, json as _json
-                #         if len(raw) < 4:
-                #             raise ValueError("Invalid raw frame: too short for header length")
-                #         header_len = struct.unpack("!I", raw[:4])[0]
-                #         if 4 + header_len > len(raw):
-                #             raise ValueError("Invalid raw frame: header length exceeds payload")
-                #         header = raw[4:4+header_len]
-                #         chunk = raw[4+header_len:]
-                #         info = _json.loads(header.decode('utf-8'))
-                #         if info.get('type') == 'UPLOAD_CHUNK':
-                #             st = self.upload_state.get(passer)
-                #             if st and isinstance(st.get('file'), object):
-                #                 seq = info.get('seq', -1)
-                #                 # simple sequence monotonic check
-                #                 if st['seq'] != -1 and seq != st['seq'] + 1:
-                #                     # out-of-order: ignore (could add buffering)
-                #                     pass
-                #                 else:
-                #                     st['seq'] = seq
-                #                     st['file'].write(chunk)
-                #                     st['bytes'] += len(chunk)
-                # except TimeoutError:
-                #     pass
-                continue
-            except ConnectionError as e:
-                print(f"[DeveloperServer] ConnectionError raised in handle_developer: {e}")
-                break
-            except Exception as e:
-                print(f"[DeveloperServer] exception raised in handle_developer: {e}")
-                break
+                #     f = open(part_path, "wb")
+                # except Exception as e:
+                #     self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                #         Words.ParamKeys.Failure.REASON: f"Cannot open temp file: {e}"
+                #     })
+                #     continue
+                # record state
+                with self.upload_state_lock:
+                    # "file": f,
+                    self.upload_state[passer] = {
+                        Words.ParamKeys.Metadata.SIZE: size,
+                        Words.ParamKeys.Metadata.SHA256: sha256,
+                        Words.ParamKeys.Metadata.FILE_NAME: file_name,
+                        Words.ParamKeys.Metadata.GAME_ID: game_id,
+                        Words.ParamKeys.Metadata.VERSION: version,
+                        Words.ParamKeys.Metadata.GAME_NAME: game_name, 
+                        Words.ParamKeys.Metadata.PLAYERS: players, 
+                        "upload_done": threading.Event()  # set by handle_upload once the file is in
+                    }
+                temp_server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                temp_server_sock.bind(("0.0.0.0", 0))
+                temp_server_sock.listen(1)
+                port = temp_server_sock.getsockname()[1]
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, {
+                    Words.ParamKeys.Success.PORT: port, 
+                    Words.ParamKeys.Transfer.FRAMINGS: offer_framings()
+                })
+                threading.Thread(target=self.handle_upload, args=(temp_server_sock, passer), daemon=True).start()
+            case Words.Command.UPLOAD_END:
+                # finalize the upload: verify and move into place
+                st = {}
+                with self.upload_state_lock:
+                    st = self.upload_state.get(passer)
+                if not st:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "No active upload"
+                    })
+                    return True
+                if not st["upload_done"].wait(DEFAULT_UPLOAD_END_WAIT):
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: "Upload not done."
+                    })
+                    return True
+
+                final_path = GAME_CACHE_DIR / str(st[Words.ParamKeys.Metadata.GAME_ID]) / str(st[Words.ParamKeys.Metadata.VERSION]) / str(st[Words.ParamKeys.Metadata.FILE_NAME])
+
+                file_checker = FileChecker(final_path, st, st.get("received_sha256"), st.get("received_size"))
+                success, params = file_checker.check()
+                if not success:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
+                    return True
+
+                # move into place
+                try:
+                    # part_path.replace(final_path)
+                    # write metadata
+                    meta = {
+                        Words.ParamKeys.Metadata.GAME_ID: st[Words.ParamKeys.Metadata.GAME_ID],
+                        Words.ParamKeys.Metadata.GAME_NAME: st[Words.ParamKeys.Metadata.GAME_NAME], 
+                        Words.ParamKeys.Metadata.VERSION: st[Words.ParamKeys.Metadata.VERSION],
+                        Words.ParamKeys.Metadata.UPLOADER: self.passer_developer_dict.get(passer), 
+                        Words.ParamKeys.Metadata.FILE_NAME: st[Words.ParamKeys.Metadata.FILE_NAME],
+                        Words.ParamKeys.Metadata.PLAYERS: st[Words.ParamKeys.Metadata.PLAYERS], 
+                        Words.ParamKeys.Metadata.SIZE: st[Words.ParamKeys.Metadata.SIZE],
+                        Words.ParamKeys.Metadata.SHA256: st[Words.ParamKeys.Metadata.SHA256],
+                    }
+                    # meta = st.copy()
+                    (GAME_CACHE_DIR / str(st[Words.ParamKeys.Metadata.GAME_ID]) / str(st[Words.ParamKeys.Metadata.VERSION]) / "metadata.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+                except Exception as e:
+                    with self.upload_state_lock:
+                        self.upload_state.pop(passer, None)
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, {
+                        Words.ParamKeys.Failure.REASON: f"Finalize error: {e}"
+                    })
+                    return True
+
+                with self.upload_state_lock:
+                    self.upload_state.pop(passer, None)
+                self.send_response(passer, msg_id, Words.Result.SUCCESS)
+                self.upload_to_database_queue.put(final_path)
+            case Words.Command.CHECK_MY_WORKS:
+                result_data = self.try_request_and_wait(Words.Command.CHECK_DEV_WORKS, {
+                    Words.ParamKeys.CheckInfo.USERNAME: self.passer_developer_dict[passer]
+                    })
+                params = result_data.get(Words.DataKeys.PARAMS)
+                if result_data.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
+                    self.send_response(passer, msg_id, Words.Result.FAILURE, params)
+                    return True
+                self.send_response(passer, msg_id, Words.Result.SUCCESS, params)
+            case _:
+                self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: "Unknown command."})
+        return True
 
-        self.passer_developer_dict.pop(passer, None)
 
     def handle_upload(self, server_sock: socket.socket, dev_passer: MessageFormatPasser):
         dev_sock, addr = server_sock.accept()
@@ -385,12 +370,15 @@ class DeveloperServer(ServerBase):
             return
         # file_path = st["cache_root"] / str(st["filename"])
         file_path = GAME_CACHE_DIR / str(st[Words.ParamKeys.Metadata.GAME_ID]) / str(st[Words.ParamKeys.Metadata.VERSION]) / str(st[Words.ParamKeys.Metadata.FILE_NAME])
-        file_receiver = FileReceiver(dev_sock, file_path)
+        file_receiver = FileReceiver(dev_sock, file_path, compute_sha256=True)
         success = file_receiver.receive()
         if not success:
             print("warning: file receiving not successful.")
+        # st, not a fresh lookup: a retried UPLOAD_START may have replaced the state meanwhile
         with self.upload_state_lock:
-            self.upload_state[dev_passer]["upload_done"] = True
+            st["received_sha256"] = file_receiver.sha256
+            st["received_size"] = file_receiver.received_size
+        st["upload_done"].set()
         file_receiver.close()
         print("exited handle_upload")
         
@@ -7,11 +7,13 @@ import subprocess
 import sys
 import os
 from base.peer_worker import PeerWorker
-import time
 import uuid
-from servers.server_base import ServerBase
+from servers.server_base import (ServerBase, DEFAULT_MAX_PENDING_HANDSHAKES, DEFAULT_MAX_CONNECTIONS, 
+                                 DEFAULT_SESSION_POOL_SIZE, DEFAULT_DB_POOL_SIZE)
+from servers.selector_core import DEFAULT_HANDLER_POOL_SIZE
 from base.file_receiver import FileReceiver
-from base.file_sender import FileSender
+from base.file_relay import FileRelay
+from base.transfer_framing import choose_framing, offer_framings
 import queue
 from pathlib import Path
 import zipfile
@@ -27,10 +29,14 @@ DEFAULT_DB_HEARTBEAT_INTERVAL = 10.0
 DEFAULT_DB_HEARTBEAT_PATIENCE = 3
 DEFAULT_DB_RESPONSE_TIMEOUT = 3.0
 DEFAULT_CLIENT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_SELECTOR_CORE = True  # players are multiplexed on one event loop + handler pool
+GAME_SERVER_STARTUP_DELAY = 1.0  # between starting a game server and telling its players
 
 GAME_CACHE_DIR = Path(__file__).resolve().parent / "game_cache"
 
 class LobbyServer(ServerBase):
+    SESSION_ROLES = (Words.Roles.PLAYER,)
+
     def __init__(self, host: str = "0.0.0.0", port: int = 21354, 
                  db_host: str = "127.0.0.1", db_port: int = 32132, 
                  accept_timeout = DEFAULT_ACCEPT_TIMEOUT, 
@@ -41,11 +47,20 @@ class LobbyServer(ServerBase):
                  max_handshake_try_count = DEFAULT_MAX_HANDSHAKE_TRY_COUNT, 
                  db_heartbeat_interval = DEFAULT_DB_HEARTBEAT_INTERVAL, 
                  db_heartbeat_patience = DEFAULT_DB_HEARTBEAT_PATIENCE, 
-                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT) -> None:
+                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT, 
+                 selector_core = DEFAULT_SELECTOR_CORE, 
+                 handler_pool_size = DEFAULT_HANDLER_POOL_SIZE, 
+                 max_pending_handshakes = DEFAULT_MAX_PENDING_HANDSHAKES, 
+                 max_connections = DEFAULT_MAX_CONNECTIONS, 
+                 session_pool_size = DEFAULT_SESSION_POOL_SIZE, 
+                 db_pool_size = DEFAULT_DB_POOL_SIZE) -> None:
         super().__init__(host, port, db_host, db_port, Words.Roles.LOBBYSERVER, 
                          accept_timeout, connect_timeout, receive_timeout, handshake_timeout, 
                          db_response_timeout, max_handshake_try_count, db_heartbeat_interval, 
-                         db_heartbeat_patience, client_heartbeat_timeout)
+                         db_heartbeat_patience, client_heartbeat_timeout, 
+                         selector_core=selector_core, handler_pool_size=handler_pool_size, 
+                         max_pending_handshakes=max_pending_handshakes, max_connections=max_connections, 
+                         session_pool_size=session_pool_size, db_pool_size=db_pool_size)
         
         self.passer_player_dict: dict[MessageFormatPasser, str | None] = {}
         self.player_passer_dict: dict[str, MessageFormatPasser] = {}
@@ -58,9 +73,9 @@ class LobbyServer(ServerBase):
         # ensure cache dir exists
         GAME_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
-        # mapping transfer_id -> {'path': Path, 'done': bool, 'success': bool}
-        self._transfer_state: dict[str, dict] = {}
-        self._transfer_state_lock = threading.Lock()
+        # mapping transfer_id -> relay of a DOWNLOAD_START in progress
+        self._transfer_relays: dict[str, FileRelay] = {}
+        self._transfer_relays_lock = threading.Lock()
         # map room_name -> subprocess.Popen for running game server
         self._game_processes: dict[str, subprocess.Popen] = {}
         self._game_logfiles: dict[str, any] = {}
@@ -68,38 +83,29 @@ class LobbyServer(ServerBase):
     def on_new_connection(self, received_message_id: str, role: str, passer: MessageFormatPasser, handshake_data: dict):
         match role:
             case Words.Roles.PLAYER:
-                self.send_response(passer, received_message_id, Words.Result.SUCCESS)
+                self.accept_handshake(passer, received_message_id, handshake_data)
                 self.handle_player(passer)
             case _:
                 print(f"Unknown role: {role}")
 
     def handle_player(self, passer: MessageFormatPasser):
+        self.serve_session(passer, Words.Roles.PLAYER)
+
+    def on_session_start(self, passer: MessageFormatPasser, role: str) -> None:
         with self.passer_player_lock:
             self.passer_player_dict[passer] = None
-        passer.settimeout(self.receive_timeout)
-        last_hb_time = time.time()
-        while not self.stop_event.is_set():
-            try:
-                msg_id, msg_type, data = passer.receive_args(Formats.MESSAGE)
-                match msg_type:
-                    case Words.MessageType.REQUEST:
-                        assert isinstance(data, dict)
-                        self._process_request(passer, msg_id, data)
-                    case Words.MessageType.HEARTBEAT:
-                        # time.sleep(12)
-                        last_hb_time = time.time()
-                        self.send_response(passer, msg_id, Words.Result.SUCCESS)
-            except TimeoutError:
-                if time.time() - last_hb_time > self.client_heartbeat_timeout:
-                    print(f"[LobbyServer] client heartbeat timeout (>{self.client_heartbeat_timeout}s), terminating connection")
-                    break
-                continue
-            except ConnectionError as e:
-                print(f"[LobbyServer] ConnectionError raised in handle_player: {e}")
-                break
-            except Exception as e:
-                print(f"[LobbyServer] exception raised in handle_player: {e}")
-                break
+
+    def on_session_message(self, passer: MessageFormatPasser, msg_id: str, msg_type: str, data: dict) -> bool:
+        match msg_type:
+            case Words.MessageType.REQUEST:
+                assert isinstance(data, dict)
+                self._process_request(passer, msg_id, data)
+            case Words.MessageType.HEARTBEAT:
+                # time.sleep(12)
+                self.send_response(passer, msg_id, Words.Result.SUCCESS)
+        return True
+
+    def on_session_end(self, passer: MessageFormatPasser) -> None:
         with self.passer_player_lock:
             uname = self.passer_player_dict.pop(passer, None)
             if uname:
@@ -122,8 +128,8 @@ class LobbyServer(ServerBase):
                         Words.ParamKeys.LobbyStatus.ONLINE_PLAYERS: online_players,
                         Words.ParamKeys.LobbyStatus.ROOMS: self.room_dict
                     })
-                case Words.Command.CHECK_STORE:
-                    result_data = self.try_request_and_wait(Words.Command.CHECK_STORE, {})
+                case Words.Command.CHECK_STORE | Words.Command.QUERY_STORE:
+                    result_data = self.try_request_and_wait(cmd, data.get(Words.DataKeys.PARAMS) or {})
                     result = result_data.get(Words.DataKeys.Response.RESULT) or Words.Result.FAILURE
                     params = result_data.get(Words.DataKeys.PARAMS) or {
                         Words.ParamKeys.Failure.REASON: "Unknown result."
@@ -132,7 +138,10 @@ class LobbyServer(ServerBase):
                 case Words.Command.DOWNLOAD_START:
                     params = data.get(Words.DataKeys.PARAMS)
                     assert isinstance(params, dict)
-                    result_data = self.try_request_and_wait(Words.Command.DOWNLOAD_START, params)
+                    # the client's framings are for our serve_thread; towards the database we are the receiver
+                    client_framing = choose_framing(params.get(Words.ParamKeys.Transfer.FRAMINGS))
+                    result_data = self.try_request_and_wait(Words.Command.DOWNLOAD_START, {
+                        **params, Words.ParamKeys.Transfer.FRAMINGS: offer_framings()})
                     params_from_db = result_data.get(Words.DataKeys.PARAMS)
                     assert isinstance(params_from_db, dict)
 
@@ -141,7 +150,7 @@ class LobbyServer(ServerBase):
                         return
 
                     # Start a background transfer: connect to DB and download into cache,
-                    # then serve the cached file to the requesting client in a separate thread.
+                    # and relay it to the requesting client while it arrives.
                     db_port = params_from_db.get(Words.ParamKeys.Success.PORT)
                     try:
                         transfer_id = str(uuid.uuid4())
@@ -160,24 +169,25 @@ class LobbyServer(ServerBase):
                         temp_db_sock.connect((self.db_host, int(db_port)))
                         print("######database server connected.")
 
-                        with self._transfer_state_lock:
-                            self._transfer_state[transfer_id] = {"path": dst_path, "done": False, "success": False}
+                        size = params_from_db.get(Words.ParamKeys.Metadata.SIZE)
+                        sha256 = params_from_db.get(Words.ParamKeys.Metadata.SHA256)
+                        relay = FileRelay(size if isinstance(size, int) else None,
+                                          sha256 if isinstance(sha256, str) else None,
+                                          max(30.0, self.db_response_timeout * 10))
+                        with self._transfer_relays_lock:
+                            self._transfer_relays[transfer_id] = relay
 
-                        # download thread: receives file from DB and writes to dst_path
+                        # download thread: receives file from DB into dst_path, reporting each piece to the relay
                         def dl_thread():
                             try:
-                                fr = FileReceiver(temp_db_sock, dst_path)
+                                fr = FileReceiver(temp_db_sock, dst_path, relay=relay)
                                 print("start download. Downloading...")
-                                ok = fr.receive()
+                                if not fr.receive():
+                                    print(f"[LobbyServer] download of {gid} from database failed")
                                 fr.close()
-                                with self._transfer_state_lock:
-                                    self._transfer_state[transfer_id]["done"] = True
-                                    self._transfer_state[transfer_id]["success"] = bool(ok)
                             except Exception as e:
                                 print(f"[LobbyServer] download thread error: {e}")
-                                with self._transfer_state_lock:
-                                    self._transfer_state[transfer_id]["done"] = True
-                                    self._transfer_state[transfer_id]["success"] = False
+                                relay.finished(False)
 
                         threading.Thread(target=dl_thread, daemon=True).start()
 
@@ -185,46 +195,31 @@ class LobbyServer(ServerBase):
                         temp_server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                         temp_server_sock.bind(("0.0.0.0", 0))
                         temp_server_sock.listen(1)
+                        temp_server_sock.settimeout(relay.idle_timeout)
                         client_port = temp_server_sock.getsockname()[1]
 
-                        # serve thread: accept client, wait for download completion, then send file
+                        # serve thread: accept client and forward the file as it arrives from the database
                         def serve_thread():
                             try:
-                                client_sock, addr = temp_server_sock.accept()
+                                try:
+                                    client_sock, addr = temp_server_sock.accept()
+                                except socket.timeout:
+                                    print(f"[LobbyServer] client did not connect for transfer {transfer_id}")
+                                    return
                                 print(f"client connected: {addr}")
                                 temp_server_sock.close()
-                                # wait for download to complete (with timeout)
-                                waited = 0.0
-                                interval = 0.1
-                                timeout = max(30.0, self.db_response_timeout * 10)
-                                while True:
-                                    with self._transfer_state_lock:
-                                        st = self._transfer_state.get(transfer_id)
-                                    if st is None:
-                                        client_sock.close()
-                                        return
-                                    if st.get("done"):
-                                        break
-                                    time.sleep(interval)
-                                    waited += interval
-                                    if waited >= timeout:
-                                        client_sock.close()
-                                        return
-
-                                # if file downloaded successfully, send it
-                                with self._transfer_state_lock:
-                                    path = self._transfer_state[transfer_id]["path"]
-                                    success = self._transfer_state[transfer_id]["success"]
-                                if not success or not path.exists():
-                                    client_sock.close()
-                                    return
-                                fs = FileSender(client_sock, path)
+                                client_sock.settimeout(relay.idle_timeout)
                                 try:
-                                    fs.send()
+                                    relay.send(client_sock, client_framing)
                                 finally:
-                                    fs.close()
+                                    client_sock.close()
                             except Exception as e:
                                 print(f"[LobbyServer] serve thread error: {e}")
+                            finally:
+                                temp_server_sock.close()
+                                relay.close()
+                                with self._transfer_relays_lock:
+                                    self._transfer_relays.pop(transfer_id, None)
 
                         threading.Thread(target=serve_thread, daemon=True).start()
 
@@ -451,24 +446,12 @@ class LobbyServer(ServerBase):
                                 pass
                         proc = subprocess.Popen(cmd, **kwargs)
                         self._game_processes[room_name] = proc
-                        # wait briefly then notify players
-                        time.sleep(1.0)
-                        players = self.room_dict.get(room_name, {}).get(Words.ParamKeys.Room.PLAYER_LIST) or []
-                        with self.passer_player_lock:
-                            for p, uname in list(self.passer_player_dict.items()):
-                                if uname and uname in players:
-                                    try:
-                                        ev = {Words.ParamKeys.Metadata.GAME_ID: game_id, Words.ParamKeys.Room.ROOM_NAME: room_name}
-                                        # if chosen_port:
-                                        #     ev[Words.ParamKeys.Success.PORT] = chosen_port
-                                        #     try:
-                                        #         ev['host'] = self.host
-                                        #     except Exception:
-                                        #         pass
-                                        self.send_event(p, Words.EventName.GAME_STARTED, ev)
-                                    except Exception:
-                                        pass
-                        self.send_response(passer, msg_id, Words.Result.SUCCESS, {Words.ParamKeys.Room.ROOM_NAME: room_name, Words.ParamKeys.Room.NOW_ROOM_DATA: self.room_dict.get(room_name)})
+                        # notify players once the game server had a moment to come up; a timer,
+                        # so the wait does not hold a handler pool thread
+                        timer = threading.Timer(GAME_SERVER_STARTUP_DELAY, self._announce_game_started, 
+                                                args=(passer, msg_id, game_id, room_name))
+                        timer.daemon = True
+                        timer.start()
                     except Exception as e:
                         print(f"[LobbyServer] failed to start game server: {e}")
                         self.send_response(passer, msg_id, Words.Result.FAILURE, {Words.ParamKeys.Failure.REASON: str(e)})
@@ -571,23 +554,18 @@ class LobbyServer(ServerBase):
                         self.passer_player_dict[passer] = None
                         self.player_passer_dict.pop(username, None)
                     # remove player from any rooms in lobby view and notify others
+                    events: list[tuple[str, Optional[dict]]] = []
                     if username:
                         # if DB returned room info, broadcast update
                         params_from_db = result_data.get(Words.DataKeys.PARAMS) or {}
                         rn = params_from_db.get(Words.ParamKeys.Room.ROOM_NAME)
                         now_room = params_from_db.get(Words.ParamKeys.Room.NOW_ROOM_DATA)
                         if rn:
-                            try:
-                                for p, uname in list(self.passer_player_dict.items()):
-                                    if uname is not None:
-                                        try:
-                                            self.send_event(p, Words.EventName.ROOM_UPDATED, {Words.ParamKeys.Room.ROOM_NAME: rn, Words.ParamKeys.Room.NOW_ROOM_DATA: now_room})
-                                        except Exception:
-                                            pass
-                            except Exception as e:
-                                print(f"[LobbyServer] notify logout leave_room error: {e}")
+                            events.append((Words.EventName.ROOM_UPDATED, {Words.ParamKeys.Room.ROOM_NAME: rn, Words.ParamKeys.Room.NOW_ROOM_DATA: now_room}))
                         self._remove_player_from_rooms(username)
-                    self.broadcast_player_offline(username)
+                    # room update and offline notice reach each player in one write
+                    events.append((Words.EventName.PLAYER_OFFLINE, {Words.ParamKeys.PlayerOffline.PLAYER_NAME: username}))
+                    self.broadcast_events(events, exclude=username)
                 case Words.Command.EXIT:
                     with self.passer_player_lock:
                         username = self.passer_player_dict.get(passer)
@@ -602,29 +580,37 @@ class LobbyServer(ServerBase):
                         params = result_data.get(Words.DataKeys.PARAMS) or {}
                         room_name = params.get(Words.ParamKeys.Room.ROOM_NAME)
                         now_room_data = params.get(Words.ParamKeys.Room.NOW_ROOM_DATA)
+                        events: list[tuple[str, Optional[dict]]] = []
                         if room_name:
                             if now_room_data and isinstance(now_room_data, dict):
                                 self.room_dict[room_name] = now_room_data
                             else:
                                 self.room_dict.pop(room_name, None)
-                            try:
-                                for p, uname in list(self.passer_player_dict.items()):
-                                    if uname is not None:
-                                        try:
-                                            self.send_event(p, Words.EventName.ROOM_UPDATED, {Words.ParamKeys.Room.ROOM_NAME: room_name, Words.ParamKeys.Room.NOW_ROOM_DATA: now_room_data})
-                                        except Exception:
-                                            pass
-                            except Exception as e:
-                                print(f"[LobbyServer] notify exit leave_room error: {e}")
+                            events.append((Words.EventName.ROOM_UPDATED, {Words.ParamKeys.Room.ROOM_NAME: room_name, Words.ParamKeys.Room.NOW_ROOM_DATA: now_room_data}))
                         # remove player from rooms before broadcasting offline
                         self._remove_player_from_rooms(username)
-                        self.broadcast_player_offline(username)
+                        events.append((Words.EventName.PLAYER_OFFLINE, {Words.ParamKeys.PlayerOffline.PLAYER_NAME: username}))
+                        self.broadcast_events(events, exclude=username)
 
                     self.send_response(passer, msg_id, Words.Result.SUCCESS)
-                    time.sleep(3)
         except Exception as e:
             print(f"[LobbyServer] _process_request error: {e}")
 
+    def _announce_game_started(self, passer: MessageFormatPasser, msg_id: str, game_id: str, room_name: str) -> None:
+        try:
+            players = self.room_dict.get(room_name, {}).get(Words.ParamKeys.Room.PLAYER_LIST) or []
+            with self.passer_player_lock:
+                for p, uname in list(self.passer_player_dict.items()):
+                    if uname and uname in players:
+                        try:
+                            ev = {Words.ParamKeys.Metadata.GAME_ID: game_id, Words.ParamKeys.Room.ROOM_NAME: room_name}
+                            self.send_event(p, Words.EventName.GAME_STARTED, ev)
+                        except Exception:
+                            pass
+            self.send_response(passer, msg_id, Words.Result.SUCCESS, {Words.ParamKeys.Room.ROOM_NAME: room_name, Words.ParamKeys.Room.NOW_ROOM_DATA: self.room_dict.get(room_name)})
+        except Exception as e:
+            print(f"[LobbyServer] failed to announce game start: {e}")
+
     def download_from_db(self, params: dict):
         # simple wrapper to fetch a game into cache (no owner notification)
         try:
@@ -671,7 +657,9 @@ class LobbyServer(ServerBase):
             #     return
 
             # request DB to start download
-            resp = self.try_request_and_wait(Words.Command.DOWNLOAD_START, {Words.ParamKeys.Metadata.GAME_ID: game_id})
+            resp = self.try_request_and_wait(Words.Command.DOWNLOAD_START, {
+                Words.ParamKeys.Metadata.GAME_ID: game_id, 
+                Words.ParamKeys.Transfer.FRAMINGS: offer_framings()})
             params_from_db = resp.get(Words.DataKeys.PARAMS) or {}
             if resp.get(Words.DataKeys.Response.RESULT) != Words.Result.SUCCESS:
                 print(f"[LobbyServer] DB refused download for {game_id}: {params_from_db}")
@@ -782,6 +770,21 @@ class LobbyServer(ServerBase):
             except Exception as e:
                 print(f"[LobbyServer] send_player_offline error: {e}")
 
+    def send_events(self, passer: MessageFormatPasser, events: list[tuple[str, Optional[dict]]]):
+        """Send several events to one player, coalesced into a single write."""
+        with passer.corked():
+            for event_name, params in events:
+                self.send_event(passer, event_name, params)
+
+    def broadcast_events(self, events: list[tuple[str, Optional[dict]]], exclude: Optional[str] = None):
+        with self.passer_player_lock:
+            targets = [p for p, uname in self.passer_player_dict.items() if uname is not None and uname != exclude]
+        for p in targets:
+            try:
+                self.send_events(p, events)
+            except Exception as e:
+                print(f"[LobbyServer] send_events error: {e}")
+
     def _remove_player_from_rooms(self, username: str):
         try:
             if not username:
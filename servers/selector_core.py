@@ -0,0 +1,239 @@
+from __future__ import annotations
+import collections
+import queue
+import selectors
+import socket
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+from base.handler_pool import HandlerPool
+from base.message_format_passer import MessageFormatPasser
+from protocols.protocols import Formats, Words
+
+if TYPE_CHECKING:
+    from servers.server_base import ServerBase
+
+DEFAULT_HANDLER_POOL_SIZE = 32
+
+
+class Connection:
+    """Per-socket state of the selector core."""
+    __slots__ = ("passer", "role", "accepted_at", "last_hb_time", "inbox", "scheduled", "closing", "lock",
+                 "handshake_pending")
+
+    def __init__(self, passer: MessageFormatPasser) -> None:
+        self.passer = passer
+        self.role: Optional[str] = None  # set once the handshake is accepted
+        self.accepted_at = time.time()
+        self.last_hb_time = self.accepted_at
+        # messages waiting for the pool; None marks the end of the session
+        self.inbox: collections.deque[Optional[tuple]] = collections.deque()
+        self.scheduled = False  # a pool task is draining inbox
+        self.closing = False  # a handler ended the session, later messages are dropped
+        self.lock = threading.Lock()
+        self.handshake_pending = True  # counted in server.pending_handshakes
+
+
+class SelectorCore:
+    """Event-loop connection core for ServerBase, the alternative to one thread
+    per connection.
+
+    One thread multiplexes the listening socket and every client socket with
+    `selectors`, reads whatever is ready and decodes complete messages
+    (MessageFormatPasser.receive_ready). Messages go to a HandlerPool of fixed
+    size. Messages of one connection are handled one at a time, in order,
+    just like the thread-per-connection loop did; different connections run
+    in parallel up to the pool size.
+
+    The server plugs in through the same hooks its thread-per-connection loop
+    uses: SESSION_ROLES, on_session_start, on_session_message, on_session_end.
+    Admission (ServerBase.admit) is applied on accept, so the pool queue never
+    holds more than one task per admitted connection.
+    """
+    def __init__(self, server: ServerBase, pool_size: int = DEFAULT_HANDLER_POOL_SIZE) -> None:
+        self.server = server
+        self.pool = HandlerPool(pool_size, name=f"{server.role}-handler")
+        self.selector = selectors.DefaultSelector()
+        self.connections: dict[MessageFormatPasser, Connection] = {}
+        # connections whose handler asked to close; the loop thread unregisters them
+        self.close_requests: queue.Queue[Connection] = queue.Queue()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def serve(self) -> None:
+        """Run the event loop until the server's stop_event is set."""
+        server = self.server
+        self.pool.start()
+        self.selector.register(server.server_sock, selectors.EVENT_READ, None)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self._wake_r)
+        try:
+            while not server.stop_event.is_set():
+                try:
+                    events = self.selector.select(server.accept_timeout)
+                except OSError:
+                    break  # listening socket closed by stop()
+                for key, _ in events:
+                    if key.data is None:
+                        self._accept()
+                    elif key.data is self._wake_r:
+                        self._drain_wakeups()
+                    else:
+                        self._read(key.data)
+                self._process_close_requests()
+                self._sweep_timeouts()
+        finally:
+            for conn in list(self.connections.values()):
+                self._end(conn)
+            self.pool.stop(wait=False)
+            self.selector.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _accept(self) -> None:
+        server = self.server
+        try:
+            connection_sock, addr = server.server_sock.accept()
+        except (socket.timeout, BlockingIOError):
+            return
+        except OSError as e:
+            if not server.stop_event.is_set():
+                print(f"[Server] Exception in accept_connections: {e}")
+            return
+        print(f"Accepted connection from {addr}")
+        passer = MessageFormatPasser(connection_sock, buffered=True)
+        if not server.admit(passer):
+            return
+        # reads only happen once select reports data; the timeout bounds sends
+        passer.settimeout(server.receive_timeout)
+        conn = Connection(passer)
+        self.connections[passer] = conn
+        print(f"Active connections: {len(server.connections)}")
+        self.selector.register(connection_sock, selectors.EVENT_READ, conn)
+
+    def _read(self, conn: Connection) -> None:
+        try:
+            messages = conn.passer.receive_ready(Formats.MESSAGE)
+        except ConnectionError as e:
+            if conn.role is not None:
+                print(f"[{type(self.server).__name__}] ConnectionError raised in session: {e}")
+            self._end(conn)
+            return
+        except Exception as e:
+            print(f"[{type(self.server).__name__}] exception raised while receiving: {e}")
+            self._end(conn)
+            return
+        for message in messages:
+            if message[1] == Words.MessageType.HEARTBEAT:
+                conn.last_hb_time = time.time()
+            self._enqueue(conn, tuple(message))
+
+    def _enqueue(self, conn: Connection, item: Optional[tuple]) -> None:
+        with conn.lock:
+            conn.inbox.append(item)
+            if conn.scheduled:
+                return
+            conn.scheduled = True
+        self.pool.submit(self._drain_inbox, conn)
+
+    def _drain_inbox(self, conn: Connection) -> None:
+        """Pool task: handle conn's queued messages in order until the inbox is empty."""
+        while True:
+            with conn.lock:
+                if not conn.inbox:
+                    conn.scheduled = False
+                    return
+                item = conn.inbox.popleft()
+            if item is None:
+                self._finish_session(conn)
+                continue
+            if conn.closing:
+                continue  # handler already ended the session, drop the rest
+            try:
+                keep = self._handle(conn, *item)
+            except Exception as e:
+                print(f"[{type(self.server).__name__}] exception raised in session: {e}")
+                keep = False
+            if not keep:
+                conn.closing = True
+                self.close_requests.put(conn)
+                self._wake()
+
+    def _handle(self, conn: Connection, msg_id: str, msg_type: str, data: dict) -> bool:
+        server = self.server
+        if conn.role is None:
+            self._settle_handshake(conn)
+            if msg_type != Words.MessageType.HANDSHAKE:
+                print(f"[Server] received message_type {msg_type}, expected {Words.MessageType.HANDSHAKE}")
+                return False
+            role = data.get(Words.DataKeys.Handshake.ROLE)
+            if role not in server.SESSION_ROLES:
+                print(f"Unknown role: {role}")
+                return False
+            server.accept_handshake(conn.passer, msg_id, data)
+            conn.role = role
+            conn.last_hb_time = time.time()
+            server.on_session_start(conn.passer, role)
+            return True
+        return server.on_session_message(conn.passer, msg_id, msg_type, data)
+
+    def _settle_handshake(self, conn: Connection) -> None:
+        if conn.handshake_pending:
+            conn.handshake_pending = False
+            self.server.handshake_settled()
+
+    def _finish_session(self, conn: Connection) -> None:
+        self._settle_handshake(conn)
+        if conn.role is not None:
+            try:
+                self.server.on_session_end(conn.passer)
+            except Exception as e:
+                print(f"[{type(self.server).__name__}] exception in on_session_end: {e}")
+        try:
+            self.server.connections.remove(conn.passer)
+        except ValueError:
+            pass
+        print(f"Connection closed. Active connections: {len(self.server.connections)}")
+        conn.passer.close()
+
+    def _end(self, conn: Connection) -> None:
+        """Loop thread: stop reading conn and queue the end of its session
+        behind whatever messages are still waiting."""
+        if self.connections.pop(conn.passer, None) is None:
+            return
+        try:
+            self.selector.unregister(conn.passer.sock)
+        except (KeyError, ValueError):
+            pass
+        self._enqueue(conn, None)
+
+    def _process_close_requests(self) -> None:
+        while True:
+            try:
+                self._end(self.close_requests.get_nowait())
+            except queue.Empty:
+                return
+
+    def _sweep_timeouts(self) -> None:
+        server = self.server
+        now = time.time()
+        for conn in list(self.connections.values()):
+            if conn.role is None and not conn.scheduled and now - conn.accepted_at > server.handshake_timeout:
+                print("[Server] Error during handshake: timed out")
+                self._end(conn)
+            elif conn.role is not None and now - conn.last_hb_time > server.client_heartbeat_timeout:
+                print(f"[{type(server).__name__}] client heartbeat timeout (>{server.client_heartbeat_timeout}s), terminating connection")
+                self._end(conn)
+
+    def _wake(self) -> None:
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # already pending, or the loop is gone
+
+    def _drain_wakeups(self) -> None:
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
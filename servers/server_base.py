@@ -3,7 +3,11 @@ import socket
 from base.message_format_passer import MessageFormatPasser
 from protocols.protocols import Formats, Words
 from typing import Optional
-from base.peer_worker import PeerWorker
+from base.peer_worker import PeerWorker, WindowFullError, DEFAULT_MAX_IN_FLIGHT
+from base.peer_pool import PeerPool
+from base.handler_pool import HandlerPool
+from servers.selector_core import SelectorCore, DEFAULT_HANDLER_POOL_SIZE
+import queue
 import time
 import uuid
 
@@ -16,9 +20,24 @@ DEFAULT_DB_HEARTBEAT_INTERVAL = 10.0
 DEFAULT_DB_HEARTBEAT_PATIENCE = 3
 DEFAULT_DB_RESPONSE_TIMEOUT = 3.0
 DEFAULT_CLIENT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_TRUST_DB_LINK = True
+DEFAULT_DB_MAX_IN_FLIGHT = DEFAULT_MAX_IN_FLIGHT
+DEFAULT_SELECTOR_CORE = False
+DEFAULT_LISTEN_BACKLOG = 128
+DEFAULT_DB_POOL_SIZE = 4
+DEFAULT_HANDSHAKE_POOL_SIZE = 8
+DEFAULT_MAX_PENDING_HANDSHAKES = 128  # accepted but not handshaken yet, beyond that new sockets are turned away
+DEFAULT_MAX_CONNECTIONS = 1024
+DEFAULT_SESSION_POOL_SIZE = 256  # thread core: sessions served at once, each holds a pool thread until it ends
+DEFAULT_REJECT_POOL_SIZE = 2
+DEFAULT_MAX_PENDING_REJECTS = 256  # turned-away sockets waiting for their FAILURE, beyond that they are just closed
+DEFAULT_REJECT_TIMEOUT = 1.0  # how long a turned-away client gets to send its HANDSHAKE
 
 
 class ServerBase:
+    SESSION_ROLES: tuple[str, ...] = ()
+    """Roles served through the session hooks (on_session_start / _message / _end)."""
+
     def __init__(self, host: str, port: int, 
                  db_host: str, db_port: int, role: str, 
                  accept_timeout = DEFAULT_ACCEPT_TIMEOUT, 
@@ -29,7 +48,16 @@ class ServerBase:
                  max_handshake_try_count = DEFAULT_MAX_HANDSHAKE_TRY_COUNT, 
                  db_heartbeat_interval = DEFAULT_DB_HEARTBEAT_INTERVAL, 
                  db_heartbeat_patience = DEFAULT_DB_HEARTBEAT_PATIENCE, 
-                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT) -> None:
+                 client_heartbeat_timeout = DEFAULT_CLIENT_HEARTBEAT_TIMEOUT, 
+                 trust_db_link = DEFAULT_TRUST_DB_LINK, 
+                 db_max_in_flight = DEFAULT_DB_MAX_IN_FLIGHT, 
+                 selector_core = DEFAULT_SELECTOR_CORE, 
+                 handler_pool_size = DEFAULT_HANDLER_POOL_SIZE, 
+                 handshake_pool_size = DEFAULT_HANDSHAKE_POOL_SIZE, 
+                 max_pending_handshakes = DEFAULT_MAX_PENDING_HANDSHAKES, 
+                 max_connections = DEFAULT_MAX_CONNECTIONS, 
+                 session_pool_size = DEFAULT_SESSION_POOL_SIZE, 
+                 db_pool_size = DEFAULT_DB_POOL_SIZE) -> None:
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.host = host
         self.port = port
@@ -45,11 +73,27 @@ class ServerBase:
         self.db_heartbeat_interval = db_heartbeat_interval
         self.db_heartbeat_patience = db_heartbeat_patience
         self.client_heartbeat_timeout = client_heartbeat_timeout
+        self.trust_db_link = trust_db_link
+        self.db_max_in_flight = db_max_in_flight
+        self.selector_core = selector_core
+        self.handler_pool_size = handler_pool_size
+        self.handshake_pool_size = handshake_pool_size
+        self.max_pending_handshakes = max_pending_handshakes
+        self.max_connections = max_connections
+        self.session_pool_size = session_pool_size
+        self.core: Optional[SelectorCore] = None
         self.connections: list[MessageFormatPasser] = []
+        # admission control, see admit()
+        self.admission_lock = threading.Lock()
+        self.pending_handshakes = 0
+        self.rejected_connections = 0
+        self.handshake_pool: Optional[HandlerPool] = None
+        self.session_pool: Optional[HandlerPool] = None
+        self.reject_pool: Optional[HandlerPool] = None
         # self.passer_player_dict: dict[MessageFormatPasser, str | None] = {}
 
-        self.db_passer: MessageFormatPasser | None = None
-        self.db_worker: Optional[PeerWorker] = None
+        # db_pool_size connections to the database server, one PeerWorker each
+        self.db_pool = PeerPool(db_pool_size, name=f"{role}-db")
 
         self.stop_event = threading.Event()
         self.stop_event.set()
@@ -70,7 +114,7 @@ class ServerBase:
         # self.game_server_lock = threading.Lock()
 
         self.thread: Optional[threading.Thread] = None
-        self.interact_to_db_thread: Optional[threading.Thread] = None
+        self.interact_to_db_threads: list[threading.Thread] = []
         # self.send_msg_thread: Optional[threading.Thread] = None
         # self.receive_msg_thread: Optional[threading.Thread] = None
         # self.heartbeat_thread: Optional[threading.Thread] = None
@@ -80,15 +124,15 @@ class ServerBase:
         #self.accept_thread = threading.Thread(target=self.accept_connections, daemon=True)
         #self.accept_thread.start()
 
-    def connect(self) -> bool:
+    def connect(self, index: int = 0) -> bool:
+        """Connect slot `index` of db_pool."""
         attempt = 1
         while not self.stop_event.is_set():
             try:
-                print(f"[Server] connect attempt {attempt} -> {self.db_host}:{self.db_port}")
-                self.reset_db_passer()
-                assert self.db_passer is not None
-                self.db_passer.settimeout(self.connect_timeout)
-                self.db_passer.connect(self.db_host, self.db_port)
+                print(f"[Server] db link {index} connect attempt {attempt} -> {self.db_host}:{self.db_port}")
+                db_passer = self.reset_db_passer(index)
+                db_passer.settimeout(self.connect_timeout)
+                db_passer.connect(self.db_host, self.db_port)
                 print("[Server] connected")
                 return True
             except Exception as e:
@@ -98,19 +142,21 @@ class ServerBase:
                 
         return False
 
-    def handshake(self) -> bool:
+    def handshake(self, index: int = 0) -> bool:
         attempt = 1
         while attempt <= self.max_handshake_try_count and not self.stop_event.is_set():
             try:
-                print(f"[Server] handshake attempt {attempt}")
+                print(f"[Server] db link {index} handshake attempt {attempt}")
                 # 呼叫 send_args 或其他 handshake 流程
-                assert self.db_passer is not None
-                self.db_passer.settimeout(self.handshake_timeout)
+                db_passer = self.db_pool.members[index].passer
+                assert db_passer is not None
+                db_passer.settimeout(self.handshake_timeout)
                 message_id = str(uuid.uuid4())
-                self.db_passer.send_args(Formats.MESSAGE, message_id, Words.MessageType.HANDSHAKE, 
-                                            {Words.DataKeys.Handshake.ROLE: self.role})
+                handshake_data = {Words.DataKeys.Handshake.ROLE: self.role}
+                handshake_data.update(db_passer.handshake_offer())
+                db_passer.send_args(Formats.MESSAGE, message_id, Words.MessageType.HANDSHAKE, handshake_data)
                 
-                _, message_type, data = self.db_passer.receive_args(Formats.MESSAGE)
+                _, message_type, data = db_passer.receive_args(Formats.MESSAGE)
                 if message_type != Words.MessageType.RESPONSE:
                     error_message = f"received message_type {message_type}, expected {Words.MessageType.RESPONSE}"
                     # print(f"[Server] {error_message}")
@@ -127,6 +173,7 @@ class ServerBase:
                         error_message += f" params: {data[Words.DataKeys.PARAMS]}"
                     # print(f"[Server] {error_message}")
                     raise Exception(error_message)
+                db_passer.apply_negotiated(data.get(Words.DataKeys.PARAMS))
                 return True
             except Exception as e:
                 attempt += 1
@@ -138,11 +185,12 @@ class ServerBase:
                     time.sleep(1)
         return False
     
-    def interact_to_db_loop(self):
+    def interact_to_db_loop(self, index: int = 0):
+        """Keep slot `index` of db_pool connected; one thread per slot."""
         while not self.stop_event.is_set():
-            if not self.connect():
+            if not self.connect(index):
                 continue
-            if not self.handshake():
+            if not self.handshake(index):
                 continue
 
             # def on_db_recv(msg_tuple):
@@ -152,38 +200,42 @@ class ServerBase:
             #         print(f"[Server] received unknown msg_type from DB: {msg_type}")
 
             def on_db_lost():
-                print("[Server] DB connection lost")
+                print(f"[Server] DB connection {index} lost")
                 # self.connection_to_db_loss_event.set()
 
             def make_db_hb():
                 return (Words.MessageType.HEARTBEAT, {})
             
-            assert self.db_passer is not None
-            self.db_worker = PeerWorker(
-                passer=self.db_passer,
+            db_passer = self.db_pool.members[index].passer
+            assert db_passer is not None
+            db_worker = PeerWorker(
+                passer=db_passer,
                 receive_timeout=self.receive_timeout,
                 heartbeat_interval=self.db_heartbeat_interval,
                 heartbeat_patience=self.db_heartbeat_patience,
                 on_connection_lost=on_db_lost,
                 make_heartbeat=make_db_hb,
+                max_in_flight=self.db_max_in_flight,
             )
-            self.db_worker.start()
+            db_worker.start()
+            self.db_pool.attach(index, db_worker)
 
             # block until loss or stop
-            while not self.stop_event.is_set() and not self.db_worker.conn_loss_event.is_set():
+            while not self.stop_event.is_set() and not db_worker.conn_loss_event.is_set():
                 time.sleep(0.2)
 
             # cleanup
+            self.db_pool.detach(index)
             try:
-                self.db_worker.stop()
+                db_worker.stop()
             except Exception:
                 pass
             # with self.pending_db_messages_lock:
             #     self.pending_db_messages.clear()
-            self.reset_db_passer()
+            self.reset_db_passer(index)
 
-            if not self.stop_event.is_set() and self.db_worker.conn_loss_event.is_set():
-                print("[Server] Reconnecting to database server...")
+            if not self.stop_event.is_set() and db_worker.conn_loss_event.is_set():
+                print(f"[Server] Reconnecting db link {index} to database server...")
                 # with self.pending_db_messages_lock:
                 #     self.pending_db_messages.clear()
             
@@ -192,14 +244,26 @@ class ServerBase:
         print("[Server] stopped")
 
     def run(self):
-        self.interact_to_db_thread = threading.Thread(target=self.interact_to_db_loop)
-        self.interact_to_db_thread.start()
+        self.interact_to_db_threads = [threading.Thread(target=self.interact_to_db_loop, args=(i,)) 
+                                       for i in range(len(self.db_pool.members))]
+        for thread in self.interact_to_db_threads:
+            thread.start()
 
         self.server_sock.bind((self.host, self.port))
-        self.server_sock.listen(5)
+        self.server_sock.listen(DEFAULT_LISTEN_BACKLOG)
         self.server_sock.settimeout(self.accept_timeout)
         print(f"Server listening on {self.host}:{self.port}")
-        self.accept_connections()
+        self.reject_pool = HandlerPool(DEFAULT_REJECT_POOL_SIZE, name=f"{self.role}-reject", 
+                                       max_queue=DEFAULT_MAX_PENDING_REJECTS)
+        self.reject_pool.start()
+        try:
+            if self.selector_core:
+                self.core = SelectorCore(self, self.handler_pool_size)
+                self.core.serve()
+            else:
+                self.accept_connections()
+        finally:
+            self.reject_pool.stop(wait=False)
 
     def _run_threads(self):
         self.stop_event.clear()
@@ -231,9 +295,10 @@ class ServerBase:
         # with self.game_server_lock:
         #     for game_server in self.game_servers.values():
         #         game_server.stop()
-        if not self.db_worker or self.db_worker.conn_loss_event.is_set():
-            if self.db_passer:
-                self.db_passer.close()
+        for member in self.db_pool.members:
+            # links with a running worker are closed by it; unblock the ones still connecting
+            if not member.connected and member.passer:
+                member.passer.close()
 
         try:
             self.server_sock.shutdown(socket.SHUT_RDWR)
@@ -262,44 +327,62 @@ class ServerBase:
         return message_id
 
     def accept_connections(self) -> None:
-        while not self.stop_event.is_set():
-            try:
-                connection_sock, addr = self.server_sock.accept()
-                print(f"Accepted connection from {addr}")
-                msgfmt_passer = MessageFormatPasser(connection_sock)
-                #self.clients.append(msgfmt_passer)
-                #self.user_infos[msgfmt_passer] = UserInfo()
-                self.connections.append(msgfmt_passer)
-                print(f"Active connections: {len(self.connections)}")
-                # Since connection may be client, db, or game server, start a thread to handle initial handshake
-                threading.Thread(target=self.handle_connections, args=(msgfmt_passer,)).start()
-                
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"[Server] Exception in accept_connections: {e}")
+        # handshakes and sessions run on two fixed pools; a session keeps its thread until
+        # it ends, so admit() caps connections at session_pool_size in this core
+        self.handshake_pool = HandlerPool(self.handshake_pool_size, name=f"{self.role}-handshake", 
+                                          max_queue=self.max_pending_handshakes)
+        self.handshake_pool.start()
+        self.session_pool = HandlerPool(self.session_pool_size, name=f"{self.role}-session")
+        self.session_pool.start()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    connection_sock, addr = self.server_sock.accept()
+                    print(f"Accepted connection from {addr}")
+                    msgfmt_passer = MessageFormatPasser(connection_sock, buffered=True)
+                    if not self.admit(msgfmt_passer):
+                        continue
+                    print(f"Active connections: {len(self.connections)}")
+                    # Since connection may be client, db, or game server, the handshake pool checks the handshake first
+                    self.handshake_pool.submit(self.handle_connections, msgfmt_passer)
+                    
+                except socket.timeout:
+                    continue
+                except Exception as e:
+                    print(f"[Server] Exception in accept_connections: {e}")
+        finally:
+            self.handshake_pool.stop(wait=False)
+            self.session_pool.stop(wait=False)
     
     def handle_connections(self, msgfmt_passer: MessageFormatPasser) -> None:
-        """Check handshake and pass to corresponding methods."""
+        """Handshake pool task: check handshake, then queue the session on the session pool."""
         try:
-            #while True:
             msgfmt_passer.settimeout(self.handshake_timeout)
             received_message_id, message_type, data = msgfmt_passer.receive_args(Formats.MESSAGE)
-            if message_type != Words.MessageType.HANDSHAKE:
-                print(f"[Server] received message_type {message_type}, expected {Words.MessageType.HANDSHAKE}")
-                self.connections.remove(msgfmt_passer)
-                print(f"Connection closed. Active connections: {len(self.connections)}")
-                msgfmt_passer.close()
-                return
-            
-            role = data.get(Words.DataKeys.Handshake.ROLE)
-            # self.send_response(msgfmt_passer, received_message_id, Words.Result.SUCCESS)
-            try:
-                self.on_new_connection(received_message_id, role, msgfmt_passer, data)
-            except Exception as e:
-                print(f"[Server] exception in on_new_connection: {e}")
         except Exception as e:
             print(f"[Server] Error during handshake: {e}")
+            self.close_connection(msgfmt_passer)
+            return
+        finally:
+            self.handshake_settled()
+        if message_type != Words.MessageType.HANDSHAKE:
+            print(f"[Server] received message_type {message_type}, expected {Words.MessageType.HANDSHAKE}")
+            self.close_connection(msgfmt_passer)
+            return
+        role = data.get(Words.DataKeys.Handshake.ROLE)
+        try:
+            self.session_pool.submit(self.run_session, received_message_id, role, msgfmt_passer, data)
+        except RuntimeError:  # stopping
+            self.close_connection(msgfmt_passer)
+
+    def run_session(self, received_message_id: str, role: str, msgfmt_passer: MessageFormatPasser, handshake_data: dict) -> None:
+        try:
+            self.on_new_connection(received_message_id, role, msgfmt_passer, handshake_data)
+        except Exception as e:
+            print(f"[Server] exception in on_new_connection: {e}")
+        self.close_connection(msgfmt_passer)
+
+    def close_connection(self, msgfmt_passer: MessageFormatPasser) -> None:
         try:
             self.connections.remove(msgfmt_passer)
         except Exception:
@@ -312,6 +395,126 @@ class ServerBase:
         except Exception:
             pass
 
+    def admit(self, passer: MessageFormatPasser) -> bool:
+        """Accept-side admission control, used by both connection cores.
+
+        An admitted passer is added to connections and counts as a pending
+        handshake until handshake_settled(). Over connection_limit or
+        max_pending_handshakes the client is answered with FAILURE instead
+        (reject_connection) and False is returned."""
+        with self.admission_lock:
+            if len(self.connections) >= self.connection_limit:
+                reason = "Server is full, try again later."
+            elif self.pending_handshakes >= self.max_pending_handshakes:
+                reason = "Server is busy, too many pending handshakes."
+            else:
+                self.pending_handshakes += 1
+                self.connections.append(passer)
+                return True
+            self.rejected_connections += 1
+        print(f"[Server] connection rejected: {reason} {self.load_metrics()}")
+        self.reject_connection(passer, reason)
+        return False
+
+    @property
+    def connection_limit(self) -> int:
+        """max_connections; the thread core also needs a session pool thread per connection."""
+        if self.selector_core:
+            return self.max_connections
+        return min(self.max_connections, self.session_pool_size)
+
+    def handshake_settled(self) -> None:
+        """An admitted connection sent its handshake (or gave up)."""
+        with self.admission_lock:
+            self.pending_handshakes -= 1
+
+    def reject_connection(self, passer: MessageFormatPasser, reason: str) -> None:
+        """Answer the client's HANDSHAKE with FAILURE and close. Runs on the small
+        reject pool so a silent client cannot stall the accept loop; if that is
+        backed up too the socket is just closed."""
+        try:
+            if self.reject_pool is None:
+                raise queue.Full
+            self.reject_pool.submit(self._send_rejection, passer, reason, block=False)
+        except (queue.Full, RuntimeError):
+            passer.close()
+
+    def _send_rejection(self, passer: MessageFormatPasser, reason: str) -> None:
+        try:
+            passer.settimeout(DEFAULT_REJECT_TIMEOUT)
+            received_message_id, message_type, _ = passer.receive_args(Formats.MESSAGE)
+            if message_type == Words.MessageType.HANDSHAKE:
+                self.send_response(passer, received_message_id, Words.Result.FAILURE, {
+                    Words.ParamKeys.Failure.REASON: reason
+                })
+        except Exception:
+            pass
+        finally:
+            passer.close()
+
+    def load_metrics(self) -> dict:
+        """Admission counters and queue depths of the worker pools."""
+        metrics = {
+            "connections": len(self.connections),
+            "pending_handshakes": self.pending_handshakes,
+            "rejected_connections": self.rejected_connections,
+            "db_links_connected": self.db_pool.connected_count,
+        }
+        if self.handshake_pool is not None:
+            metrics["handshake_queue_depth"] = self.handshake_pool.queue_depth
+        if self.session_pool is not None:
+            metrics["session_busy"] = self.session_pool.busy
+        if self.core is not None:
+            metrics["handler_queue_depth"] = self.core.pool.queue_depth
+            metrics["handler_busy"] = self.core.pool.busy
+        return metrics
+
+    def accept_handshake(self, passer: MessageFormatPasser, received_message_id: str, handshake_data: dict) -> None:
+        """Answer a HANDSHAKE with SUCCESS, including the negotiated wire options, then switch to them."""
+        params = passer.negotiate(handshake_data)
+        self.send_response(passer, received_message_id, Words.Result.SUCCESS, params or None)
+        passer.apply_negotiated(params)
+
+    def serve_session(self, passer: MessageFormatPasser, role: str) -> None:
+        """Thread-per-connection loop for an accepted session: feeds every message
+        to on_session_message until it returns False, the connection drops or the
+        client stops sending heartbeats. SelectorCore drives the same hooks."""
+        log_name = type(self).__name__
+        self.on_session_start(passer, role)
+        passer.settimeout(self.receive_timeout)
+        last_hb_time = time.time()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    msg_id, msg_type, data = passer.receive_args(Formats.MESSAGE)
+                    if msg_type == Words.MessageType.HEARTBEAT:
+                        last_hb_time = time.time()
+                    if not self.on_session_message(passer, msg_id, msg_type, data):
+                        break
+                except TimeoutError:
+                    if time.time() - last_hb_time > self.client_heartbeat_timeout:
+                        print(f"[{log_name}] client heartbeat timeout (>{self.client_heartbeat_timeout}s), terminating connection")
+                        break
+                    continue
+                except ConnectionError as e:
+                    print(f"[{log_name}] ConnectionError raised in session: {e}")
+                    break
+                except Exception as e:
+                    print(f"[{log_name}] exception raised in session: {e}")
+                    break
+        finally:
+            self.on_session_end(passer)
+
+    def on_session_start(self, passer: MessageFormatPasser, role: str) -> None:
+        """A connection of one of SESSION_ROLES finished its handshake."""
+
+    def on_session_message(self, passer: MessageFormatPasser, msg_id: str, msg_type: str, data: dict) -> bool:
+        """Handle one message of a session; return False to close the connection."""
+        return False
+
+    def on_session_end(self, passer: MessageFormatPasser) -> None:
+        """The session is over; passer is closed right after."""
+
     def on_new_connection(self, received_message_id: str, role: str, passer: MessageFormatPasser, handshake_data: dict):
         """接到 handshake 後的委派點(預設只是記錄未知 role)"""
         print(f"[ServerBase] on_new_connection called with role={role} (no handler implemented)")
@@ -413,12 +616,15 @@ class ServerBase:
     def try_request_and_wait(self, cmd: str, params: dict) -> dict:
         result_data = {}
         try:
-            if self.db_worker is None:
-                raise ConnectionError
-            result_data = self.db_worker.pend_and_wait(Words.MessageType.REQUEST, 
+            result_data = self.db_pool.pend_and_wait(Words.MessageType.REQUEST, 
                             {Words.DataKeys.Request.COMMAND: cmd, 
                                 Words.DataKeys.PARAMS: params}, self.db_response_timeout)
             result_data.pop(Words.DataKeys.Response.RESPONDING_ID, None)
+        except WindowFullError:
+            result_data[Words.DataKeys.Response.RESULT] = Words.Result.FAILURE
+            result_data[Words.DataKeys.PARAMS] = {
+                Words.ParamKeys.Failure.REASON: "Database server is busy, too many requests in flight."
+            }
         except TimeoutError:
             result_data[Words.DataKeys.Response.RESULT] = Words.Result.FAILURE
             result_data[Words.DataKeys.PARAMS] = {
@@ -436,11 +642,13 @@ class ServerBase:
             }
         return result_data
     
-    def reset_db_passer(self):
+    def reset_db_passer(self, index: int = 0) -> MessageFormatPasser:
+        member = self.db_pool.members[index]
         try:
-            if self.db_passer:
-                self.db_passer.close()
+            if member.passer:
+                member.passer.close()
         except Exception:
             pass
-        self.db_passer = MessageFormatPasser()
+        member.passer = MessageFormatPasser(buffered=True, trusted=self.trust_db_link)
+        return member.passer
 